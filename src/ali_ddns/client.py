@@ -0,0 +1,262 @@
+"""
+阿里云 DNS API 和公网 IP 查询的客户端.
+
+整个进程只创建一个 `DnsClient` 和一个 `requests.Session`, 连接在各次检查之间复用.
+每个请求都有超时, 失败时区分可重试 (网络错误, 限流, 5xx) 和不可重试 (参数, 鉴权等 4xx) 的错误,
+可重试的错误按指数退避重试, 一次检查的总耗时不超过 `Deadline`.
+"""
+
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, TypeVar
+
+import requests
+from alibabacloud_alidns20150109 import models as dns_models
+from alibabacloud_alidns20150109.client import Client as DnsClient
+from alibabacloud_tea_openapi import models as open_api_models
+from alibabacloud_tea_util import models as util_models
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+IP_URL = "https://api64.ipify.org/?format=json"
+# 这些错误码表示服务端暂时不可用, 与 HTTP 状态码无关地重试.
+RETRYABLE_CODES = frozenset(
+    {"Throttling", "Throttling.User", "ServiceUnavailable", "InternalError"}
+)
+
+
+class CycleTimeout(TimeoutError):
+    """
+    一次检查超出了 `Deadline`.
+    """
+
+
+class Deadline:
+    """
+    Params:
+        seconds: 从现在开始的时限, None 表示不限.
+    """
+
+    def __init__(
+        self,
+        seconds: Optional[float],
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.clock = clock
+        self.at = None if seconds is None else clock() + seconds
+
+    def remaining(self) -> Optional[float]:
+        if self.at is None:
+            return None
+        return self.at - self.clock()
+
+    def cap(self, timeout: float) -> float:
+        """
+        Returns:
+            不超过剩余时间的超时.
+
+        Raises:
+            CycleTimeout: 已经没有剩余时间.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if remaining <= 0:
+            raise CycleTimeout("Cycle deadline exceeded")
+        return min(timeout, remaining)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Params:
+        attempts: 最多尝试的次数 (包括第一次).
+        base_delay: 第一次重试前等待的秒数, 之后每次翻倍, 最多 max_delay 秒.
+        jitter: 等待时间随机浮动的比例.
+    """
+
+    attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    jitter: float = 0.2
+
+    def delay(self, retry: int, rng: random.Random = random) -> float:
+        delay = min(self.base_delay * 2**retry, self.max_delay)
+        return delay * (1 + rng.uniform(-self.jitter, self.jitter))
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None) or getattr(exc, "statusCode", None)
+    if status is None and isinstance(exc, requests.HTTPError):
+        status = exc.response.status_code if exc.response is not None else None
+    return status
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Returns:
+        exc 是否是暂时性的错误, 即网络错误, 超时, 限流或者服务端错误.
+    """
+    if isinstance(exc, CycleTimeout):
+        return False
+    inner = getattr(exc, "inner_exception", None)  # SDK 包装的网络错误.
+    if inner is not None and inner is not exc:
+        return is_retryable(inner)
+    if isinstance(
+        exc, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)
+    ):
+        return True
+    # SDK 把连接失败和超时转换为 RetryError.
+    if type(exc).__name__ == "RetryError":
+        return True
+    if getattr(exc, "code", None) in RETRYABLE_CODES:
+        return True
+    status = _status_code(exc)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def call_with_retry(
+    func: Callable[[float], T],
+    timeout: float,
+    deadline: Deadline,
+    policy: RetryPolicy = RetryPolicy(),
+    sleep: Callable[[float], None] = time.sleep,
+    name="request",
+) -> T:
+    """
+    调用 func(超时秒数), 可重试的错误按 policy 退避重试.
+
+    Params:
+        timeout: 单次请求的超时, 不会超过 deadline 的剩余时间.
+
+    Raises:
+        CycleTimeout: 重试的等待会超出 deadline.
+        Exception: 不可重试的错误, 或者重试次数用尽后的最后一个错误.
+    """
+    for attempt in range(policy.attempts):
+        try:
+            return func(deadline.cap(timeout))
+        except Exception as e:
+            if not is_retryable(e) or attempt == policy.attempts - 1:
+                raise
+            delay = policy.delay(attempt)
+            remaining = deadline.remaining()
+            if remaining is not None and delay >= remaining:
+                raise CycleTimeout(f"No time left to retry {name}: {e}") from e
+            logger.warning(
+                f"{name} failed (attempt {attempt + 1}/{policy.attempts}), "
+                f"retrying in {delay:.2f}s: {e}"
+            )
+            sleep(delay)
+    raise AssertionError("unreachable")
+
+
+@dataclass(frozen=True)
+class Record:
+    record_id: str
+    value: str
+
+
+class DdnsClient:
+    """
+    Params:
+        endpoint: DNS API 的地址, 默认由 SDK 根据 region_id 决定.
+        protocol: "HTTPS" 或 "HTTP".
+        timeout: 单次请求的超时 (秒).
+        connect_timeout: 建立连接的超时 (秒).
+    """
+
+    def __init__(
+        self,
+        access_key_id: str,
+        access_key_secret: str,
+        region_id: str,
+        endpoint: Optional[str] = None,
+        protocol: str = "HTTPS",
+        ip_url: str = IP_URL,
+        timeout=5.0,
+        connect_timeout=3.0,
+        policy: RetryPolicy = RetryPolicy(),
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        config = open_api_models.Config(
+            access_key_id=access_key_id,
+            access_key_secret=access_key_secret,
+            region_id=region_id,
+            protocol=protocol,
+        )
+        if endpoint:
+            config.endpoint = endpoint
+        self.dns = DnsClient(config)
+        self.session = requests.Session()
+        self.ip_url = ip_url
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.policy = policy
+        self.sleep = sleep
+
+    def _call(self, name: str, func: Callable[[float], T], deadline: Deadline) -> T:
+        return call_with_retry(
+            func, self.timeout, deadline, self.policy, self.sleep, name
+        )
+
+    def _runtime(self, timeout: float) -> util_models.RuntimeOptions:
+        # 重试由 call_with_retry 负责, 关闭 SDK 自身的重试.
+        return util_models.RuntimeOptions(
+            autoretry=False,
+            connect_timeout=int(min(self.connect_timeout, timeout) * 1000),
+            read_timeout=int(timeout * 1000),
+        )
+
+    def public_ip(self, deadline: Deadline) -> str:
+        def get(timeout: float) -> str:
+            response = self.session.get(
+                self.ip_url, timeout=(min(self.connect_timeout, timeout), timeout)
+            )
+            response.raise_for_status()
+            return response.json()["ip"]
+
+        return self._call("public_ip", get, deadline)
+
+    def describe_record(
+        self, domain_name: str, rr: str, record_type: str, deadline: Deadline
+    ) -> Optional[Record]:
+        """
+        Returns:
+            主机记录为 rr 的第一条解析记录, 没有时返回 None.
+        """
+        req = dns_models.DescribeDomainRecordsRequest(
+            domain_name=domain_name, rrkey_word=rr, type=record_type
+        )
+        resp = self._call(
+            "describe_domain_records",
+            lambda timeout: self.dns.describe_domain_records_with_options(
+                req, self._runtime(timeout)
+            ),
+            deadline,
+        )
+        records = resp.body.domain_records.record if resp.body.domain_records else []
+        if not records:
+            return None
+        return Record(records[0].record_id, records[0].value)
+
+    def update_record(
+        self, record_id: str, rr: str, record_type: str, value: str, deadline: Deadline
+    ):
+        req = dns_models.UpdateDomainRecordRequest(
+            record_id=record_id, rr=rr, type=record_type, value=value
+        )
+        self._call(
+            "update_domain_record",
+            lambda timeout: self.dns.update_domain_record_with_options(
+                req, self._runtime(timeout)
+            ),
+            deadline,
+        )
+
+    def close(self):
+        self.session.close()
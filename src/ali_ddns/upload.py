@@ -1,182 +1,114 @@
+import logging
 import os
 from pathlib import Path
-import sys
 import time
 import traceback
 
-import requests
 import toml
-from Tea.core import TeaCore
-from alibabacloud_alidns20150109.client import Client as DnsClient
-from alibabacloud_tea_openapi import models as open_api_models
-from alibabacloud_alidns20150109 import models as dns_models
-from alibabacloud_tea_util.client import Client as UtilClient
 
+from ali_ddns.client import DdnsClient, Deadline
+from gadgets.log import setup_logging
+from gadgets.scheduler import Scheduler
+from gadgets.single_instance import SingleInstance
 
-def get_public_ip():
-    response = requests.get("https://api64.ipify.org/?format=json")
-    return response.json()["ip"]
+CONFIG_FILE = Path(__file__).parent / "ali-ddns-config.toml"
+ERROR_FILE = Path(__file__).parent / "error.txt"
+LOG_FILE = Path(__file__).with_suffix(".log")
+CHECK_INTERVAL = 10  # 检查公网 IP 的间隔 (秒).
+CHECK_MAX_BACKOFF = 300
+CYCLE_TIMEOUT = 30  # 一次检查 (获取 IP, 查询和修改解析记录) 的总时限 (秒).
 
+logger = logging.getLogger(__name__)
 
-class Sample:
-    def __init__(self):
-        pass
 
-    @staticmethod
-    def initialization(
-        region_id: str,
-    ) -> DnsClient:
-        """
-        Initialization  初始化公共请求参数
-        """
-        config = open_api_models.Config()
-        # 您的AccessKey ID
-        config.access_key_id = key_config["ACCESS_KEY_ID"]
-        # 您的AccessKey Secret
-        config.access_key_secret = key_config["ACCESS_KEY_SECRET"]
-        # 您的可用区ID
-        config.region_id = region_id
-        return DnsClient(config)
+def create_client(key_config: dict) -> DdnsClient:
+    return DdnsClient(
+        key_config["ACCESS_KEY_ID"],
+        key_config["ACCESS_KEY_SECRET"],
+        key_config["REGION_ID"],
+        endpoint=key_config.get("ENDPOINT"),
+        protocol=key_config.get("PROTOCOL", "HTTPS"),
+        timeout=key_config.get("TIMEOUT", 5),
+    )
 
-    @staticmethod
-    def describe_domain_records(
-        client: DnsClient,
-        domain_name: str,
-        rr: str,
-        record_type: str,
-    ) -> dns_models.DescribeDomainRecordsResponse:
-        """
-        获取主域名的所有解析记录列表
-        """
-        req = dns_models.DescribeDomainRecordsRequest()
-        # 主域名
-        req.domain_name = domain_name
-        # 主机记录
-        req.rrkey_word = rr
-        # 解析记录类型
-        req.type = record_type
-        try:
-            resp = client.describe_domain_records(req)
-            print("-------------------获取主域名的所有解析记录列表--------------------")
-            print(UtilClient.to_jsonstring(TeaCore.to_map(resp)))
-            return resp
-        except Exception as error:
-            print(error, file=sys.stderr)
-        return
 
-    @staticmethod
-    async def describe_domain_records_async(
-        client: DnsClient,
-        domain_name: str,
-        rr: str,
-        record_type: str,
-    ) -> dns_models.DescribeDomainRecordsResponse:
-        """
-        获取主域名的所有解析记录列表
-        """
-        req = dns_models.DescribeDomainRecordsRequest()
-        # 主域名
-        req.domain_name = domain_name
-        # 主机记录
-        req.rrkey_word = rr
-        # 解析记录类型
-        req.type = record_type
-        try:
-            resp = await client.describe_domain_records_async(req)
-            print("-------------------获取主域名的所有解析记录列表--------------------")
-            print(UtilClient.to_jsonstring(TeaCore.to_map(resp)))
-            return resp
-        except Exception as error:
-            print(error)
-        return
+def sync_record(
+    client: DdnsClient, key_config: dict, ip: str, deadline: Deadline
+) -> bool:
+    """
+    把解析记录的值修改为 ip.
 
-    @staticmethod
-    def update_domain_record(
-        client: DnsClient,
-        req: dns_models.UpdateDomainRecordRequest,
-    ) -> None:
-        """
-        修改解析记录
-        """
-        try:
-            resp = client.update_domain_record(req)
-            print("-------------------修改解析记录--------------------")
-            print(UtilClient.to_jsonstring(TeaCore.to_map(resp)))
-        except Exception as error:
-            print(error)
+    Returns:
+        解析记录是否存在.
+    """
+    domain_name = key_config["DOMAIN_NAME"]
+    rr = key_config["RR"]
+    record_type = key_config["RECORD_TYPE"]
+    record = client.describe_record(domain_name, rr, record_type, deadline)
+    if record is None:
+        logger.error(f"No {record_type} record for {rr}.{domain_name}")
+        return False
+    logger.info(f"Current public IP: {ip}, record value: {record.value}")
+    if record.value != ip:
+        client.update_record(record.record_id, rr, record_type, ip, deadline)
+        logger.info(f"Updated {rr}.{domain_name}: {record.value} -> {ip}")
+    return True
 
-    @staticmethod
-    async def update_domain_record_async(
-        client: DnsClient,
-        req: dns_models.UpdateDomainRecordRequest,
-    ) -> None:
-        """
-        修改解析记录
-        """
-        try:
-            resp = await client.update_domain_record_async(req)
-            print("-------------------修改解析记录--------------------")
-            print(UtilClient.to_jsonstring(TeaCore.to_map(resp)))
-        except Exception as error:
-            print(error)
 
-    @staticmethod
-    def main() -> None:
-        regionid = key_config["REGION_ID"]
-        current_host_ip = get_public_ip()
-        domain_name = key_config["DOMAIN_NAME"]
-        rr = key_config["RR"]
-        record_type = key_config["RECORD_TYPE"]
-        client = Sample.initialization(regionid)
-        resp = Sample.describe_domain_records(client, domain_name, rr, record_type)
-        if UtilClient.is_unset(resp) or UtilClient.is_unset(
-            resp.body.domain_records.record[0]
-        ):
-            print("错误参数！")
-            return
-        record = resp.body.domain_records.record[0]
-        # 记录ID
-        record_id = record.record_id
-        # 记录值
-        records_value = record.value
-        print(
-            f"-------------------当前主机公网IP为：{current_host_ip}--------------------"
-        )
-        if not UtilClient.equal_string(current_host_ip, records_value):
-            # 修改解析记录
-            req = dns_models.UpdateDomainRecordRequest()
-            # 主机记录
-            req.rr = rr
-            # 记录ID
-            req.record_id = record_id
-            # 将主机记录值改为当前主机IP
-            req.value = current_host_ip
-            # 解析记录类型
-            req.type = record_type
-            Sample.update_domain_record(client, req)
+def write_error():
+    """
+    把当前处理的异常写入 `ERROR_FILE`, 只保留最近一次.
+    """
+    with open(ERROR_FILE, "w", encoding="utf-8") as w:
+        w.write(f"{time.asctime()}\n{traceback.format_exc()}")
 
 
 def main():
-    os.chdir(Path(__file__).parent)
-    global key_config
+    setup_logging("ali_ddns", LOG_FILE)
     try:
-        ip = get_public_ip()
-        key_config = toml.load("ali-ddns-config.toml")
+        key_config = toml.load(CONFIG_FILE)
+        client = create_client(key_config)
+        cycle_timeout = key_config.get("CYCLE_TIMEOUT", CYCLE_TIMEOUT)
         routine = key_config.get("ROUTINE")
         if isinstance(routine, int) and routine > 0:
-            last_time = 0
-            while True:
-                new_ip = get_public_ip()
-                if time.time() - last_time > routine or new_ip != ip:
-                    Sample.main()
-                    print(f"更新成功！{time.asctime()}")
-                    last_time = time.time()
-                    ip = new_ip
-                time.sleep(10)
+            scheduler = Scheduler()
+            ip = last_time = None
+
+            def check():
+                nonlocal ip, last_time
+                try:
+                    deadline = Deadline(cycle_timeout)
+                    new_ip = client.public_ip(deadline)
+                    now = scheduler.clock()
+                    if last_time is None or now - last_time > routine or new_ip != ip:
+                        if sync_record(client, key_config, new_ip, deadline):
+                            logger.info(f"更新成功！{time.asctime()}")
+                        last_time = now
+                        ip = new_ip
+                except Exception:
+                    # 调度器把异常记录到此模块的 logger (ali_ddns.log) 并延长检查间隔.
+                    write_error()
+                    raise
+
+            # 检查失败 (包括重试用尽和超出时限) 时逐步延长检查间隔, 最长 CHECK_MAX_BACKOFF 秒.
+            scheduler.every(
+                CHECK_INTERVAL,
+                check,
+                jitter=0.1,
+                max_backoff=CHECK_MAX_BACKOFF,
+                run_now=True,
+            )
+            with SingleInstance(
+                "aliddns",
+                on_shutdown=scheduler.stop,
+                status=lambda: {"ip": ip, "tasks": scheduler.stats()},
+            ):
+                scheduler.run()
         else:
-            Sample.main()
+            deadline = Deadline(cycle_timeout)
+            sync_record(client, key_config, client.public_ip(deadline), deadline)
     except FileNotFoundError:
-        with open("ali-ddns-config.toml", "w") as w:
+        with open(CONFIG_FILE, "w") as w:
             toml.dump(
                 {
                     "ACCESS_KEY_ID": "your-access-key-id",
@@ -192,5 +124,5 @@ def main():
         os.system("cmd /c echo 请修改ali-ddns-config.toml文件中的配置信息！ && pause")
         exit(1)
     except Exception:
-        with open("error.txt", "w") as w:
-            w.write(traceback.format_exc())
+        logger.exception("Failed")
+        write_error()
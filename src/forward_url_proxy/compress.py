@@ -0,0 +1,86 @@
+"""
+响应体的压缩协商.
+
+- 透传: 把客户端的 Accept-Encoding 转发给上游, 上游返回的压缩内容原样返回给客户端, 不解压也不重新压缩.
+- 压缩: 上游返回未压缩的文本时, 按客户端接受的编码压缩, 压缩等级可以在 CPU 和带宽之间权衡.
+
+brotli (`br`) 只在安装了 `brotli` 包时可用.
+"""
+
+import gzip
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_SIZE = 1024  # 小于此字节数的响应不压缩.
+
+CODECS: dict[str, Callable[[bytes, int], bytes]] = {
+    "gzip": lambda data, level: gzip.compress(data, compresslevel=level, mtime=0),
+    "deflate": lambda data, level: zlib.compress(data, level),
+}
+DEFAULT_LEVELS = {"gzip": 6, "deflate": 6}
+if brotli is not None:
+    CODECS["br"] = lambda data, level: brotli.compress(data, quality=level)
+    DEFAULT_LEVELS["br"] = 5
+
+
+@dataclass
+class EncodingOptions:
+    """
+    Params:
+        passthrough: 是否透传上游的压缩内容, 否则解压后返回 (与客户端的 Accept-Encoding 无关).
+        compress: 压缩未压缩文本使用的编码, `CODECS` 中的名字, None 表示不压缩.
+        level: 压缩等级, None 表示使用 `DEFAULT_LEVELS`.
+    """
+
+    passthrough: bool = True
+    compress: Optional[str] = None
+    level: Optional[int] = None
+    min_size: int = MIN_SIZE
+
+
+def parse_accept_encoding(header: Optional[str]) -> dict[str, float]:
+    """
+    Returns:
+        编码 (小写) -> q 值.
+    """
+    rst = {}
+    for part in (header or "").split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        rst[name] = q
+    return rst
+
+
+def accepts(header: Optional[str], encoding: str) -> bool:
+    accepted = parse_accept_encoding(header)
+    q = accepted.get(encoding.lower(), accepted.get("*", 0.0))
+    return q > 0
+
+
+def is_compressible(content_type: str) -> bool:
+    mime = content_type.split(";", 1)[0].strip().lower()
+    return mime.startswith("text/") or mime.endswith(
+        ("json", "xml", "javascript", "svg")
+    )
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if level is None:
+        level = DEFAULT_LEVELS[encoding]
+    return CODECS[encoding](data, level)
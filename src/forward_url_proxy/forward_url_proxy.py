@@ -1,13 +1,99 @@
-import os
 import argparse
+import base64
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+import threading
+import time
+from typing import Optional
 import requests
 from flask import Flask, request, Response
+from werkzeug.serving import make_server
 import urllib.parse
 import logging
 
-os.chdir(Path(__file__).parent)
+from forward_url_proxy.compress import (
+    CODECS,
+    EncodingOptions,
+    accepts,
+    compress,
+    is_compressible,
+)
+from forward_url_proxy.pool import (
+    NoProxyAvailable,
+    ProxyPool,
+    load_pools,
+    start_health_checks,
+)
+from gadgets.log import setup_logging
+from gadgets.single_instance import SingleInstance
+
+CONFIG_TOML = Path(__file__).parent / "forward_url_proxy_config.toml"
+POOL_PREFIX = "pool:"
+TIMEOUT = 30  # 不使用代理池时请求的超时 (秒).
+BATCH_WORKERS = 16  # 所有 /batch 请求共用的线程数.
+BATCH_MAX_URLS = 256
+
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
+pools: dict[str, ProxyPool] = {}
+encoding_options = EncodingOptions()
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+class UnknownPool(LookupError):
+    pass
+
+
+def fetch(url: str, proxy: Optional[str] = None, **kwargs) -> requests.Response:
+    """
+    Params:
+        proxy: 代理地址, 或者 `pool:<name>` 表示使用代理池.
+        kwargs: 传给 `requests.get` 的其他参数.
+
+    Raises:
+        UnknownPool: 没有名为 name 的代理池.
+        requests.exceptions.RequestException: 请求失败, 代理池中没有可用代理时为 `NoProxyAvailable`.
+    """
+    if proxy and proxy.startswith(POOL_PREFIX):
+        pool = pools.get(proxy[len(POOL_PREFIX) :])
+        if pool is None:
+            raise UnknownPool(f"Unknown proxy pool: {proxy}")
+        return pool.get(url, **kwargs)
+    proxies = {"http": proxy, "https": proxy} if proxy else {}
+    return requests.get(url, proxies=proxies, timeout=TIMEOUT, **kwargs)
+
+
+def encode_body(
+    response: requests.Response, accept_encoding: Optional[str]
+) -> tuple[bytes, dict[str, str]]:
+    """
+    按 `encoding_options` 和客户端的 Accept-Encoding 决定返回给客户端的响应体.
+
+    Returns:
+        响应体和响应头.
+    """
+    options = encoding_options
+    headers = {"Content-Type": response.headers.get("Content-Type", "text/html")}
+    if options.passthrough or options.compress is not None:
+        headers["Vary"] = "Accept-Encoding"  # 返回的内容取决于客户端接受的编码.
+    upstream = response.headers.get("Content-Encoding", "").strip().lower()
+    if options.passthrough and upstream not in ("", "identity"):
+        if accepts(accept_encoding, upstream):
+            headers["Content-Encoding"] = upstream
+            return response.raw.read(decode_content=False), headers
+    body = response.content
+    codec = options.compress
+    if (
+        codec is not None
+        and len(body) >= options.min_size
+        and is_compressible(headers["Content-Type"])
+        and accepts(accept_encoding, codec)
+    ):
+        headers["Content-Encoding"] = codec
+        body = compress(body, codec, options.level)
+    return body, headers
 
 
 @app.route("/", methods=["GET"])
@@ -17,35 +103,131 @@ def forward_request():
     if not url:
         return "Missing 'url' parameter", 400
     url = urllib.parse.unquote(url)
-    proxies = {}
-    if proxy:
-        proxies = {"http": proxy, "https": proxy}
+    accept_encoding = request.headers.get("Accept-Encoding")
     try:
-        response = requests.get(url, proxies=proxies)
-        return Response(
-            response.content,
-            status=response.status_code,
-            headers={"Content-Type": response.headers.get("Content-Type", "text/html")},
-        )
+        if encoding_options.passthrough:
+            # 上游只会使用客户端接受的编码, 因此压缩内容可以原样返回.
+            response = fetch(
+                url,
+                proxy,
+                stream=True,
+                headers={"Accept-Encoding": accept_encoding or "identity"},
+            )
+        else:
+            response = fetch(url, proxy)
+        with response:
+            body, headers = encode_body(response, accept_encoding)
+        return Response(body, status=response.status_code, headers=headers)
+    except UnknownPool as e:
+        return str(e), 400
+    except NoProxyAvailable as e:
+        return str(e), 502
     except requests.exceptions.RequestException as e:
         return str(e), 500
 
 
-def main():
-    file = Path(__file__)
-    os.chdir(file.parent)
-    log_file = file.with_suffix(".log")
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s | %(name)s | %(levelname)s | %(message)s",
-    )
-    root_logger = logging.getLogger()
-    file_handler = logging.FileHandler(filename=log_file, mode="w", encoding="utf-8")
-    file_handler.setFormatter(
-        logging.Formatter("%(asctime)s | %(name)s | %(levelname)s | %(message)s")
-    )
-    root_logger.addHandler(file_handler)
+def _batch_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(BATCH_WORKERS, thread_name_prefix="batch")
+        return _executor
+
+
+def _is_text(content_type: str) -> bool:
+    mime = content_type.split(";", 1)[0].strip().lower()
+    return mime.startswith("text/") or mime.endswith(("json", "xml", "javascript"))
+
+
+def _fetch_item(index: int, url: str, proxy: Optional[str]) -> dict:
+    item = {"index": index, "url": url}
+    start = time.perf_counter()
+    try:
+        response = fetch(url, proxy)
+        content_type = response.headers.get("Content-Type", "")
+        item["status"] = response.status_code
+        item["content_type"] = content_type
+        if _is_text(content_type):
+            item["body"] = response.text
+        else:
+            item["body_base64"] = base64.b64encode(response.content).decode("ascii")
+    except UnknownPool as e:
+        item.update(status=400, error=str(e))
+    except NoProxyAvailable as e:
+        item.update(status=502, error=str(e))
+    except requests.exceptions.RequestException as e:
+        item.update(status=500, error=str(e))
+    except Exception as e:
+        # 一个 url 的意外错误不能中断整个响应流.
+        logger.exception(f"Failed to fetch {url!r} in batch")
+        item.update(status=500, error=f"{type(e).__name__}: {e}")
+    item["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return item
+
+
+def _parse_batch(data) -> list[tuple[str, Optional[str]]]:
+    """
+    Raises:
+        ValueError: 请求体格式不正确.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("urls"), list):
+        raise ValueError("Expected a JSON object with a 'urls' list")
+    default_proxy = data.get("proxy")
+    if default_proxy is not None and not isinstance(default_proxy, str):
+        raise ValueError(f"Invalid proxy: {default_proxy!r}")
+    rst = []
+    for entry in data["urls"]:
+        if isinstance(entry, str):
+            entry = {"url": entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get("url"), str):
+            raise ValueError(f"Invalid entry: {entry!r}")
+        proxy = entry.get("proxy", default_proxy)
+        if proxy is not None and not isinstance(proxy, str):
+            raise ValueError(f"Invalid proxy in entry: {entry!r}")
+        rst.append((entry["url"], proxy))
+    if len(rst) > BATCH_MAX_URLS:
+        raise ValueError(f"At most {BATCH_MAX_URLS} urls per batch")
+    return rst
 
+
+@app.route("/batch", methods=["POST"])
+def batch_request():
+    """
+    并发地请求多个 url, 按完成的顺序以 NDJSON 流式返回每个 url 的结果,
+    最后一行为 `{"done": true, ...}`.
+    """
+    try:
+        items = _parse_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return str(e), 400
+    executor = _batch_executor()
+    start = time.perf_counter()
+    futures = [
+        executor.submit(_fetch_item, i, url, proxy)
+        for i, (url, proxy) in enumerate(items)
+    ]
+
+    def generate():
+        try:
+            for future in as_completed(futures):
+                yield json.dumps(future.result(), ensure_ascii=False) + "\n"
+            elapsed = round((time.perf_counter() - start) * 1000, 3)
+            yield json.dumps(
+                {"done": True, "count": len(futures), "elapsed_ms": elapsed}
+            )
+            yield "\n"
+        finally:
+            # 客户端提前断开时取消还没开始的请求.
+            for future in futures:
+                future.cancel()
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+def main(argv=None):
+    setup_logging(
+        "forward_url_proxy", Path(__file__).with_suffix(".log"), capture=["werkzeug"]
+    )
     parser = argparse.ArgumentParser(description="Forward URL Proxy Server")
     parser.add_argument(
         "--port",
@@ -53,14 +235,55 @@ def main():
         default=40211,
         help="Port to run the server on (default: 40211)",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--config",
+        type=Path,
+        default=CONFIG_TOML,
+        help="Proxy pool config file (default: forward_url_proxy_config.toml)",
+    )
+    parser.add_argument(
+        "--no-passthrough",
+        action="store_true",
+        help="Decompress upstream responses instead of relaying them compressed",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=list(CODECS),
+        help="Compress uncompressed text responses with this encoding",
+    )
+    parser.add_argument(
+        "--compress-level",
+        type=int,
+        help="Compression level: lower is faster, higher is smaller",
+    )
+    args = parser.parse_args(argv)
     port = args.port
 
-    logging.info(f"Starting Forward URL Proxy on http://localhost:{port}")
-    logging.info(
+    encoding_options.passthrough = not args.no_passthrough
+    encoding_options.compress = args.compress
+    encoding_options.level = args.compress_level
+
+    pools.update(load_pools(args.config))
+    start_health_checks(pools)
+    if pools:
+        logger.info(f"Proxy pools: {', '.join(pools)}")
+
+    logger.info(f"Starting Forward URL Proxy on http://localhost:{port}")
+    logger.info(
         f"Example usage: http://localhost:{port}?url=https%3A%2F%2Fgoogle.com&proxy=http%3A%2F%2Flocalhost%3A7890"
     )
-    app.run(host="0.0.0.0", port=port)
+    server = make_server("0.0.0.0", port, app, threaded=True)
+    try:
+        # 已有实例时不启动.
+        with SingleInstance(
+            "forwardurlproxy",
+            takeover=False,
+            on_shutdown=server.shutdown,
+            status=lambda: {"port": port, "pools": list(pools)},
+        ):
+            server.serve_forever()
+    finally:
+        server.server_close()
 
 
 if __name__ == "__main__":
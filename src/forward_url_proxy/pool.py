@@ -0,0 +1,203 @@
+"""
+上游代理池.
+
+池中的代理定期通过 `check_url` 进行健康检查, 用指数加权移动平均 (EWMA) 记录每个代理的延迟.
+转发请求时按延迟从低到高依次尝试健康的代理, 连接代理失败时在时限内换下一个.
+
+```toml
+[pools.default]
+proxies = ["http://127.0.0.1:7890", "socks5://127.0.0.1:7891"]
+check_url = "http://www.gstatic.com/generate_204"
+check_interval = 30
+```
+"""
+
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+import requests
+import toml
+
+from gadgets.scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+CHECK_URL = "http://www.gstatic.com/generate_204"
+# 连接失败 (包括连接超时) 时换下一个代理. 读取超时说明请求已经发出, 不再重试.
+FAILOVER_ERRORS = (requests.exceptions.ConnectionError,)
+
+
+@dataclass
+class ProxyState:
+    url: str
+    healthy: bool = True
+    latency: Optional[float] = None  # EWMA, 秒, 还没有检查过时为 None.
+    failures: int = 0  # 连续失败次数.
+    checked: Optional[float] = None
+
+    def score(self) -> tuple:
+        return (not self.healthy, math.inf if self.latency is None else self.latency)
+
+
+class NoProxyAvailable(requests.exceptions.RequestException):
+    pass
+
+
+class ProxyPool:
+    """
+    Params:
+        alpha: EWMA 中最新一次延迟的权重.
+        connect_timeout: 连接代理的超时 (秒), 超时后换下一个代理.
+        timeout: 读取响应的超时 (秒).
+        deadline: 一次转发 (包括换代理) 的总时限 (秒).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        proxies: list[str],
+        check_url: str = CHECK_URL,
+        check_interval=30.0,
+        connect_timeout=2.0,
+        timeout=30.0,
+        deadline=10.0,
+        alpha=0.3,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.states = [ProxyState(url) for url in proxies]
+        self.check_url = check_url
+        self.check_interval = check_interval
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.deadline = deadline
+        self.alpha = alpha
+        self.clock = clock
+        self._lock = threading.Lock()
+
+    def ranked(self) -> list[ProxyState]:
+        """
+        Returns:
+            按 (是否不健康, 延迟) 排序的代理, 不健康的代理排在最后, 作为最后的手段.
+        """
+        with self._lock:
+            return sorted(self.states, key=ProxyState.score)
+
+    def observe(self, state: ProxyState, latency: float):
+        with self._lock:
+            if state.latency is None:
+                state.latency = latency
+            else:
+                state.latency = self.alpha * latency + (1 - self.alpha) * state.latency
+            state.healthy = True
+            state.failures = 0
+
+    def mark_failed(self, state: ProxyState):
+        with self._lock:
+            if state.healthy:
+                logger.warning(f"Proxy {state.url} in pool {self.name} is down")
+            state.healthy = False
+            state.failures += 1
+
+    def check_one(self, state: ProxyState, session: requests.Session):
+        proxies = {"http": state.url, "https": state.url}
+        start = self.clock()
+        try:
+            response = session.head(
+                self.check_url,
+                proxies=proxies,
+                timeout=(self.connect_timeout, self.connect_timeout),
+            )
+            # 代理无法访问上游时一般返回 502 / 503.
+            if response.status_code >= 500:
+                response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.debug(f"Health check of {state.url} failed: {e}")
+            self.mark_failed(state)
+        else:
+            if not state.healthy:
+                logger.info(f"Proxy {state.url} in pool {self.name} is back")
+            self.observe(state, self.clock() - start)
+        state.checked = self.clock()
+
+    def check(self):
+        """
+        并发地检查所有代理.
+        """
+        with requests.Session() as session:
+            with ThreadPoolExecutor(len(self.states) or 1) as executor:
+                for state in self.states:
+                    executor.submit(self.check_one, state, session)
+
+    def get(self, url: str, session=requests, **kwargs) -> requests.Response:
+        """
+        依次通过各个代理请求 url, 连接代理失败时换下一个.
+
+        Raises:
+            NoProxyAvailable: 所有代理都连接失败, 或者超出时限.
+            requests.exceptions.RequestException: 其他请求错误.
+        """
+        end = self.clock() + self.deadline
+        errors = []
+        for state in self.ranked():
+            remaining = end - self.clock()
+            if remaining <= 0:
+                break
+            proxies = {"http": state.url, "https": state.url}
+            try:
+                return session.get(
+                    url,
+                    proxies=proxies,
+                    timeout=(min(self.connect_timeout, remaining), self.timeout),
+                    **kwargs,
+                )
+            except FAILOVER_ERRORS as e:
+                self.mark_failed(state)
+                errors.append(f"{state.url}: {e}")
+        raise NoProxyAvailable(
+            f"No proxy in pool {self.name} is reachable: {'; '.join(errors) or 'timeout'}"
+        )
+
+    def stats(self) -> list[dict]:
+        with self._lock:
+            return [vars(state).copy() for state in self.states]
+
+
+def load_pools(conf: Path | str) -> dict[str, ProxyPool]:
+    """
+    从 toml 配置文件的 `pools` 表中读取代理池, 文件不存在时返回空字典.
+    """
+    try:
+        with open(conf, "r", encoding="utf-8") as r:
+            data = toml.load(r)
+    except FileNotFoundError:
+        return {}
+    return {
+        name: ProxyPool(name, **options)
+        for name, options in data.get("pools", {}).items()
+    }
+
+
+def start_health_checks(pools: dict[str, ProxyPool]) -> Optional[Scheduler]:
+    """
+    在后台线程中定期检查所有代理池.
+    """
+    if not pools:
+        return None
+    scheduler = Scheduler()
+    for pool in pools.values():
+        scheduler.every(
+            pool.check_interval,
+            pool.check,
+            name=f"check:{pool.name}",
+            jitter=0.1,
+            run_now=True,
+        )
+    threading.Thread(target=scheduler.run, name="proxy-health", daemon=True).start()
+    return scheduler
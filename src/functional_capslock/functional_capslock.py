@@ -1,11 +1,9 @@
 import enum
-import math
-import os
-import socket
-import traceback
-import time
+import functools
+import logging
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
+import psutil
 import pynput
 import pywinauto
 import uiautomation
@@ -14,10 +12,32 @@ import win32gui
 import win32process
 from screeninfo import get_monitors
 from win32api import GetKeyboardLayout
-import shutil
+
+from functional_capslock.latency import LatencyRecorder
+from functional_capslock.launcher import App, Launcher
+from functional_capslock.scoring import (
+    SCORERS,
+    Candidate,
+    Layout,
+    MruTracker,
+    Rect,
+    Snapshot,
+)
+from gadgets.log import rate_limited, setup_logging
+from gadgets.single_instance import SingleInstance
 
 TEXT_EDITOR_EXE_PATH = "subl.exe"
 VSCODE_EXE_PATH = "code"
+# 已有实例在运行时聚焦该实例而不是启动新的进程.
+TEXT_EDITOR_FOCUS_EXISTING = False
+VSCODE_FOCUS_EXISTING = False
+# Capslock + F12 时把热路径耗时记录写入此文件.
+LATENCY_DUMP_FILE = Path(__file__).with_suffix(".latency.json")
+LOG_FILE = Path(__file__).with_suffix(".log")
+
+logger = logging.getLogger(__name__)
+# 键盘钩子中使用的 logger, 按调用位置限流, 避免按住按键时刷屏.
+hook_logger = rate_limited(f"{__name__}.hook")
 
 
 class Direction(enum.Enum):
@@ -35,10 +55,21 @@ START_X = 0
 START_Y = 0
 END_X = 0
 END_Y = 0
+MONITORS = []
 
 MIN_VALID_WINDOW_WIDTH = 30
 MIN_VALID_WINDOW_HEIGHT = 30
 
+# 方向打分方式, 见 scoring.SCORERS, "legacy" 为旧的固定权重打分.
+SCORER = "projection"
+# 连续按键时复用窗口快照的最长时间 (秒), 松开 Capslock 时快照也会失效.
+SNAPSHOT_TTL = 1.0
+
+latency = LatencyRecorder()
+mru = MruTracker()
+snapshot: Optional[Snapshot] = None
+snapshot_focus = None  # 快照中当前拥有焦点的窗口句柄.
+
 
 def update_screen_size():
     global \
@@ -48,12 +79,15 @@ def update_screen_size():
         END_X, \
         END_Y, \
         START_X, \
-        START_Y
-    for monitor in get_monitors():
+        START_Y, \
+        MONITORS
+    monitors = get_monitors()
+    for monitor in monitors:
         START_X = min(monitor.x, START_X)
         START_Y = min(monitor.y, START_Y)
         END_X = max(monitor.x + monitor.width, END_X)
         END_Y = max(monitor.y + monitor.height, END_Y)
+    MONITORS = monitors
     TOTAL_WIDTH = END_X - START_X
     TOTAL_HEIGHT = END_Y - START_Y
     SCREEN_DIAGONAL_SQUARE = TOTAL_WIDTH**2 + TOTAL_HEIGHT**2
@@ -98,90 +132,142 @@ def select_focused(valid_windows):
             return window
 
 
-def calc_angles(valid_windows, target_window):
+def take_snapshot() -> Optional[Snapshot]:
     """
-    :param valid_windows: 可以包括 valid_windows.
+    枚举窗口, 构造候选窗口快照.
     """
-    window_rel_angles = []
-    raw_point = get_window_center(target_window)
+    global snapshot_focus
+    update_screen_size()
+    try:
+        with latency.span("enumerate"):
+            desktop = pywinauto.Desktop(backend="win32")
+            windows = desktop.windows()
+    except Exception:
+        logger.exception("Failed to enumerate windows")
+        return None
+    with latency.span("validate"):
+        valid_windows = [window for window in windows if is_valid(desktop, window)]
+        focused_window = select_focused(valid_windows)
+    candidates = []
     for window in valid_windows:
-        if window != target_window:
-            center = get_window_center(window)
-            angle = math.atan2(center[1] - raw_point[1], center[0] - raw_point[0])
-            angle = angle * 180 / math.pi  # 转换为角度
-            window_rel_angles.append((window, angle))
-    return window_rel_angles
+        r = window.rectangle()
+        candidates.append(
+            Candidate(window.handle, Rect(r.left, r.top, r.right, r.bottom), window)
+        )
+    layout = Layout(
+        tuple(Rect(m.x, m.y, m.x + m.width, m.y + m.height) for m in MONITORS)
+    )
+    snapshot_focus = None if focused_window is None else focused_window.handle
+    return Snapshot(candidates, layout, SCORERS[SCORER](), mru)
+
+
+def invalidate_snapshot():
+    global snapshot
+    snapshot = None
 
 
 def switch_to(direction: Direction):
-    update_screen_size()
-    try:
-        desktop = pywinauto.Desktop(backend="win32")
-        windows = desktop.windows()
-    except Exception as _:
-        traceback.print_exc()
-        return
-    valid_windows = [window for window in windows if is_valid(desktop, window)]
-    focused_window = select_focused(valid_windows)
-    if focused_window is None:
-        if valid_windows:
-            focus_on_window(
-                valid_windows[0]
-            )  # 可能原焦点在桌面, 那么随机选一个窗口聚焦.
+    global snapshot, snapshot_focus
+    # 连续按键时, 如果焦点仍然在上次切换到的窗口, 直接复用快照.
+    if (
+        snapshot is None
+        or snapshot.age() > SNAPSHOT_TTL
+        or snapshot_focus is None
+        or win32gui.GetForegroundWindow() != snapshot_focus
+    ):
+        snapshot = take_snapshot()
+        if snapshot is None:
+            return
+    if snapshot_focus is None:
+        if snapshot.candidates:
+            with latency.span("focus"):
+                focus_on_window(
+                    next(iter(snapshot.candidates.values())).obj
+                )  # 可能原焦点在桌面, 那么随机选一个窗口聚焦.
+        invalidate_snapshot()
         return
-    window_rel_angles = calc_angles(valid_windows, focused_window)
-    focused_window_center = get_window_center(focused_window)
-    print(direction, window_rel_angles)
-    # 选出和指定方向最近的 window.
-    selected_window = None
-    min_weight = None
-    for window, angle in window_rel_angles:
-        if direction == Direction.LEFT:
-            # 向左的时候, 有 180 和 -180 度两种可能, 用 abs 消除两者差距.
-            angle_diff_ratio = abs(direction.value - abs(angle)) / 180
-        else:
-            angle_diff_ratio = abs(direction.value - angle) / 180
-        center = get_window_center(window)
-        distance_square_ratio = (
-            (focused_window_center[0] - center[0]) ** 2
-            + (focused_window_center[1] - center[1]) ** 2
-        ) / SCREEN_DIAGONAL_SQUARE  # 归一化.
-        weight = distance_square_ratio * 0.6 + angle_diff_ratio * 0.4
-        if min_weight is None or weight < min_weight:
-            selected_window = window
-            min_weight = weight
-    if selected_window is None:
+    mru.touch(snapshot_focus)
+    with latency.span("score"):
+        # 选出和指定方向最近的 window.
+        selected = snapshot.best(snapshot_focus, direction.name)
+    if selected is None:
         return
-    focus_on_window(selected_window)
-    print("Switched to", selected_window.window_text())
+    with latency.span("focus"):
+        focus_on_window(selected.obj)
+    snapshot_focus = selected.key
+    if hook_logger.isEnabledFor(logging.DEBUG):
+        hook_logger.debug(f"Switched to {selected.obj.window_text()}")
 
 
 def focus_on_window(window):
     ctl = uiautomation.ControlFromHandle(window.handle)
     ctl.SetFocus()  # 这种获取焦点的方式不会改变窗口大小.
+    mru.touch(window.handle)
     pynput.mouse.Controller().position = get_window_center(window)
 
 
+def vscode_fixup(path: Path) -> Path:
+    if path.parent.name == "bin":
+        # look for code.exe instead of code.cmd
+        return path.parent.parent / "Code.exe"
+    return path
+
+
+TEXT_EDITOR_APP = App(
+    (TEXT_EDITOR_EXE_PATH,),
+    allow_unresolved=True,
+    focus_existing=TEXT_EDITOR_FOCUS_EXISTING,
+)
+VSCODE_APP = App(
+    (VSCODE_EXE_PATH,), fixup=vscode_fixup, focus_existing=VSCODE_FOCUS_EXISTING
+)
+PWSH_APP = App(("pwsh", "powershell"), cwd="~", allow_unresolved=True)
+
+
+def focus_running_instance(path: str) -> bool:
+    """
+    聚焦可执行文件名和 path 相同的进程的可见窗口. 在启动器的工作线程中调用,
+    因此需要在该线程中初始化 UI Automation.
+
+    Returns:
+        是否找到并聚焦了窗口.
+    """
+    exe_name = Path(path).name.lower()
+    found = []
+
+    def callback(hwnd, _):
+        if found:
+            return
+        if not win32gui.IsWindowVisible(hwnd) or not win32gui.GetWindowText(hwnd):
+            return
+        _, pid = win32process.GetWindowThreadProcessId(hwnd)
+        try:
+            if psutil.Process(pid).name().lower() == exe_name:
+                found.append(hwnd)
+        except psutil.Error:
+            pass
+
+    win32gui.EnumWindows(callback, None)
+    if not found:
+        return False
+    with uiautomation.UIAutomationInitializerInThread():
+        uiautomation.ControlFromHandle(found[0]).SetFocus()
+    return True
+
+
+launcher = Launcher(focuser=focus_running_instance)
+
+
 def open_text_editor():
-    os.startfile(TEXT_EDITOR_EXE_PATH)
+    launcher.launch(TEXT_EDITOR_APP)
+
 
 def open_vscode():
-    path = shutil.which(VSCODE_EXE_PATH)
-    if not path:
-        return
-    path = Path(path)
-    if path.parent.name == "bin":
-        # look for code.exe instead of code.cmd
-        path = path.parent.parent / "Code.exe"
-    os.startfile(path)
+    launcher.launch(VSCODE_APP)
 
 
 def open_pwsh():
-    pwsh = shutil.which("pwsh") or "powershell"
-    curdir = os.curdir
-    os.chdir(os.path.expanduser("~"))
-    os.startfile(pwsh)
-    os.chdir(curdir)
+    launcher.launch(PWSH_APP)
 
 
 def get_vk(key):
@@ -234,110 +320,111 @@ operations = (
 )
 
 
+def dump_latency():
+    path = latency.dump(LATENCY_DUMP_FILE)
+    logger.info(f"Latency dumped to {path}")
+
+
+def scroll(dy: int):
+    # 注意在按下 shift 的时候鼠标滚轮无效, 于是暂时取消 shift 按下.
+    pynput.keyboard.Controller().release(pynput.keyboard.Key.shift_l)
+    pynput.mouse.Controller().scroll(0, dy)
+    pynput.keyboard.Controller().press(pynput.keyboard.Key.shift_l)
+
+
 def win32_event_filter(msg, data):
+    # filter 只统计按键的判断和状态更新, 切换窗口等操作由各自的 span 统计.
+    with latency.span("filter"):
+        action, suppress = handle_key_event(msg, data)
+    if action is not None:
+        action()
+    if suppress:
+        listener.suppress_event()
+
+
+def handle_key_event(msg, data) -> tuple[Optional[Callable[[], None]], bool]:
+    """
+    Returns:
+        要执行的操作 (没有时为 None), 以及是否拦截此按键.
+    """
     global caps_lock_pressing, pending_vk_code, lshift_pressing, operations
     is_pressing = not bool(data.flags & (1 << 7))
     if pending_vk_code == data.vkCode:
         if is_pressing:  # 取消长按产生的重复事件.
-            if caps_lock_pressing:
-                listener.suppress_event()
-            return
+            return None, caps_lock_pressing
         else:  # 消除按键松开事件.
             pending_vk_code = None
-            listener.suppress_event()
+            return None, True
 
     if data.vkCode == get_vk(pynput.keyboard.Key.caps_lock):
+        action = None
         if caps_lock_pressing != is_pressing:  # capslock 键按下状态发生变化.
-            print(f"Caps lock: {is_pressing}")
+            hook_logger.debug(f"Caps lock: {is_pressing}")
             caps_lock_pressing = is_pressing
+            invalidate_snapshot()
             if is_pressing:
                 operations = False
             elif (
                 not operations
             ):  # capslock 松开, 但是没有按下其他键, 相当于直接按下了 capslock.
-                print("Switch IME ")
-                switch_im()
-        listener.suppress_event()
-    elif data.vkCode == get_vk(pynput.keyboard.Key.shift_l):
+                hook_logger.debug("Switch IME")
+                action = switch_im
+        return action, True
+    if data.vkCode == get_vk(pynput.keyboard.Key.shift_l):
         if lshift_pressing != is_pressing:
-            print(f"LShift: {is_pressing}")
+            hook_logger.debug(f"LShift: {is_pressing}")
         lshift_pressing = is_pressing
         operations = True
-    elif data.vkCode == get_vk(pynput.keyboard.Key.left) or data.vkCode == 0x48:  # h
-        if caps_lock_pressing and is_pressing:
-            pending_vk_code = data.vkCode
-            operations = True
-            switch_to(Direction.LEFT)
-            listener.suppress_event()
-    elif data.vkCode == get_vk(pynput.keyboard.Key.right) or data.vkCode == 0x4C:  # l
-        if caps_lock_pressing and is_pressing:
-            pending_vk_code = data.vkCode
-            operations = True
-            switch_to(Direction.RIGHT)
-            listener.suppress_event()
-    elif data.vkCode == get_vk(pynput.keyboard.Key.up) or data.vkCode == 0x4B:  # k
-        if caps_lock_pressing and lshift_pressing and is_pressing:
-            # 鼠标滚轮功能.
-            operations = True
-            pynput.keyboard.Controller().release(
-                pynput.keyboard.Key.shift_l
-            )  # 注意在按下 shift 的时候鼠标滚轮无效, 于是暂时取消 shift 按下.
-            pynput.mouse.Controller().scroll(0, 1)
-            pynput.keyboard.Controller().press(
-                pynput.keyboard.Key.shift_l
-            )  # 注意在按下 shift 的时候鼠标滚轮无效.
-            listener.suppress_event()
-        elif caps_lock_pressing and is_pressing:
-            pending_vk_code = data.vkCode
-            operations = True
-            switch_to(Direction.UP)
-            listener.suppress_event()
-    elif data.vkCode == get_vk(pynput.keyboard.Key.down) or data.vkCode == 0x4A:  # j
-        if caps_lock_pressing and lshift_pressing and is_pressing:
-            # 鼠标滚轮功能.
-            operations = True
-            pynput.keyboard.Controller().release(
-                pynput.keyboard.Key.shift_l
-            )  # 注意在按下 shift 的时候鼠标滚轮无效, 于是暂时取消 shift 按下.
-            pynput.mouse.Controller().scroll(0, -1)
-            pynput.keyboard.Controller().press(pynput.keyboard.Key.shift_l)
-            listener.suppress_event()
-        elif caps_lock_pressing and is_pressing:
-            pending_vk_code = data.vkCode
-            operations = True
-            switch_to(Direction.DOWN)
-            listener.suppress_event()
-    elif data.vkCode == 0x45:  # e
-        if caps_lock_pressing and is_pressing:
-            pending_vk_code = data.vkCode
-            operations = True
-            open_text_editor()
-            listener.suppress_event()
-    elif data.vkCode == 0x56:  # v
-        if caps_lock_pressing and is_pressing:
-            pending_vk_code = data.vkCode
-            operations = True
-            open_vscode()
-            listener.suppress_event()
-    elif data.vkCode == 0x50:  # p
-        if caps_lock_pressing and is_pressing:
-            pending_vk_code = data.vkCode
-            operations = True
-            open_pwsh()
-            listener.suppress_event()
+        return None, False
+    if not (caps_lock_pressing and is_pressing):
+        return None, False
+
+    if data.vkCode in (get_vk(pynput.keyboard.Key.up), 0x4B) and lshift_pressing:  # k
+        operations = True
+        return functools.partial(scroll, 1), True  # 鼠标滚轮功能.
+    if data.vkCode in (get_vk(pynput.keyboard.Key.down), 0x4A) and lshift_pressing:  # j
+        operations = True
+        return functools.partial(scroll, -1), True
+    action = KEY_ACTIONS.get(data.vkCode)
+    if action is None:
+        return None, False
+    pending_vk_code = data.vkCode
+    operations = True
+    return action, True
+
+
+KEY_ACTIONS: dict[int, Callable[[], None]] = {
+    get_vk(pynput.keyboard.Key.left): functools.partial(switch_to, Direction.LEFT),
+    0x48: functools.partial(switch_to, Direction.LEFT),  # h
+    get_vk(pynput.keyboard.Key.right): functools.partial(switch_to, Direction.RIGHT),
+    0x4C: functools.partial(switch_to, Direction.RIGHT),  # l
+    get_vk(pynput.keyboard.Key.up): functools.partial(switch_to, Direction.UP),
+    0x4B: functools.partial(switch_to, Direction.UP),  # k
+    get_vk(pynput.keyboard.Key.down): functools.partial(switch_to, Direction.DOWN),
+    0x4A: functools.partial(switch_to, Direction.DOWN),  # j
+    0x45: open_text_editor,  # e
+    0x56: open_vscode,  # v
+    0x50: open_pwsh,  # p
+    # 写文件不能阻塞键盘钩子, 放到启动器的工作线程中执行.
+    0x7B: lambda: launcher.submit(dump_latency),  # F12
+}
 
 
 def main():
-    os.chdir(Path(__file__).parent)
     global listener
+    setup_logging("functional_capslock", LOG_FILE)
+    launcher.warm(TEXT_EDITOR_APP, VSCODE_APP, PWSH_APP)
     try:
-        with socket.create_server(("127.0.0.1", 23982)):  # 单一实例.
+        # 单一实例, 已有实例时不启动.
+        with SingleInstance(
+            "fncaps",
+            takeover=False,
+            on_shutdown=lambda: listener.stop(),
+            status=lambda: {"latency": latency.summary()},
+        ):
             with pynput.keyboard.Listener(
                 win32_event_filter=win32_event_filter
             ) as listener:
                 listener.join()
     except Exception:
-        with open(Path(__file__).with_suffix(".log"), "a") as w:
-            w.write("\n")
-            w.write(time.asctime())
-            w.write(traceback.format_exc())
+        logger.exception("Crashed")
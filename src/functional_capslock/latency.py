@@ -0,0 +1,106 @@
+"""
+热路径耗时记录.
+
+每个阶段 (span) 的耗时写入固定容量的环形缓冲区, 记录本身不做任何 I/O,
+需要时再通过 `summary` / `dump` 汇总输出.
+"""
+
+import collections
+import json
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+
+def percentile(values, q: float):
+    """
+    最近秩法计算分位数, q 取值 0~100.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))  # 向上取整.
+    return ordered[int(min(rank, len(ordered))) - 1]
+
+
+class _Span:
+    __slots__ = ("recorder", "name", "start")
+
+    def __init__(self, recorder: "LatencyRecorder", name: str):
+        self.recorder = recorder
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = self.recorder.clock()
+        return self
+
+    def __exit__(self, *_):
+        # pynput 通过抛出异常来拦截按键, 所以异常退出时也要记录.
+        self.recorder.record(self.name, self.recorder.clock() - self.start)
+        return False
+
+
+class LatencyRecorder:
+    """
+    Params:
+        capacity: 环形缓冲区容量, 超出后丢弃最旧的记录.
+        clock: 单调时钟, 单位为秒.
+    """
+
+    def __init__(
+        self, capacity: int = 4096, clock: Optional[Callable[[], float]] = None
+    ):
+        self.clock = time.perf_counter if clock is None else clock
+        self.buffer: collections.deque[tuple[str, float, float]] = collections.deque(
+            maxlen=capacity
+        )
+
+    def span(self, name: str) -> _Span:
+        """
+        用法: `with recorder.span("score"): ...`
+        """
+        return _Span(self, name)
+
+    def record(self, name: str, duration: float):
+        # deque.append 是线程安全的, 不需要加锁.
+        self.buffer.append((name, self.clock(), duration))
+
+    def clear(self):
+        self.buffer.clear()
+
+    def durations(self) -> dict[str, list[float]]:
+        rst = collections.defaultdict(list)
+        for name, _, duration in list(self.buffer):
+            rst[name].append(duration)
+        return dict(rst)
+
+    def summary(self) -> dict[str, dict]:
+        """
+        Returns:
+            每个 span 的次数和 p50/p99/max 耗时 (毫秒).
+        """
+        rst = {}
+        for name, values in self.durations().items():
+            rst[name] = {
+                "count": len(values),
+                "p50_ms": percentile(values, 50) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "max_ms": max(values) * 1000,
+            }
+        return rst
+
+    def dump(self, path) -> Path:
+        path = Path(path)
+        with open(path, "w", encoding="utf-8") as w:
+            json.dump(
+                {
+                    "time": time.asctime(),
+                    "summary": self.summary(),
+                    "records": list(self.buffer),
+                },
+                w,
+                ensure_ascii=False,
+                indent=2,
+            )
+        return path
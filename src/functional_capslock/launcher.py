@@ -0,0 +1,201 @@
+"""
+应用启动器.
+
+- 可执行文件路径只解析一次并缓存, PATH 变化时缓存失效.
+- 使用显式的 cwd 启动进程, 不修改进程全局的工作目录.
+- 启动过程在后台线程中异步执行, 并记录耗时.
+- 可选: 如果已有实例在运行, 聚焦该实例而不是启动新进程.
+
+此模块不依赖 Windows 专有的库, 可以在 Linux 上使用桩可执行文件运行.
+"""
+
+import collections
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class App:
+    """
+    一个可以被启动的应用.
+
+    Params:
+        candidates: 候选的可执行文件名或路径, 按顺序解析, 取第一个能解析到的.
+        cwd: 启动时的工作目录, 支持 `~`, 为 None 时继承当前工作目录.
+        allow_unresolved: 所有候选都解析失败时, 是否直接使用最后一个候选交给系统解析
+            (比如 Windows 的 App Paths 注册表).
+        fixup: 对解析出的路径做的额外处理, 比如把 code.cmd 替换为 Code.exe.
+        focus_existing: 已有实例运行时是否聚焦该实例而不是启动新进程.
+    """
+
+    candidates: tuple[str, ...]
+    cwd: Optional[str] = None
+    allow_unresolved: bool = False
+    fixup: Optional[Callable[[Path], Path]] = None
+    focus_existing: bool = False
+
+
+@dataclass(frozen=True)
+class LaunchRecord:
+    app: App
+    path: Optional[str]
+    resolve_time: float  # 秒.
+    spawn_time: float  # 秒, 聚焦已有实例时为聚焦的耗时.
+    focused: bool  # 是否聚焦了已有实例.
+    error: Optional[str] = None
+
+
+class ExecutableCache:
+    """
+    缓存 `shutil.which` 的结果, 在 PATH (Windows 下还有 PATHEXT) 变化时整体失效.
+    """
+
+    def __init__(self, environ=None):
+        self.environ = os.environ if environ is None else environ
+        self._lock = threading.Lock()
+        self._cache: dict[str, Optional[str]] = {}
+        self._env_key = None
+
+    def _current_env_key(self):
+        return self.environ.get("PATH"), self.environ.get("PATHEXT")
+
+    def which(self, name: str) -> Optional[str]:
+        with self._lock:
+            env_key = self._current_env_key()
+            if env_key != self._env_key:
+                self._cache.clear()
+                self._env_key = env_key
+            if name not in self._cache:
+                self._cache[name] = shutil.which(name, path=env_key[0])
+            return self._cache[name]
+
+    def invalidate(self, name: Optional[str] = None):
+        with self._lock:
+            if name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(name, None)
+
+
+def default_spawner(path: str, cwd: Optional[str]):
+    """
+    启动进程, 不等待其退出.
+    """
+    if hasattr(os, "startfile"):
+        # 交给 ShellExecute, 以便控制台程序拥有自己的窗口.
+        os.startfile(path, cwd=cwd)
+    else:
+        subprocess.Popen(
+            [path],
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+
+class Launcher:
+    """
+    Params:
+        cache: 可执行文件路径缓存.
+        spawner: `spawner(path, cwd)`, 启动进程.
+        focuser: `focuser(path) -> bool`, 尝试聚焦已运行的实例, 成功时返回 True.
+        history: 保留的最近启动记录数.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[ExecutableCache] = None,
+        spawner: Callable[[str, Optional[str]], None] = default_spawner,
+        focuser: Optional[Callable[[str], bool]] = None,
+        history: int = 64,
+    ):
+        self.cache = ExecutableCache() if cache is None else cache
+        self.spawner = spawner
+        self.focuser = focuser
+        self.records: collections.deque[LaunchRecord] = collections.deque(
+            maxlen=history
+        )
+        # 单个工作线程, 保证启动顺序和按键顺序一致.
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="launcher"
+        )
+
+    def resolve(self, app: App) -> Optional[str]:
+        for name in app.candidates:
+            path = self.cache.which(name)
+            if path:
+                if app.fixup is not None:
+                    path = str(app.fixup(Path(path)))
+                return path
+        if app.allow_unresolved and app.candidates:
+            return app.candidates[-1]
+        return None
+
+    def warm(self, *apps: App) -> Future:
+        """
+        在后台预先解析路径, 同时让工作线程提前就绪.
+        """
+        return self._executor.submit(lambda: [self.resolve(app) for app in apps])
+
+    def launch(self, app: App) -> Future:
+        """
+        异步启动应用, 不阻塞调用者 (比如键盘钩子回调).
+        """
+        return self._executor.submit(self._launch, app)
+
+    def _launch(self, app: App) -> LaunchRecord:
+        start = time.perf_counter()
+        path = self.resolve(app)
+        resolved = time.perf_counter()
+        if path is None:
+            record = LaunchRecord(app, None, resolved - start, 0, False, "not found")
+            self.records.append(record)
+            return record
+        focused = False
+        error = None
+        if app.focus_existing and self.focuser is not None:
+            try:
+                focused = bool(self.focuser(path))
+            except Exception:
+                # 聚焦失败不影响启动, 退回到启动新进程.
+                logger.exception(f"Failed to focus running instance of {path}")
+        try:
+            if not focused:
+                cwd = os.path.expanduser(app.cwd) if app.cwd else None
+                try:
+                    self.spawner(path, cwd)
+                except OSError:
+                    # 可执行文件可能已被移动或卸载, 重新解析一次再试.
+                    self.cache.invalidate()
+                    path = self.resolve(app)
+                    if path is None:
+                        raise
+                    self.spawner(path, cwd)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        record = LaunchRecord(
+            app, path, resolved - start, time.perf_counter() - resolved, focused, error
+        )
+        self.records.append(record)
+        return record
+
+    def submit(self, func: Callable, *args) -> Future:
+        """
+        在工作线程中执行其他不能阻塞调用者的任务, 比如写文件.
+        """
+        return self._executor.submit(func, *args)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,185 @@
+"""
+Capslock 热键路径的离线回放基准.
+
+把录制的按键序列和窗口布局送入 `win32_event_filter` / `switch_to`,
+所有系统调用 (pynput, pywinauto, uiautomation, win32*, screeninfo) 都由桩模块
+(见 `gadgets.stubs`) 代替,
+因此可以在 Linux 上运行, 用来发现此路径上的性能退化.
+
+轨迹文件 (json) 格式:
+
+```json
+{
+    "monitors": [{"x": 0, "y": 0, "width": 1920, "height": 1080}],
+    "windows": [
+        {"handle": 1, "title": "a", "rect": [0, 0, 960, 1080], "focused": true}
+    ],
+    "events": [{"vk": 20, "down": true}, {"vk": 76, "down": true}]
+}
+```
+
+`windows` 按 z 序排列, 排在前面的窗口在上层.
+
+用法:
+
+```shell
+python -m functional_capslock.replay trace.json --repeat 10
+python -m functional_capslock.replay --synthetic 500 --windows 12 --max-p99-ms 5
+python -m functional_capslock.replay --synthetic 500 --windows 30 --scorer legacy
+```
+"""
+
+import argparse
+import importlib
+import json
+import random
+import sys
+import time
+import types
+from typing import Optional
+
+from functional_capslock.latency import percentile
+from gadgets import stubs
+from gadgets.stubs import VK_CAPSLOCK, FakeDesktopState, FakeListener, Suppressed
+
+DIRECTION_VKS = (0x48, 0x4A, 0x4B, 0x4C)  # h, j, k, l
+WM_KEYDOWN = 0x0100
+WM_KEYUP = 0x0101
+
+
+def load_functional_capslock(state: FakeDesktopState):
+    """
+    安装桩模块并重新导入 functional_capslock, 返回导入的模块.
+    """
+    stubs.install(state)
+    sys.modules.pop("functional_capslock.functional_capslock", None)
+    fc = importlib.import_module("functional_capslock.functional_capslock")
+    fc.listener = FakeListener()
+    fc.launcher.spawner = lambda path, cwd: None
+    fc.launcher.focuser = None
+    return fc
+
+
+def synthetic_trace(windows=8, presses=200, monitors=2, seed=0, burst=5) -> dict:
+    """
+    生成随机的窗口布局和 Capslock + h/j/k/l 按键序列.
+
+    Params:
+        burst: 每次按住 Capslock 连续按方向键的次数, 之后松开 Capslock,
+            因此枚举窗口和快照复用的耗时都会被统计.
+    """
+    rng = random.Random(seed)
+    mons = [
+        {"x": 1920 * i, "y": 0, "width": 1920, "height": 1080} for i in range(monitors)
+    ]
+    wins = []
+    for handle in range(1, windows + 1):
+        mon = rng.choice(mons)
+        w = rng.randint(300, mon["width"] // 2)
+        h = rng.randint(200, mon["height"] // 2)
+        x = mon["x"] + rng.randint(0, mon["width"] - w)
+        y = mon["y"] + rng.randint(0, mon["height"] - h)
+        wins.append(
+            {"handle": handle, "title": f"w{handle}", "rect": [x, y, x + w, y + h]}
+        )
+    wins[0]["focused"] = True
+    events = []
+    for i in range(presses):
+        if i % burst == 0:
+            events.append({"vk": VK_CAPSLOCK, "down": True})
+        vk = rng.choice(DIRECTION_VKS)
+        events.append({"vk": vk, "down": True})
+        events.append({"vk": vk, "down": False})
+        if i % burst == burst - 1 or i == presses - 1:
+            events.append({"vk": VK_CAPSLOCK, "down": False})
+    return {"monitors": mons, "windows": wins, "events": events}
+
+
+def replay(trace: dict, repeat=1, scorer: Optional[str] = None) -> dict:
+    """
+    回放轨迹.
+
+    Returns:
+        每个 span 和整次按键事件 (event) 的 p50/p99 耗时 (毫秒).
+    """
+    state = FakeDesktopState()
+    fc = load_functional_capslock(state)
+    if scorer is not None:
+        fc.SCORER = scorer
+    event_times = []
+    suppressed = 0
+    for _ in range(repeat):
+        state.load(trace)
+        fc.invalidate_snapshot()
+        for event in trace["events"]:
+            data = types.SimpleNamespace(
+                vkCode=event["vk"], flags=0 if event["down"] else 1 << 7
+            )
+            msg = WM_KEYDOWN if event["down"] else WM_KEYUP
+            start = time.perf_counter()
+            try:
+                fc.win32_event_filter(msg, data)
+            except Suppressed:
+                suppressed += 1
+            event_times.append(time.perf_counter() - start)
+    report = fc.latency.summary()
+    report["event"] = {
+        "count": len(event_times),
+        "p50_ms": percentile(event_times, 50) * 1000,
+        "p99_ms": percentile(event_times, 99) * 1000,
+        "max_ms": max(event_times) * 1000,
+    }
+    report["suppressed"] = suppressed
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay Capslock key traces")
+    parser.add_argument("traces", nargs="*", help="轨迹 json 文件")
+    parser.add_argument("--synthetic", type=int, default=0, help="合成的按键次数")
+    parser.add_argument("--windows", type=int, default=8, help="合成的窗口数")
+    parser.add_argument(
+        "--burst", type=int, default=5, help="合成轨迹中每次按住 Capslock 的按键次数"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="每条轨迹的回放次数")
+    parser.add_argument("--scorer", help="方向打分方式, 见 scoring.SCORERS")
+    parser.add_argument("--json", help="把结果写入此文件")
+    parser.add_argument(
+        "--max-p99-ms", type=float, help="event 的 p99 超过此值时以非零状态退出"
+    )
+    args = parser.parse_args(argv)
+
+    traces = {}
+    for path in args.traces:
+        with open(path, encoding="utf-8") as r:
+            traces[path] = json.load(r)
+    if args.synthetic or not traces:
+        traces["synthetic"] = synthetic_trace(
+            args.windows, args.synthetic or 200, seed=args.seed, burst=args.burst
+        )
+
+    results = {
+        name: replay(trace, args.repeat, args.scorer) for name, trace in traces.items()
+    }
+    for name, report in results.items():
+        print(name)
+        for span, stat in report.items():
+            if isinstance(stat, dict):
+                print(
+                    f"  {span:<10} n={stat['count']:<6} "
+                    f"p50={stat['p50_ms']:.3f}ms p99={stat['p99_ms']:.3f}ms"
+                )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as w:
+            json.dump(results, w, indent=2)
+    if args.max_p99_ms is not None:
+        worst = max(report["event"]["p99_ms"] for report in results.values())
+        if worst > args.max_p99_ms:
+            print(f"p99 {worst:.3f}ms > {args.max_p99_ms}ms", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""
+按方向切换窗口时的候选窗口打分.
+
+- `LegacyScorer`: 旧的固定权重打分, 0.6 * 归一化中心距离平方 + 0.4 * 角度差.
+- `ProjectionScorer`: 沿方向投影打分, 优先选择和当前窗口在垂直方向上有重叠的窗口,
+  距离按当前窗口所在屏幕的尺寸归一化, 得分相近时优先最近使用过的窗口.
+
+`Snapshot` 保存一次窗口枚举的结果, 按需为每个起点窗口一次性计算四个方向的候选顺序,
+连续按键时直接查表, 不需要重新计算. 最近使用顺序只影响分数相近的窗口, 在查表时再排序.
+
+此模块不依赖 Windows 专有的库.
+"""
+
+import collections
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any, Hashable, Optional, Sequence
+
+# 方向名 -> (坐标轴, 符号), 坐标轴 0 为 x, 1 为 y, y 轴向下.
+DIRECTIONS = {
+    "LEFT": (0, -1),
+    "RIGHT": (0, 1),
+    "UP": (1, -1),
+    "DOWN": (1, 1),
+}
+
+
+@dataclass(frozen=True)
+class Rect:
+    left: float
+    top: float
+    right: float
+    bottom: float
+
+    @property
+    def width(self):
+        return self.right - self.left
+
+    @property
+    def height(self):
+        return self.bottom - self.top
+
+    @property
+    def center(self):
+        return (self.left + self.right) / 2, (self.top + self.bottom) / 2
+
+    def span(self, axis):
+        """
+        Returns:
+            在指定坐标轴上的区间.
+        """
+        if axis == 0:
+            return self.left, self.right
+        return self.top, self.bottom
+
+    def size(self, axis):
+        return self.width if axis == 0 else self.height
+
+    def contains(self, x, y):
+        return self.left <= x < self.right and self.top <= y < self.bottom
+
+
+@dataclass(frozen=True)
+class Candidate:
+    """
+    Params:
+        key: 窗口的唯一标识 (句柄).
+        rect: 窗口区域.
+        obj: 附带的窗口对象, 不参与比较.
+    """
+
+    key: Hashable
+    rect: Rect
+    obj: Any = field(default=None, compare=False)
+
+
+@dataclass(frozen=True)
+class Layout:
+    monitors: tuple[Rect, ...]
+
+    @property
+    def bounds(self) -> Rect:
+        return Rect(
+            min(m.left for m in self.monitors),
+            min(m.top for m in self.monitors),
+            max(m.right for m in self.monitors),
+            max(m.bottom for m in self.monitors),
+        )
+
+    def monitor_of(self, rect: Rect) -> Rect:
+        """
+        Returns:
+            窗口中心所在的屏幕, 中心不在任何屏幕上时返回最近的屏幕.
+        """
+        x, y = rect.center
+        for monitor in self.monitors:
+            if monitor.contains(x, y):
+                return monitor
+
+        def distance(m: Rect):
+            dx = max(m.left - x, 0, x - m.right)
+            dy = max(m.top - y, 0, y - m.bottom)
+            return dx * dx + dy * dy
+
+        return min(self.monitors, key=distance)
+
+
+class MruTracker:
+    """
+    记录窗口最近获得焦点的顺序.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self._order: collections.OrderedDict[Hashable, None] = collections.OrderedDict()
+
+    def touch(self, key: Hashable):
+        self._order[key] = None
+        self._order.move_to_end(key, last=False)
+        while len(self._order) > self.capacity:
+            self._order.popitem()
+
+    def ranks(self) -> dict[Hashable, int]:
+        """
+        Returns:
+            key -> 名次, 0 为最近使用.
+        """
+        return {key: i for i, key in enumerate(self._order)}
+
+
+class LegacyScorer:
+    """
+    0.6 * 中心距离平方 / 所有屏幕组成的外接矩形对角线平方 + 0.4 * 角度差 / 180.
+    """
+
+    ANGLES = {"LEFT": 180, "RIGHT": 0, "UP": -90, "DOWN": 90}
+
+    def score(
+        self, origin: Candidate, cand: Candidate, direction: str, layout: Layout
+    ) -> Optional[float]:
+        bounds = layout.bounds
+        diagonal_square = bounds.width**2 + bounds.height**2
+        ox, oy = origin.rect.center
+        cx, cy = cand.rect.center
+        angle = math.degrees(math.atan2(cy - oy, cx - ox))
+        if direction == "LEFT":
+            # 向左的时候, 有 180 和 -180 度两种可能, 用 abs 消除两者差距.
+            angle_diff_ratio = abs(self.ANGLES[direction] - abs(angle)) / 180
+        else:
+            angle_diff_ratio = abs(self.ANGLES[direction] - angle) / 180
+        distance_square_ratio = ((ox - cx) ** 2 + (oy - cy) ** 2) / diagonal_square
+        return distance_square_ratio * 0.6 + angle_diff_ratio * 0.4
+
+
+class ProjectionScorer:
+    """
+    Params:
+        beam_penalty: 和起点窗口在垂直于方向的轴上没有重叠时的额外惩罚.
+        center_weight: 中心距离相对于边缘间距的权重.
+        perp_weight: 垂直方向偏移的权重.
+    """
+
+    def __init__(self, beam_penalty=1.0, center_weight=0.25, perp_weight=2.0):
+        self.beam_penalty = beam_penalty
+        self.center_weight = center_weight
+        self.perp_weight = perp_weight
+
+    def score(
+        self, origin: Candidate, cand: Candidate, direction: str, layout: Layout
+    ) -> Optional[float]:
+        axis, sign = DIRECTIONS[direction]
+        perp = 1 - axis
+        center_delta = sign * (cand.rect.center[axis] - origin.rect.center[axis])
+        if center_delta <= 0:
+            return None  # 不在这个方向上.
+        o_lo, o_hi = origin.rect.span(axis)
+        c_lo, c_hi = cand.rect.span(axis)
+        gap = max(c_lo - o_hi if sign > 0 else o_lo - c_hi, 0)
+        op_lo, op_hi = origin.rect.span(perp)
+        cp_lo, cp_hi = cand.rect.span(perp)
+        overlap = min(op_hi, cp_hi) - max(op_lo, cp_lo)
+        monitor = layout.monitor_of(origin.rect)
+        main_norm = monitor.size(axis) or 1
+        perp_norm = monitor.size(perp) or 1
+        rst = (gap + self.center_weight * center_delta) / main_norm
+        if overlap <= 0:
+            rst += self.beam_penalty + self.perp_weight * -overlap / perp_norm
+        return rst
+
+
+SCORERS = {
+    "legacy": LegacyScorer,
+    "projection": ProjectionScorer,
+}
+
+
+class Snapshot:
+    """
+    一次窗口枚举的结果.
+
+    Params:
+        candidates: 所有候选窗口.
+        layout: 屏幕布局.
+        scorer: 打分器, 分数越低越优先, 返回 None 表示排除.
+        mru: 最近使用顺序, 用于分数相近时的决胜.
+        tie_epsilon: 和最高分 (最低的分数) 的差不超过此值时视为相同, 按最近使用顺序决胜.
+    """
+
+    def __init__(
+        self,
+        candidates: Sequence[Candidate],
+        layout: Layout,
+        scorer,
+        mru: Optional[MruTracker] = None,
+        tie_epsilon: float = 0.02,
+    ):
+        self.candidates = {c.key: c for c in candidates}
+        self.layout = layout
+        self.scorer = scorer
+        self.mru = mru
+        self.tie_epsilon = tie_epsilon
+        self.created = time.monotonic()
+        # 起点 -> 方向 -> (按分数排序的 key, 和最高分相近的窗口数).
+        self._orders: dict[Hashable, dict[str, tuple[list[Hashable], int]]] = {}
+
+    def age(self):
+        return time.monotonic() - self.created
+
+    def order(self, origin_key: Hashable, direction: str) -> list[Hashable]:
+        """
+        Returns:
+            从 origin_key 窗口出发, direction 方向上候选窗口的 key, 按优先级排序.
+        """
+        orders = self._orders.get(origin_key)
+        if orders is None:
+            orders = self._orders[origin_key] = self._compute(origin_key)
+        keys, tied = orders[direction]
+        if tied < 2 or self.mru is None:
+            return keys
+        # 和最高分相近的窗口按当前的最近使用顺序排在前面.
+        ranks = self.mru.ranks()
+        unranked = len(ranks)
+        head = sorted(keys[:tied], key=lambda key: ranks.get(key, unranked))
+        return head + keys[tied:]
+
+    def best(self, origin_key: Hashable, direction: str) -> Optional[Candidate]:
+        order = self.order(origin_key, direction)
+        return self.candidates[order[0]] if order else None
+
+    def _compute(self, origin_key) -> dict[str, tuple[list[Hashable], int]]:
+        origin = self.candidates[origin_key]
+        rst = {}
+        for direction in DIRECTIONS:
+            scored = []
+            for cand in self.candidates.values():
+                if cand.key == origin_key:
+                    continue
+                score = self.scorer.score(origin, cand, direction, self.layout)
+                if score is None:
+                    continue
+                scored.append((score, cand.key))
+            scored.sort(key=lambda item: item[0])
+            tied = 0
+            if scored:
+                limit = scored[0][0] + self.tie_epsilon
+                tied = sum(1 for item in scored if item[0] <= limit)
+            rst[direction] = [item[1] for item in scored], tied
+        return rst
@@ -0,0 +1,402 @@
+"""
+小工具的启动耗时与热点函数基准.
+
+Windows 专有模块由 `gadgets.stubs` 代替, 因此可以在 Linux 上运行.
+
+- import: 用 `python -X importtime` 统计每个入口模块的导入耗时.
+- ready: 从启动进程到可以响应 (IPC status 或 HTTP 请求) 的耗时, 以及之后空闲时的 RSS 和 CPU.
+- micro: `switch_to` 打分, 标点替换, `find_process`, `forward_request` 的耗时,
+  以及各压缩选项下 `forward_request` 返回的字节数和 CPU 时间.
+
+```shell
+python -m gadgets.bench --output bench.json
+python -m gadgets.bench --compare bench.json --threshold 0.2  # 有退化时以非零状态退出
+```
+"""
+
+import argparse
+import gzip
+import json
+import os
+import platform
+import random
+import socket
+import string
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable
+
+from functional_capslock.latency import percentile
+from gadgets.host import GADGETS
+from gadgets.single_instance import request
+
+SRC = Path(__file__).resolve().parent.parent
+# 数值越小越好的指标后缀, 用于和基线比较.
+LOWER_IS_BETTER = ("_ms", "_us", "_mib", "_percent", "_bytes")
+
+
+def _env():
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SRC), env.get("PYTHONPATH")]))
+    return env
+
+
+def _bootstrap(code: str) -> str:
+    return f"from gadgets import stubs; stubs.install(); {code}"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _stats(values: list[float], unit=1000.0, suffix="_ms") -> dict:
+    return {
+        "count": len(values),
+        f"p50{suffix}": percentile(values, 50) * unit,
+        f"p99{suffix}": percentile(values, 99) * unit,
+        f"mean{suffix}": sum(values) / len(values) * unit,
+    }
+
+
+def _repeat(func: Callable, n: int) -> list[float]:
+    rst = []
+    for _ in range(n):
+        start = time.perf_counter()
+        func()
+        rst.append(time.perf_counter() - start)
+    return rst
+
+
+def parse_importtime(stderr: str) -> dict[str, tuple[int, int]]:
+    """
+    Returns:
+        模块名 -> (自身耗时, 累计耗时), 单位为微秒.
+    """
+    rst = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:") :].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # 表头.
+        rst[parts[2].strip()] = (int(parts[0]), int(parts[1]))
+    return rst
+
+
+def measure_import(module: str) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _bootstrap(f"import {module}")],
+        capture_output=True,
+        text=True,
+        env=_env(),
+    )
+    times = parse_importtime(proc.stderr)
+    if proc.returncode != 0 or module not in times:
+        return {"error": proc.stderr.strip().splitlines()[-1:]}
+    heaviest = sorted(times.items(), key=lambda item: item[1][0], reverse=True)[:5]
+    return {
+        "cumulative_us": times[module][1],
+        "modules": len(times),
+        "heaviest_self_us": {name: t[0] for name, t in heaviest},
+    }
+
+
+def _probe_ipc(name: str, port: int) -> Callable[[], bool]:
+    return lambda: request(name, "status", timeout=0.2, port=port) is not None
+
+
+def _probe_http(port: int) -> Callable[[], bool]:
+    def probe():
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=0.2)
+        except urllib.error.HTTPError:
+            return True  # 缺少 url 参数时返回 400, 说明已经就绪.
+        except OSError:
+            return False
+        return True
+
+    return probe
+
+
+def measure_ready(name: str, idle=3.0, timeout=20.0) -> dict:
+    import psutil
+
+    spec = GADGETS[name]
+    kwargs = dict(spec.kwargs)
+    # 子进程使用空闲的端口, 不探测也不关闭正在运行的实例.
+    ipc_port = _free_port()
+    if name == "forwardurlproxy":
+        port = _free_port()
+        kwargs["argv"] = ["--port", str(port)]
+        probe = _probe_http(port)
+    else:
+        probe = _probe_ipc(name, ipc_port)
+    code = _bootstrap(
+        "from gadgets import single_instance; "
+        f"single_instance.PORTS[{name!r}] = {ipc_port}; "
+        f"from gadgets.host import GADGETS; GADGETS[{name!r}].load()(**{kwargs!r})"
+    )
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-c", code],
+        env=_env(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        ready = None
+        while time.perf_counter() - start < timeout and proc.poll() is None:
+            if probe():
+                ready = time.perf_counter() - start
+                break
+            time.sleep(0.01)
+        if ready is None:
+            proc.kill()
+            err = proc.communicate()[1].decode(errors="replace").strip()
+            return {"error": err.splitlines()[-1:] or ["timeout"]}
+        ps = psutil.Process(proc.pid)
+        cpu_before = sum(ps.cpu_times()[:2])
+        time.sleep(idle)
+        cpu = sum(ps.cpu_times()[:2]) - cpu_before
+        return {
+            "ready_ms": ready * 1000,
+            "idle_rss_mib": ps.memory_info().rss / 2**20,
+            "idle_cpu_percent": cpu / idle * 100,
+        }
+    finally:
+        if proc.poll() is None:
+            if request(name, "shutdown", timeout=0.2, port=ipc_port) is None:
+                proc.terminate()
+            try:
+                proc.wait(3)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def _text_body(words=20000, seed=0) -> bytes:
+    rng = random.Random(seed)
+    vocabulary = [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+        for _ in range(2000)
+    ]
+    text = " ".join(rng.choice(vocabulary) for _ in range(words))
+    return f"<html><body><p>{text}</p></body></html>".encode("utf-8")
+
+
+class _UpstreamHandler(BaseHTTPRequestHandler):
+    """
+    /text 返回较难压缩的文本, /gzip 在客户端接受时返回 gzip 压缩后的 /text, 其余返回重复的文本.
+    """
+
+    body = ("<p>" + "窗口 window " * 4000 + "</p>").encode("utf-8")
+    text = _text_body()
+    text_gzip = gzip.compress(text, mtime=0)
+
+    def do_GET(self):
+        body, encoding = self.body, None
+        if self.path.startswith(("/text", "/gzip")):
+            body = self.text
+            if self.path.startswith("/gzip") and "gzip" in self.headers.get(
+                "Accept-Encoding", ""
+            ):
+                body, encoding = self.text_gzip, "gzip"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        if encoding is not None:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def micro_benchmarks(n=200) -> dict:
+    from gadgets import stubs
+
+    stubs.install()
+    from functional_capslock.replay import replay, synthetic_trace
+    from guard_running.guard_running import find_process
+    from replace_punctuation_with_en.replace_punctuation_with_en import convert
+
+    rst = {}
+    report = replay(synthetic_trace(windows=12, presses=n), repeat=3)
+    rst["switch_to"] = {"event": report["event"], "score": report.get("score")}
+
+    text = "你好，世界！这是（一个）“测试”：【标点】；还有《书名》。" * 50
+    rst["convert_punctuation"] = _stats(_repeat(lambda: convert(text), n), 1e6, "_us")
+
+    rst["find_process"] = _stats(
+        _repeat(lambda: find_process("no-such-process.exe"), max(n // 20, 5))
+    )
+
+    rst["forward_request"] = _forward_request_benchmark(n // 4)
+    rst["forward_compression"] = _compression_benchmark(n // 4)
+    return rst
+
+
+def _forward_request_benchmark(n: int, path="/") -> dict:
+    from forward_url_proxy.forward_url_proxy import app
+
+    upstream = ThreadingHTTPServer(("127.0.0.1", 0), _UpstreamHandler)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    try:
+        url = urllib.parse.quote(f"http://127.0.0.1:{upstream.server_port}/")
+        client = app.test_client()
+        sizes = []
+
+        def fetch():
+            response = client.get(f"{path}?url={url}")
+            sizes.append(len(response.data))
+
+        rst = _stats(_repeat(fetch, n))
+        rst["response_bytes"] = sizes[-1]
+        return rst
+    finally:
+        upstream.shutdown()
+        upstream.server_close()
+
+
+def _compression_benchmark(n: int) -> dict:
+    """
+    各种压缩选项下返回给客户端的字节数和代理处理每个请求的 CPU 时间.
+
+    decode 为解压上游的 gzip 再返回 (旧的行为), passthrough 为原样返回上游的 gzip,
+    identity 为上游未压缩且不压缩, 其余为压缩未压缩的上游内容.
+    """
+    from forward_url_proxy import forward_url_proxy
+    from forward_url_proxy.compress import CODECS, EncodingOptions
+
+    modes = {
+        "decode": ("/gzip", EncodingOptions(passthrough=False)),
+        "passthrough": ("/gzip", EncodingOptions()),
+        "identity": ("/text", EncodingOptions()),
+    }
+    for codec, levels in (("gzip", (1, 6, 9)), ("deflate", (6,)), ("br", (1, 5, 11))):
+        if codec in CODECS:
+            for level in levels:
+                modes[f"{codec}_{level}"] = (
+                    "/text",
+                    EncodingOptions(compress=codec, level=level),
+                )
+
+    upstream = ThreadingHTTPServer(("127.0.0.1", 0), _UpstreamHandler)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    saved = forward_url_proxy.encoding_options
+    try:
+        client = forward_url_proxy.app.test_client()
+        rst = {}
+        for mode, (path, options) in modes.items():
+            forward_url_proxy.encoding_options = options
+            url = urllib.parse.quote(f"http://127.0.0.1:{upstream.server_port}{path}")
+            cpu = []
+            sent = 0
+            for _ in range(n):
+                # 测试客户端在当前线程中运行应用, 线程 CPU 时间即为代理的开销.
+                start = time.thread_time()
+                response = client.get(
+                    f"/?url={url}", headers={"Accept-Encoding": "gzip, deflate, br"}
+                )
+                cpu.append(time.thread_time() - start)
+                sent = len(response.data)
+            rst[mode] = {
+                "sent_bytes": sent,
+                "cpu_us": percentile(cpu, 50) * 1e6,
+                "ratio": sent / len(_UpstreamHandler.text),
+            }
+        return rst
+    finally:
+        forward_url_proxy.encoding_options = saved
+        upstream.shutdown()
+        upstream.server_close()
+
+
+def flatten(obj, prefix="") -> dict[str, float]:
+    rst = {}
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            rst.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        rst[prefix[:-1]] = obj
+    return rst
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """
+    Returns:
+        比基线差超过 threshold (比例) 的指标.
+    """
+    old = flatten(baseline)
+    rst = []
+    for key, value in flatten(current).items():
+        # 最大值受偶发调度影响太大, 不参与比较.
+        if not key.endswith(LOWER_IS_BETTER) or ".max_" in key or not old.get(key):
+            continue
+        ratio = value / old[key]
+        if ratio > 1 + threshold:
+            rst.append(f"{key}: {old[key]:.3f} -> {value:.3f} ({ratio:.2f}x)")
+    return rst
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark gadget startup and hot paths"
+    )
+    parser.add_argument(
+        "--only",
+        default="import,ready,micro",
+        help="逗号分隔的基准类别: import, ready, micro",
+    )
+    parser.add_argument("--idle", type=float, default=3.0, help="空闲采样时长 (秒)")
+    parser.add_argument("-n", type=int, default=200, help="微基准的重复次数")
+    parser.add_argument("--output", help="把结果写入此 json 文件")
+    parser.add_argument("--compare", help="与此 json 基线比较")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args(argv)
+    only = set(args.only.split(","))
+
+    result: dict = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        }
+    }
+    if "import" in only:
+        result["import"] = {
+            name: measure_import(spec.target.split(":")[0])
+            for name, spec in GADGETS.items()
+        }
+    if "ready" in only:
+        result["ready"] = {
+            name: measure_ready(name, args.idle)
+            for name in ("fncaps", "imeswitch", "forwardurlproxy")
+        }
+    if "micro" in only:
+        result["micro"] = micro_benchmarks(args.n)
+
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(baseline, result, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+组合键检测.
+
+修饰键的按下状态保存为位掩码, 每个按键事件只做常数次字典查询和位运算,
+不依赖异常控制流, 适合直接在键盘钩子回调中使用.
+"""
+
+from typing import Callable, Hashable, Iterable, Sequence
+
+
+def pynput_key_id(key) -> Hashable:
+    """
+    把 pynput 的按键转换为可比较的标识: 字符键取字符, 其他键取按键本身.
+    """
+    char = getattr(key, "char", None)
+    return key if char is None else char
+
+
+class ChordDetector:
+    """
+    所有修饰键组都有键按下时, 按下触发键即调用 callback.
+    按住触发键产生的重复按下事件不会重复触发.
+
+    Params:
+        modifiers: 修饰键组, 每组中任意一个键按下即满足该组, 比如
+            `[(Key.ctrl, Key.ctrl_l, Key.ctrl_r)]`.
+        triggers: 触发键.
+        callback: 触发时在事件线程中调用, 应当尽快返回.
+    """
+
+    def __init__(
+        self,
+        modifiers: Sequence[Iterable[Hashable]],
+        triggers: Iterable[Hashable],
+        callback: Callable[[], None],
+    ):
+        self._slot = {}  # 修饰键 -> 组序号.
+        for i, group in enumerate(modifiers):
+            for key in group:
+                self._slot[key] = i
+        self._counts = [0] * len(modifiers)  # 每组中按下的键数.
+        self._full = (1 << len(modifiers)) - 1
+        self._mask = 0
+        # 按下的修饰键和触发键, 用于过滤按住不放产生的重复按下事件.
+        self._held_modifiers = set()
+        self._held_triggers = set()
+        self._triggers = frozenset(triggers)
+        self.callback = callback
+
+    @property
+    def active(self) -> bool:
+        """
+        是否所有修饰键组都有键按下.
+        """
+        return self._mask == self._full
+
+    def press(self, key: Hashable) -> bool:
+        """
+        Returns:
+            是否触发了 callback.
+        """
+        slot = self._slot.get(key)
+        if slot is not None:
+            if key not in self._held_modifiers:
+                self._held_modifiers.add(key)
+                self._counts[slot] += 1
+                self._mask |= 1 << slot
+            return False
+        if key in self._triggers and key not in self._held_triggers:
+            self._held_triggers.add(key)
+            if self._mask == self._full:
+                self.callback()
+                return True
+        return False
+
+    def release(self, key: Hashable):
+        if key in self._held_modifiers:
+            self._held_modifiers.discard(key)
+            slot = self._slot[key]
+            self._counts[slot] -= 1
+            if self._counts[slot] == 0:
+                self._mask &= ~(1 << slot)
+            # 修饰键改变了触发键的字符 (比如 Ctrl + [ 为 "\x1b"),
+            # 触发键的释放事件可能和按下事件不一致, 此时一并清除.
+            self._held_triggers.clear()
+        else:
+            self._held_triggers.discard(key)
+
+    def reset(self):
+        """
+        清空按键状态, 比如在丢失按键释放事件之后.
+        """
+        self._held_modifiers.clear()
+        self._held_triggers.clear()
+        self._counts = [0] * len(self._counts)
+        self._mask = 0
@@ -0,0 +1,139 @@
+"""
+在同一个进程中运行多个小工具.
+
+每个小工具只有在被选中时才会导入对应的模块, 各自在独立的线程中运行.
+
+```shell
+gadgets fncaps imeswitch repunct
+gadgets --list
+gadgets fncaps imeswitch --profile  # 输出每个小工具的导入耗时和内存增量.
+```
+"""
+
+import argparse
+import importlib
+import logging
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+
+from gadgets.log import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class GadgetSpec:
+    """
+    Params:
+        target: "模块:函数", 即小工具的入口.
+        kwargs: 调用入口时的参数.
+        resident: 是否常驻, 非常驻的小工具执行一次就结束.
+    """
+
+    target: str
+    kwargs: dict = field(default_factory=dict)
+    resident: bool = True
+
+    def load(self):
+        module_name, func_name = self.target.split(":")
+        return getattr(importlib.import_module(module_name), func_name)
+
+
+GADGETS = {
+    "fncaps": GadgetSpec("functional_capslock.functional_capslock:main"),
+    "imeswitch": GadgetSpec("ime_chinese_switching.ime_chinese_switching:main"),
+    "repunct": GadgetSpec(
+        "replace_punctuation_with_en.replace_punctuation_with_en:main"
+    ),
+    "guardrun": GadgetSpec("guard_running.guard_running:main"),
+    "aliddns": GadgetSpec("ali_ddns.upload:main"),
+    # 带 argv 参数的小工具不从宿主的命令行读取参数.
+    "forwardurlproxy": GadgetSpec(
+        "forward_url_proxy.forward_url_proxy:main", {"argv": []}
+    ),
+    "rmpwshhistory": GadgetSpec(
+        "remove_pwsh_history.remove_pwsh_history:main", {"argv": []}, resident=False
+    ),
+}
+
+
+def _rss():
+    import psutil
+
+    return psutil.Process().memory_info().rss
+
+
+def _run_gadget(name: str, func, kwargs: dict):
+    try:
+        func(**kwargs)
+        logger.info(f"Gadget {name} exited")
+    except SystemExit as e:
+        logger.info(f"Gadget {name} exited: {e.code}")
+    except Exception:
+        logger.error(f"Gadget {name} crashed:\n{traceback.format_exc()}")
+
+
+def start(names, profile=False) -> list[threading.Thread]:
+    """
+    导入并启动指定的小工具.
+
+    Returns:
+        运行各个小工具的线程.
+    """
+    threads = []
+    for name in names:
+        spec = GADGETS[name]
+        if profile:
+            rss = _rss()
+            start_time = time.perf_counter()
+        func = spec.load()
+        if profile:
+            logger.info(
+                f"Gadget {name}: import {(time.perf_counter() - start_time) * 1000:.1f} ms, "
+                f"rss +{(_rss() - rss) / 2**20:.1f} MiB"
+            )
+        thread = threading.Thread(
+            target=_run_gadget,
+            args=(name, func, spec.kwargs),
+            name=name,
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run several gadgets in one process")
+    parser.add_argument("names", nargs="*", metavar="name", help="要运行的小工具")
+    parser.add_argument("--list", action="store_true", help="列出所有小工具")
+    parser.add_argument(
+        "--profile", action="store_true", help="输出每个小工具的导入耗时和内存增量"
+    )
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in GADGETS]
+    if unknown:
+        parser.error(f"unknown gadgets: {', '.join(unknown)}")
+    if args.list or not args.names:
+        for name, spec in GADGETS.items():
+            print(f"{name:<16} {spec.target}{'' if spec.resident else ' (一次性)'}")
+        return
+    setup_logging("gadgets")
+    if args.profile:
+        logger.info(f"Host rss {_rss() / 2**20:.1f} MiB")
+    threads = start(dict.fromkeys(args.names), args.profile)
+    if args.profile:
+        logger.info(f"Host rss {_rss() / 2**20:.1f} MiB after start")
+    try:
+        # 带超时地等待, 以便在 Windows 上也能响应 Ctrl + C.
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+小工具共用的日志设置.
+
+日志记录在调用线程中只被放入一个有界队列, 由后台线程写入文件和控制台,
+因此在键盘钩子回调和轮询循环中记录日志不会阻塞在 I/O 上. 队列满时直接丢弃记录.
+
+```python
+import logging
+from gadgets.log import setup_logging
+
+logger = logging.getLogger(__name__)
+setup_logging("functional_capslock", Path(__file__).with_suffix(".log"))
+```
+"""
+
+import atexit
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+TEXT_FORMAT = "%(asctime)s | %(name)s | %(levelname)s | %(message)s"
+MAX_BYTES = 2**20
+BACKUP_COUNT = 3
+QUEUE_SIZE = 10000
+
+# LogRecord 自带的属性, 其余属性视为通过 extra 传入的字段.
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    每条记录输出为一行 json, 通过 `extra` 传入的字段也会一并输出.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    按调用位置 (文件和行号) 限流的过滤器, 用于热点路径上的 logger.
+
+    每个位置每秒最多放行 rate 条, 允许 burst 条的突发. 被丢弃的条数记录在下一条
+    放行的记录的 `suppressed` 字段中, 并附加在消息末尾.
+    """
+
+    def __init__(self, rate=1.0, burst=5, clock: Callable[[], float] = time.monotonic):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._buckets = {}  # (文件, 行号) -> [令牌数, 上次时间, 丢弃数].
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.pathname, record.lineno)
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                return False
+            bucket[0] = tokens - 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.msg = f"{record.getMessage()} (suppressed {suppressed})"
+            record.args = None
+            record.suppressed = suppressed
+        return True
+
+
+def rate_limited(logger: logging.Logger | str, rate=1.0, burst=5) -> logging.Logger:
+    """
+    给 logger 加上 `RateLimitFilter`.
+
+    Returns:
+        加上过滤器的 logger.
+    """
+    if isinstance(logger, str):
+        logger = logging.getLogger(logger)
+    if not any(isinstance(f, RateLimitFilter) for f in logger.filters):
+        logger.addFilter(RateLimitFilter(rate, burst))
+    return logger
+
+
+class _NameFilter(logging.Filter):
+    """
+    只放行指定 logger 及其子 logger 的记录.
+    """
+
+    def __init__(self, names: Iterable[str]):
+        super().__init__()
+        self.names = tuple(names)
+        self.prefixes = tuple(f"{name}." for name in self.names)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.name in self.names or record.name.startswith(self.prefixes)
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """
+    队列满时丢弃记录而不是阻塞或报错.
+    """
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Dispatcher(logging.Handler):
+    """
+    在后台线程中把记录分发给各个实际的 handler, 支持运行时添加 handler.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.handlers: list[logging.Handler] = []
+
+    def emit(self, record: logging.LogRecord):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def close(self):
+        for handler in self.handlers:
+            handler.close()
+        super().close()
+
+
+_lock = threading.Lock()
+_dispatcher: Optional[_Dispatcher] = None
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[_DroppingQueueHandler] = None
+_console: Optional[logging.Handler] = None
+
+
+def _ensure_listener() -> _Dispatcher:
+    global _dispatcher, _listener, _queue_handler
+    if _dispatcher is None:
+        _dispatcher = _Dispatcher()
+        _queue_handler = _DroppingQueueHandler(queue.Queue(QUEUE_SIZE))
+        _listener = QueueListener(_queue_handler.queue, _dispatcher)
+        _listener.start()
+        logging.getLogger().addHandler(_queue_handler)
+        atexit.register(shutdown)
+    return _dispatcher
+
+
+def dropped() -> int:
+    """
+    Returns:
+        因队列已满而丢弃的记录数.
+    """
+    return 0 if _queue_handler is None else _queue_handler.dropped
+
+
+def open_log_file(
+    log_file: Path | str,
+    max_bytes=MAX_BYTES,
+    backup_count=BACKUP_COUNT,
+    rollover=True,
+) -> RotatingFileHandler:
+    """
+    Params:
+        rollover: 是否把上一次运行的日志轮转为旧文件, 使本次运行从空文件开始.
+    """
+    handler = RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    if rollover and handler.stream.tell() > 0:
+        try:
+            handler.doRollover()
+        except OSError:
+            pass  # 旧实例仍打开着日志文件 (Windows 上无法重命名), 继续追加.
+    return handler
+
+
+def setup_logging(
+    name: str,
+    log_file: Optional[Path | str] = None,
+    level=logging.INFO,
+    json_format=False,
+    console=True,
+    capture: Iterable[str] = (),
+    max_bytes=MAX_BYTES,
+    backup_count=BACKUP_COUNT,
+    rollover=True,
+) -> logging.Logger:
+    """
+    为小工具配置日志, 可以多次调用, 比如多个小工具运行在同一个进程中时.
+
+    Params:
+        name: 小工具的 logger 名, 一般为包名. 日志文件只记录此 logger 及其子 logger 的日志.
+        log_file: 日志文件, 超过 max_bytes 字节时轮转, 保留 backup_count 个旧文件.
+        level: name 和 capture 中的 logger 的日志级别.
+        json_format: 日志文件中每行为一条 json 记录.
+        console: 是否同时输出到控制台 (没有控制台时忽略).
+        capture: 额外写入日志文件的 logger 名, 比如 "werkzeug".
+        rollover: 启动时把上一次运行的日志轮转为旧文件.
+
+    Returns:
+        名为 name 的 logger.
+    """
+    global _console
+    names = (name, *capture)
+    for n in names:
+        logging.getLogger(n).setLevel(level)
+    with _lock:
+        dispatcher = _ensure_listener()
+        if console and _console is None and sys.stderr is not None:
+            _console = logging.StreamHandler()
+            _console.setFormatter(logging.Formatter(TEXT_FORMAT))
+            dispatcher.handlers = [*dispatcher.handlers, _console]
+        if log_file is not None:
+            handler = open_log_file(log_file, max_bytes, backup_count, rollover)
+            handler.setFormatter(
+                JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+            )
+            handler.addFilter(_NameFilter(names))
+            dispatcher.handlers = [*dispatcher.handlers, handler]
+    return logging.getLogger(name)
+
+
+def shutdown():
+    """
+    写完队列中剩余的记录并关闭所有 handler.
+    """
+    global _dispatcher, _listener, _queue_handler, _console
+    with _lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        _dispatcher.close()
+        _dispatcher = _listener = _queue_handler = _console = None
@@ -0,0 +1,425 @@
+"""
+小工具共用的定时任务调度.
+
+所有任务在同一个线程 (`Scheduler.run`) 或 asyncio 事件循环 (`Scheduler.run_async`) 中执行,
+到期时间基于单调时钟, 保存在最小堆中, 不受系统时间调整的影响.
+
+```python
+from gadgets.scheduler import Scheduler
+
+scheduler = Scheduler()
+scheduler.every(3, check, jitter=0.1, max_backoff=60)
+paste = scheduler.debounce(0.5, on_paste)  # 在其他线程中调用 paste() 也是安全的.
+scheduler.run()
+```
+
+时钟可以注入, 配合 `ManualClock` 和 `run_pending` 即可离线验证调度行为:
+
+```python
+clock = ManualClock()
+scheduler = Scheduler(clock)
+scheduler.every(10, check)
+clock.advance(10)
+scheduler.run_pending()
+```
+"""
+
+import asyncio
+import functools
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TaskStats:
+    runs: int = 0
+    errors: int = 0
+    total_s: float = 0.0
+    max_s: float = 0.0
+    last_s: float = 0.0
+    max_lateness_s: float = 0.0  # 实际执行时间比到期时间晚了多少.
+
+    def to_dict(self) -> dict:
+        rst = asdict(self)
+        rst["mean_s"] = self.total_s / self.runs if self.runs else 0.0
+        return rst
+
+
+def _timed_call(stats: TaskStats, func: Callable, args=(), kwargs=None, clock=None):
+    clock = time.perf_counter if clock is None else clock
+    start = clock()
+    try:
+        return func(*args, **(kwargs or {}))
+    except Exception:
+        stats.errors += 1
+        raise
+    finally:
+        elapsed = clock() - start
+        stats.runs += 1
+        stats.total_s += elapsed
+        stats.last_s = elapsed
+        stats.max_s = max(stats.max_s, elapsed)
+
+
+def _func_logger(func: Callable) -> logging.Logger:
+    """
+    Returns:
+        func 所在模块的 logger, 使任务的异常写入对应小工具的日志文件.
+    """
+    while isinstance(func, functools.partial):
+        func = func.func
+    module = getattr(func, "__module__", None)
+    return logging.getLogger(module) if module else logger
+
+
+class ManualClock:
+    """
+    手动推进的时钟, 用于测试和回放.
+    """
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class Task:
+    """
+    由 `Scheduler` 创建, 不直接实例化.
+
+    Params:
+        interval: 周期任务的间隔, 一次性任务为 None.
+        jitter: 每次间隔随机浮动的比例, 比如 0.1 表示 ±10%.
+        max_backoff: 任务抛出异常后间隔翻倍, 直到此值; 成功后恢复. None 表示不退避.
+    """
+
+    def __init__(
+        self,
+        scheduler: "Scheduler",
+        name: str,
+        func: Callable,
+        interval: Optional[float] = None,
+        jitter=0.0,
+        max_backoff: Optional[float] = None,
+    ):
+        self.scheduler = scheduler
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.due: Optional[float] = None
+        self.cancelled = False
+        self.stats = TaskStats()
+        self.logger = _func_logger(func)  # 记录任务的异常.
+        self._seq = -1  # 堆中有效条目的序号, 其余条目在弹出时丢弃.
+        self._args = ()
+
+    def next_delay(self) -> float:
+        delay = self.interval
+        if self.failures and self.max_backoff is not None:
+            # 限制指数, 长时间失败后浮点数的幂也不会溢出.
+            delay = min(delay * 2 ** min(self.failures, 32), self.max_backoff)
+        if self.jitter:
+            delay *= 1 + self.scheduler.rng.uniform(-self.jitter, self.jitter)
+        return max(delay, 0.0)
+
+    def cancel(self):
+        self.scheduler.cancel(self)
+
+    def __repr__(self):
+        return f"<Task {self.name} due={self.due}>"
+
+
+class Debounced:
+    """
+    每次调用都把任务推迟到 delay 秒之后, 只有停止调用 delay 秒后才以最后一次的参数执行.
+    """
+
+    def __init__(self, scheduler: "Scheduler", delay: float, func: Callable, name: str):
+        self.delay = delay
+        self.task = Task(scheduler, name, func)
+
+    @property
+    def stats(self) -> TaskStats:
+        return self.task.stats
+
+    def __call__(self, *args):
+        self.task._args = args
+        self.task.scheduler.schedule(self.task, self.delay)
+
+    def cancel(self):
+        self.task.cancel()
+
+
+class Throttle:
+    """
+    在调用线程中直接执行, 但距上次执行不足 interval 秒时忽略本次调用.
+
+    Params:
+        scheduler: 指定时在间隔结束时补上被忽略的最后一次调用 (trailing).
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        func: Callable,
+        clock: Callable[[], float] = time.monotonic,
+        scheduler: Optional["Scheduler"] = None,
+    ):
+        self.interval = interval
+        self.func = func
+        self.clock = clock
+        self.scheduler = scheduler
+        self.last: Optional[float] = None
+        self.stats = TaskStats()
+        self._trailing: Optional[Task] = None
+
+    def __call__(self, *args, **kwargs):
+        now = self.clock()
+        if self.last is None or now - self.last >= self.interval:
+            self.last = now
+            return _timed_call(self.stats, self.func, args, kwargs)
+        if self.scheduler is not None:
+            if self._trailing is None:
+                self._trailing = Task(
+                    self.scheduler, f"{_name(self.func)}:trailing", self._fire
+                )
+                self._trailing.logger = _func_logger(self.func)
+            self._trailing._args = (args, kwargs)
+            self.scheduler.schedule(self._trailing, self.last + self.interval - now)
+        return None
+
+    def _fire(self, args, kwargs):
+        self.last = self.clock()
+        return _timed_call(self.stats, self.func, args, kwargs)
+
+
+def _name(func: Callable) -> str:
+    return getattr(func, "__qualname__", None) or repr(func)
+
+
+class Scheduler:
+    """
+    Params:
+        clock: 单调时钟, 默认为 `time.monotonic`.
+        rng: 用于 jitter 的随机数生成器.
+    """
+
+    def __init__(
+        self,
+        clock: Callable[[], float] = time.monotonic,
+        rng: Optional[random.Random] = None,
+    ):
+        self.clock = clock
+        self.rng = random.Random() if rng is None else rng
+        self.tasks: dict[str, Task] = {}
+        self.throttles: dict[str, Throttle] = {}
+        self._heap: list[tuple[float, int, Task]] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._wakeup: Optional[Callable[[], None]] = None
+
+    def _unique_name(self, name: str) -> str:
+        rst = name
+        for i in itertools.count(2):
+            if rst not in self.tasks and rst not in self.throttles:
+                return rst
+            rst = f"{name}#{i}"
+
+    def _add(self, task: Task) -> Task:
+        task.name = self._unique_name(task.name)
+        self.tasks[task.name] = task
+        return task
+
+    def every(
+        self,
+        interval: float,
+        func: Callable,
+        *,
+        name: Optional[str] = None,
+        jitter=0.0,
+        max_backoff: Optional[float] = None,
+        run_now=False,
+    ) -> Task:
+        """
+        每 interval 秒执行一次 func. 执行耗时超过间隔时不会补执行错过的次数.
+
+        Params:
+            run_now: 是否立即执行第一次, 否则在 interval 秒后.
+        """
+        task = self._add(
+            Task(self, name or _name(func), func, interval, jitter, max_backoff)
+        )
+        self.schedule(task, 0.0 if run_now else task.next_delay())
+        return task
+
+    def call_later(
+        self, delay: float, func: Callable, *args, name: Optional[str] = None
+    ) -> Task:
+        """
+        delay 秒后执行一次 func. 只有指定了 name 的任务才会出现在 `stats` 中.
+        """
+        task = Task(self, name or _name(func), func)
+        if name is not None:
+            self._add(task)
+        task._args = args
+        self.schedule(task, delay)
+        return task
+
+    def debounce(
+        self, delay: float, func: Callable, name: Optional[str] = None
+    ) -> Debounced:
+        debounced = Debounced(self, delay, func, name or _name(func))
+        self._add(debounced.task)
+        return debounced
+
+    def throttle(
+        self, interval: float, func: Callable, name: Optional[str] = None
+    ) -> Throttle:
+        throttle = Throttle(interval, func, self.clock, self)
+        self.throttles[self._unique_name(name or _name(func))] = throttle
+        return throttle
+
+    def schedule(self, task: Task, delay: float):
+        """
+        把任务 (重新) 安排在 delay 秒后执行, 之前的安排失效. 可以在任意线程中调用.
+        """
+        with self._cond:
+            task.cancelled = False
+            task.due = self.clock() + delay
+            task._seq = next(self._counter)
+            heapq.heappush(self._heap, (task.due, task._seq, task))
+            self._notify()
+
+    def cancel(self, task: Task):
+        with self._cond:
+            task.cancelled = True
+            task.due = None
+            task._seq = -1
+            self._notify()
+
+    def _notify(self):
+        self._cond.notify_all()
+        if self._wakeup is not None:
+            self._wakeup()
+
+    def _pop_due(self, now: float) -> Optional[tuple[Task, float]]:
+        with self._cond:
+            while self._heap:
+                due, seq, task = self._heap[0]
+                if seq != task._seq:
+                    heapq.heappop(self._heap)  # 已取消或重新安排.
+                    continue
+                if due > now:
+                    return None
+                heapq.heappop(self._heap)
+                task._seq = -1
+                task.due = None
+                return task, due
+        return None
+
+    def next_due(self) -> Optional[float]:
+        with self._cond:
+            while self._heap and self._heap[0][1] != self._heap[0][2]._seq:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def _run_task(self, task: Task, due: float, now: float):
+        task.stats.max_lateness_s = max(task.stats.max_lateness_s, now - due)
+        try:
+            _timed_call(task.stats, task.func, task._args)
+            task.failures = 0
+        except Exception:
+            task.failures += 1
+            task.logger.exception(f"Task {task.name} failed ({task.failures} in a row)")
+        if task.interval is None or task.cancelled:
+            return
+        with self._cond:
+            if task._seq != -1:
+                return  # 任务在执行过程中被重新安排.
+            delay = task.next_delay()
+            # 按原定节奏安排下一次, 落后太多时从现在开始计算, 不补执行.
+            next_due = due + delay
+            if next_due <= self.clock():
+                next_due = self.clock() + delay
+            task.due = next_due
+            task._seq = next(self._counter)
+            heapq.heappush(self._heap, (next_due, task._seq, task))
+
+    def run_pending(self) -> Optional[float]:
+        """
+        执行所有已到期的任务.
+
+        Returns:
+            距下一个任务到期的秒数, 没有任务时返回 None.
+        """
+        now = self.clock()
+        while not self._stopped and (popped := self._pop_due(now)) is not None:
+            task, due = popped
+            self._run_task(task, due, self.clock())
+        due = self.next_due()
+        return None if due is None else max(due - self.clock(), 0.0)
+
+    def run(self, until: Optional[Callable[[], bool]] = None):
+        """
+        在当前线程中执行任务, 直到调用 `stop` 或 until 返回 True.
+        """
+        self._stopped = False
+        while not self._stopped and not (until is not None and until()):
+            self.run_pending()
+            with self._cond:
+                # 加锁后重新计算, 以免错过其他线程刚安排的任务.
+                due = self.next_due()
+                delay = None if due is None else due - self.clock()
+                if not self._stopped and (delay is None or delay > 0):
+                    self._cond.wait(delay)
+
+    async def run_async(self):
+        """
+        在当前 asyncio 事件循环中执行任务, 直到调用 `stop`. 任务本身仍是同步函数.
+        """
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        self._wakeup = lambda: loop.call_soon_threadsafe(event.set)
+        self._stopped = False
+        try:
+            while not self._stopped:
+                event.clear()
+                delay = self.run_pending()
+                if self._stopped:
+                    break
+                try:
+                    await asyncio.wait_for(event.wait(), delay)
+                except TimeoutError:
+                    pass
+        finally:
+            self._wakeup = None
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._notify()
+
+    def stats(self) -> dict[str, dict]:
+        """
+        Returns:
+            任务名 -> 执行次数, 异常次数, 耗时等统计.
+        """
+        rst = {name: task.stats.to_dict() for name, task in self.tasks.items()}
+        rst.update((name, t.stats.to_dict()) for name, t in self.throttles.items())
+        return rst
@@ -0,0 +1,200 @@
+"""
+小工具的单实例控制与本地 IPC.
+
+每个常驻的小工具在本地回环地址的固定端口上监听, 端口被占用即说明已有实例在运行.
+一次性的小工具 (比如 rmpwshhistory) 不注册.
+新实例可以要求旧实例立即退出 (takeover), 也可以通过命令行查询状态或者关闭实例:
+
+```shell
+gadgetctl status imeswitch
+gadgetctl shutdown fncaps
+```
+
+协议: 客户端发送一行 json 请求 `{"cmd": "status" | "shutdown" | "takeover"}`,
+服务端回复一行 json 后关闭连接.
+"""
+
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from typing import Callable, Optional
+
+HOST = "127.0.0.1"
+PORTS = {
+    "fncaps": 23982,
+    "imeswitch": 23983,
+    "repunct": 23984,
+    "guardrun": 23985,
+    "aliddns": 23986,
+    "forwardurlproxy": 23987,
+}
+MAX_MESSAGE_SIZE = 64 * 1024
+
+
+class AlreadyRunning(Exception):
+    pass
+
+
+def _send_line(sock: socket.socket, obj):
+    sock.sendall(json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+def _recv_line(sock: socket.socket):
+    data = b""
+    while b"\n" not in data and len(data) < MAX_MESSAGE_SIZE:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return json.loads(data.split(b"\n", 1)[0].decode("utf-8"))
+
+
+def request(name: str, cmd: str, timeout=1.0, port: Optional[int] = None):
+    """
+    向正在运行的实例发送命令.
+
+    Returns:
+        实例的回复, 实例没有运行时返回 None.
+    """
+    port = PORTS[name] if port is None else port
+    try:
+        with socket.create_connection((HOST, port), timeout=timeout) as sock:
+            _send_line(sock, {"cmd": cmd})
+            return _recv_line(sock)
+    except (OSError, ValueError):
+        return None
+
+
+class SingleInstance:
+    """
+    用法:
+
+    ```python
+    with SingleInstance("imeswitch", on_shutdown=stop):
+        run()
+    ```
+
+    Params:
+        name: 小工具名, 见 `PORTS`.
+        takeover: 已有实例时是否让旧实例退出, 否则抛出 `AlreadyRunning`.
+        on_shutdown: 收到 shutdown / takeover 命令时调用, 应当让主循环尽快退出.
+        status: 返回附加状态信息的函数, 结果合并到 status 命令的回复中.
+        timeout: 等待旧实例释放端口的最长时间 (秒).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        takeover=True,
+        on_shutdown: Optional[Callable[[], None]] = None,
+        status: Optional[Callable[[], dict]] = None,
+        timeout=3.0,
+        port: Optional[int] = None,
+    ):
+        self.name = name
+        self.port = PORTS[name] if port is None else port
+        self.takeover = takeover
+        self.on_shutdown = on_shutdown
+        self.status = status
+        self.timeout = timeout
+        self.started = time.time()
+        self.shutdown_requested = threading.Event()
+        self._server: Optional[socket.socket] = None
+
+    def _bind(self):
+        return socket.create_server((HOST, self.port))
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        requested = False
+        while True:
+            try:
+                self._server = self._bind()
+                break
+            except OSError:
+                if not self.takeover:
+                    raise AlreadyRunning(self.name)
+                if not requested:
+                    request(self.name, "takeover", port=self.port)
+                    requested = True
+                if time.monotonic() > deadline:
+                    raise AlreadyRunning(self.name)
+                time.sleep(0.05)
+        threading.Thread(
+            target=self._serve, name=f"{self.name}-ipc", daemon=True
+        ).start()
+        return self
+
+    def release(self):
+        server, self._server = self._server, None
+        if server is None:
+            return
+        try:
+            # 唤醒阻塞在 accept 上的线程.
+            server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        server.close()
+
+    def _serve(self):
+        server = self._server
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn:
+                conn.settimeout(1.0)
+                try:
+                    cmd = _recv_line(conn).get("cmd")
+                except (OSError, ValueError, AttributeError):
+                    continue
+                if cmd == "status":
+                    reply = {
+                        "name": self.name,
+                        "pid": os.getpid(),
+                        "uptime": time.time() - self.started,
+                    }
+                    if self.status is not None:
+                        try:
+                            reply.update(self.status())
+                        except Exception as e:
+                            reply["error"] = f"{type(e).__name__}: {e}"
+                elif cmd in ("shutdown", "takeover"):
+                    reply = {"ok": True}
+                else:
+                    reply = {"error": f"unknown command: {cmd}"}
+                try:
+                    _send_line(conn, reply)
+                except OSError:
+                    pass
+            if cmd in ("shutdown", "takeover"):
+                # 先释放端口, 让新实例尽快启动.
+                self.release()
+                self.shutdown_requested.set()
+                if self.on_shutdown is not None:
+                    self.on_shutdown()
+                return
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *_):
+        self.release()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Control running gadgets")
+    parser.add_argument("cmd", choices=["status", "shutdown"])
+    parser.add_argument("names", nargs="*", help="小工具名, 默认为全部")
+    args = parser.parse_args(argv)
+    for name in args.names or PORTS:
+        reply = request(name, args.cmd)
+        print(f"{name}: {'not running' if reply is None else json.dumps(reply)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Windows 专有模块的桩, 用于在 Linux 上回放和基准测试.
+
+覆盖 pynput, pywinauto, uiautomation, win32con, win32gui, win32process, win32api,
+screeninfo, pyperclip 以及 ctypes.windll. 窗口, 焦点和剪贴板的状态保存在
+`FakeDesktopState` 中, 由调用者控制.
+
+```python
+from gadgets import stubs
+
+state = stubs.install()
+import functional_capslock.functional_capslock
+```
+"""
+
+import contextlib
+import ctypes
+import enum
+import sys
+import threading
+import types
+from dataclasses import dataclass, field
+from typing import Optional
+
+VK_CAPSLOCK = 0x14
+VK_LSHIFT = 0xA0
+VK_CONTROL = 0x11
+VK_LCONTROL = 0xA2
+VK_RCONTROL = 0xA3
+VK_LEFT = 0x25
+VK_UP = 0x26
+VK_RIGHT = 0x27
+VK_DOWN = 0x28
+
+
+class Suppressed(Exception):
+    """
+    桩 Listener.suppress_event 抛出的异常, 对应 pynput 拦截按键的行为.
+    """
+
+
+class FakeRect:
+    def __init__(self, left, top, right, bottom):
+        self.left = left
+        self.top = top
+        self.right = right
+        self.bottom = bottom
+
+    def width(self):
+        return self.right - self.left
+
+    def height(self):
+        return self.bottom - self.top
+
+
+class FakeWindow:
+    def __init__(self, state: "FakeDesktopState", handle, title, rect):
+        self.state = state
+        self.handle = handle
+        self.title = title
+        self.rect = FakeRect(*rect)
+
+    def is_visible(self):
+        return True
+
+    def window_text(self):
+        return self.title
+
+    def rectangle(self):
+        return self.rect
+
+    def has_focus(self):
+        return self.state.focused == self.handle
+
+    def is_maximized(self):
+        return False
+
+    def __repr__(self):
+        return f"FakeWindow({self.handle}, {self.title!r})"
+
+
+@dataclass
+class FakeMonitor:
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+@dataclass
+class FakeDesktopState:
+    monitors: list[FakeMonitor] = field(
+        default_factory=lambda: [FakeMonitor(0, 0, 1920, 1080)]
+    )
+    windows: list[FakeWindow] = field(default_factory=list)  # z 序, 上层在前.
+    focused: Optional[int] = None
+    clipboard: str = ""
+    keyboard_layout: int = 1033
+
+    def load(self, layout: dict):
+        self.monitors = [FakeMonitor(**m) for m in layout["monitors"]]
+        self.windows = [
+            FakeWindow(self, w["handle"], w.get("title", str(w["handle"])), w["rect"])
+            for w in layout["windows"]
+        ]
+        self.focused = next(
+            (w["handle"] for w in layout["windows"] if w.get("focused")), None
+        )
+
+    def top_from_point(self, x, y):
+        for window in self.windows:
+            r = window.rect
+            if r.left <= x < r.right and r.top <= y < r.bottom:
+                return window
+        return None
+
+    def focus(self, handle):
+        self.focused = handle
+        # 获得焦点的窗口移到最上层.
+        for i, window in enumerate(self.windows):
+            if window.handle == handle:
+                self.windows.insert(0, self.windows.pop(i))
+                break
+
+
+class FakeListener:
+    """
+    pynput Listener 的桩, join 会阻塞直到 stop 被调用.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._stopped = threading.Event()
+
+    def suppress_event(self):
+        raise Suppressed()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        self._stopped.set()
+
+    def join(self, timeout=None):
+        self._stopped.wait(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+
+class _FakeDll:
+    """
+    ctypes.windll 的桩, 任意函数都返回 0.
+    """
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _FakeDll()
+
+    def __call__(self, *args):
+        return 0
+
+
+def build_stub_modules(state: FakeDesktopState) -> dict[str, types.ModuleType]:
+    """
+    构造各个小工具依赖的系统模块的桩.
+    """
+
+    class KeyValue:
+        def __init__(self, vk):
+            self.vk = vk
+
+    class KeyCode:
+        def __init__(self, vk=None, char=None):
+            self.vk = vk
+            self.char = char
+
+        @classmethod
+        def from_vk(cls, vk):
+            return cls(vk=vk)
+
+        @classmethod
+        def from_char(cls, char):
+            return cls(char=char)
+
+    class Key(enum.Enum):
+        caps_lock = KeyValue(VK_CAPSLOCK)
+        shift_l = KeyValue(VK_LSHIFT)
+        ctrl = KeyValue(VK_CONTROL)
+        ctrl_l = KeyValue(VK_LCONTROL)
+        ctrl_r = KeyValue(VK_RCONTROL)
+        left = KeyValue(VK_LEFT)
+        up = KeyValue(VK_UP)
+        right = KeyValue(VK_RIGHT)
+        down = KeyValue(VK_DOWN)
+
+    class KeyboardController:
+        def press(self, key):
+            pass
+
+        def release(self, key):
+            pass
+
+    class MouseController:
+        position = (0, 0)
+
+        def scroll(self, dx, dy):
+            pass
+
+    class Desktop:
+        def __init__(self, backend=None):
+            pass
+
+        def windows(self):
+            return list(state.windows)
+
+        def top_from_point(self, x, y):
+            return state.top_from_point(x, y)
+
+    class Control:
+        def __init__(self, handle):
+            self.handle = handle
+
+        def SetFocus(self):
+            state.focus(self.handle)
+
+    def enum_windows(callback, extra):
+        for window in list(state.windows):
+            callback(window.handle, extra)
+
+    def window_text(hwnd):
+        for window in state.windows:
+            if window.handle == hwnd:
+                return window.title
+        return ""
+
+    def is_window(hwnd):
+        return any(window.handle == hwnd for window in state.windows)
+
+    def copy(text):
+        state.clipboard = text
+
+    modules = {}
+
+    def module(name, **attrs):
+        m = types.ModuleType(name)
+        m.__dict__.update(attrs)
+        modules[name] = m
+        return m
+
+    win32_keyboard = module("pynput.keyboard._win32", KeyCode=KeyCode)
+    keyboard = module(
+        "pynput.keyboard",
+        Key=Key,
+        KeyCode=KeyCode,
+        Listener=FakeListener,
+        Controller=KeyboardController,
+        _win32=win32_keyboard,
+    )
+    mouse = module("pynput.mouse", Controller=MouseController)
+    module("pynput", keyboard=keyboard, mouse=mouse)
+    module("pywinauto", Desktop=Desktop)
+    module(
+        "uiautomation",
+        ControlFromHandle=Control,
+        UIAutomationInitializerInThread=contextlib.nullcontext,
+    )
+    module(
+        "win32con",
+        WM_INPUTLANGCHANGEREQUEST=0x0050,
+        WM_IME_CONTROL=0x0283,
+        WM_QUIT=0x0012,
+    )
+    module(
+        "win32gui",
+        GetForegroundWindow=lambda: state.focused or 0,
+        PostMessage=lambda *args: None,
+        IsWindow=is_window,
+        IsWindowVisible=lambda hwnd: True,
+        GetWindowText=window_text,
+        EnumWindows=enum_windows,
+    )
+    module("win32process", GetWindowThreadProcessId=lambda hwnd: (1, 1))
+    module(
+        "win32api",
+        GetKeyboardLayout=lambda thread_id: state.keyboard_layout,
+        PostMessage=lambda *args: None,
+        SendMessage=lambda *args: 0,
+    )
+    module("screeninfo", get_monitors=lambda: list(state.monitors))
+    module("pyperclip", paste=lambda: state.clipboard, copy=copy)
+    return modules
+
+
+def install(state: Optional[FakeDesktopState] = None) -> FakeDesktopState:
+    """
+    把桩模块放入 sys.modules, 之后导入的小工具模块都会使用桩.
+
+    Returns:
+        桩使用的状态.
+    """
+    state = FakeDesktopState() if state is None else state
+    sys.modules.update(build_stub_modules(state))
+    if not hasattr(ctypes, "windll"):
+        ctypes.windll = _FakeDll()
+    if not hasattr(ctypes, "WINFUNCTYPE"):
+        ctypes.WINFUNCTYPE = ctypes.CFUNCTYPE
+    return state
@@ -1,14 +1,19 @@
 import logging
-import time
-import os
 import subprocess
 import toml
 import traceback
 from pathlib import Path
 import psutil
 
-CONFIG_TOML = "guard_running_config.toml"
-LOG_FILE = "guard_running.log"
+from gadgets.log import setup_logging
+from gadgets.scheduler import Scheduler
+from gadgets.single_instance import SingleInstance
+
+BASE_DIR = Path(__file__).parent
+CONFIG_TOML = BASE_DIR / "guard_running_config.toml"
+LOG_FILE = BASE_DIR / "guard_running.log"
+
+logger = logging.getLogger(__name__)
 
 PROCESS_NAME_KEY = "process_name"
 LAUNCH_COMMAND_KEY = "launch_command"
@@ -32,7 +37,7 @@ def load_config(conf=CONFIG_TOML):
     """
     with open(conf, "r", encoding="utf-8") as r:
         rst = toml.load(r)
-        print(rst)
+        logger.debug(rst)
     gp = rst[GUARD_PAIR_KEY]
     for p in gp:
         assert isinstance(p, dict)
@@ -55,22 +60,7 @@ def find_process(name: str):
 
 
 def main():
-    os.chdir(Path(__file__).parent)
-    try:
-        os.remove(LOG_FILE)
-    except FileNotFoundError:
-        pass
-    logger = logging.Logger(Path(__file__).stem)
-    logger.addHandler(logging.FileHandler(LOG_FILE))
-    formatter = logging.Formatter(
-        "%(asctime)s | %(name)s | %(levelname)s | %(message)s"
-    )
-    file_handler = logging.FileHandler(LOG_FILE)
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(formatter)
-    logger.addHandler(stream_handler)
+    setup_logging("guard_running", LOG_FILE)
 
     try:
         conf = load_config()
@@ -78,22 +68,28 @@ def main():
         logger.error(traceback.format_exc())
         exit()
     gp = conf[GUARD_PAIR_KEY]
-    interval = conf[INTERVAL_TIME_KEY]
 
-    while True:
-        try:
-            for p in gp:
-                pname = p[PROCESS_NAME_KEY]
-                cmd = p[LAUNCH_COMMAND_KEY]
-                if not find_process(pname):
-                    subprocess.Popen(
-                        cmd,
-                        shell=True,
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL,
-                    )
-                    logger.info(f"Started new process: {cmd}")
-        except Exception:
-            err = traceback.format_exc()
-            logger.error(err)
-        time.sleep(interval)
+    def guard():
+        for p in gp:
+            pname = p[PROCESS_NAME_KEY]
+            cmd = p[LAUNCH_COMMAND_KEY]
+            if not find_process(pname):
+                subprocess.Popen(
+                    cmd,
+                    shell=True,
+                    cwd=BASE_DIR,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+                logger.info(f"Started new process: {cmd}")
+
+    # 异常由调度器记录到本模块的 logger (即日志文件), 下一个周期继续检查.
+    scheduler = Scheduler()
+    scheduler.every(conf[INTERVAL_TIME_KEY], guard, run_now=True)
+    # 已有实例时让其退出, 以免同一个进程被重复启动.
+    with SingleInstance(
+        "guardrun",
+        on_shutdown=scheduler.stop,
+        status=lambda: {"tasks": scheduler.stats()},
+    ):
+        scheduler.run()
@@ -0,0 +1,278 @@
+"""
+输入法状态机.
+
+由事件驱动 (焦点窗口变化, 输入法变化, 快捷键), 没有事件时按自适应的间隔轮询兜底.
+焦点变化时恢复该窗口上次的输入法, 没有记录的窗口才使用默认策略.
+微软拼音输入法的输入模式总是保持为中文, 因此不记录输入模式.
+系统调用都通过 `ImeBackend` 完成, 因此可以用假的后端和事件源在 Linux 上运行.
+"""
+
+import collections
+import enum
+import logging
+import queue
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Callable, Hashable, Optional, Protocol
+
+ENGLISH = 1033
+CHINESE = 2052
+
+logger = logging.getLogger(__name__)
+
+
+class EventKind(enum.Enum):
+    FOREGROUND = enum.auto()  # 焦点窗口变化.
+    LANGUAGE = enum.auto()  # 输入法 / 输入模式变化.
+    POLL = enum.auto()  # 等待超时, 轮询兜底.
+    ESCAPE = enum.auto()  # 切换回英文的快捷键.
+    STOP = enum.auto()
+
+
+@dataclass(frozen=True)
+class Event:
+    kind: EventKind
+    hwnd: Optional[int] = None
+
+
+class ImeBackend(Protocol):
+    def foreground_window(self) -> Optional[int]: ...
+
+    def input_method(self, hwnd: int) -> Optional[int]:
+        """
+        Returns:
+            键盘布局, 见 `ENGLISH` / `CHINESE`.
+        """
+
+    def input_mode(self, hwnd: int) -> Optional[int]:
+        """
+        Returns:
+            输入模式, 最低位为 1 表示中文.
+        """
+
+    def set_input_method(self, hwnd: int, locale: int): ...
+
+    def set_input_mode(self, hwnd: int, mode: int): ...
+
+    def is_window(self, hwnd: int) -> bool: ...
+
+    def process_id(self, hwnd: int) -> Optional[int]: ...
+
+    def process_exists(self, pid: int) -> bool: ...
+
+
+class AdaptiveInterval:
+    """
+    轮询间隔: 有事件时重置为最小值, 每次空闲轮询后乘以 factor, 直到最大值.
+    """
+
+    def __init__(self, minimum=0.05, maximum=1.0, factor=2.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.current = minimum
+
+    def reset(self):
+        self.current = self.minimum
+
+    def backoff(self):
+        self.current = min(self.current * self.factor, self.maximum)
+
+
+@dataclass(frozen=True)
+class ImeState:
+    method: Optional[int]
+
+
+class ImeMemory:
+    """
+    窗口 (或进程) -> 最近一次的输入法状态, 容量有限, 超出时淘汰最久未使用的.
+    """
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self._items: collections.OrderedDict[Hashable, ImeState] = (
+            collections.OrderedDict()
+        )
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key) -> Optional[ImeState]:
+        state = self._items.get(key)
+        if state is not None:
+            self._items.move_to_end(key)
+        return state
+
+    def put(self, key, state: ImeState):
+        self._items[key] = state
+        self._items.move_to_end(key)
+        while len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+
+    def prune(self, alive: Callable[[Hashable], bool]) -> int:
+        """
+        删除已经关闭的窗口 (或已经退出的进程).
+
+        Returns:
+            删除的条目数.
+        """
+        dead = [key for key in self._items if not alive(key)]
+        for key in dead:
+            del self._items[key]
+        return len(dead)
+
+
+class ImeController:
+    """
+    Params:
+        backend: 系统调用后端.
+        ime_resetting: 焦点切换到没有记录的窗口时是否切换为英文输入法.
+        memory: 每个窗口的输入法状态记录, 为 None 时不记录,
+            每次焦点变化都按 ime_resetting 处理.
+        memory_scope: "window" 按窗口记录, "process" 按进程记录.
+        prune_interval: 清理已关闭窗口记录的最小间隔 (秒).
+        settle_time: 切换输入法后等待其生效的时间 (秒), 期间不记录状态.
+    """
+
+    def __init__(
+        self,
+        backend: ImeBackend,
+        ime_resetting=True,
+        memory: Optional[ImeMemory] = None,
+        memory_scope="window",
+        prune_interval=30.0,
+        settle_time=0.5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.backend = backend
+        self.ime_resetting = ime_resetting
+        self.memory = memory
+        self.memory_scope = memory_scope
+        self.prune_interval = prune_interval
+        self.settle_time = settle_time
+        self.clock = clock
+        self.foreground = backend.foreground_window()
+        self.last_prune = clock()
+        # (hwnd, 目标输入法, 截止时间): 切换请求是异步的, 生效前不记录状态.
+        self.pending: Optional[tuple[int, int, float]] = None
+
+    def handle(self, event: Event) -> bool:
+        """
+        Returns:
+            是否继续运行.
+        """
+        if event.kind is EventKind.STOP:
+            return False
+        foreground = self.backend.foreground_window()
+        if foreground is None:
+            return True
+        if event.kind is EventKind.ESCAPE:
+            logger.info("Escape: switch to eng")
+            self.set_input_method(foreground, ENGLISH)
+        if foreground != self.foreground:
+            self.foreground = foreground
+            self.on_focus_change(foreground)
+        self.observe(foreground, self.keep_chinese_mode(foreground))
+        if event.kind is EventKind.POLL:
+            self.prune()
+        return True
+
+    def memory_key(self, hwnd: int):
+        if self.memory_scope == "process":
+            return "pid", self.backend.process_id(hwnd)
+        return hwnd
+
+    def set_input_method(self, hwnd: int, locale: int):
+        self.backend.set_input_method(hwnd, locale)
+        self.pending = hwnd, locale, self.clock() + self.settle_time
+
+    def on_focus_change(self, hwnd: int):
+        remembered = None
+        if self.memory is not None:
+            remembered = self.memory.get(self.memory_key(hwnd))
+        if remembered is None:
+            if self.ime_resetting:
+                target = ImeState(ENGLISH)
+            else:
+                return
+        else:
+            target = remembered
+        # 状态一致时不发送消息. 输入模式由 keep_chinese_mode 负责.
+        if target.method is not None:
+            if self.backend.input_method(hwnd) != target.method:
+                self.set_input_method(hwnd, target.method)
+
+    def keep_chinese_mode(self, hwnd: int) -> ImeState:
+        """
+        微软拼音输入法被切换为英文模式时切换回中文模式.
+
+        Returns:
+            当前的状态.
+        """
+        method = self.backend.input_method(hwnd)
+        if method == CHINESE:
+            mode = self.backend.input_mode(hwnd)
+            if mode is not None and mode & 0x01 == 0:
+                self.backend.set_input_mode(hwnd, 1)
+        return ImeState(method)
+
+    def observe(self, hwnd: int, state: ImeState):
+        if self.memory is None or state.method is None:
+            return
+        if self.pending is not None:
+            pending_hwnd, target, deadline = self.pending
+            if pending_hwnd == hwnd and state.method != target:
+                if self.clock() < deadline:
+                    return
+            self.pending = None
+        self.memory.put(self.memory_key(hwnd), state)
+
+    def prune(self):
+        if self.memory is None or self.clock() - self.last_prune < self.prune_interval:
+            return
+        self.last_prune = self.clock()
+
+        def alive(key):
+            if isinstance(key, tuple):
+                return self.backend.process_exists(key[1])
+            return self.backend.is_window(key)
+
+        removed = self.memory.prune(alive)
+        if removed:
+            logger.debug(f"Pruned {removed} closed windows from IME memory")
+
+
+def run(
+    controller: ImeController,
+    events: queue.Queue,
+    interval: Optional[AdaptiveInterval] = None,
+    tick: Optional[Callable[[], bool]] = None,
+):
+    """
+    事件循环, 收到 STOP 事件或者 tick 返回 True 时退出.
+
+    Params:
+        events: 事件队列, 事件源和快捷键线程向其中放入 `Event`.
+        interval: 轮询兜底的间隔.
+        tick: 每次循环都会调用.
+    """
+    interval = AdaptiveInterval() if interval is None else interval
+    while True:
+        try:
+            event = events.get(timeout=interval.current)
+            interval.reset()
+        except queue.Empty:
+            event = Event(EventKind.POLL)
+            interval.backoff()
+        try:
+            if not controller.handle(event):
+                break
+            if tick is not None and tick():
+                break
+        except Exception:
+            logger.error(traceback.format_exc())
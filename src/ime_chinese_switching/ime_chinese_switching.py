@@ -3,38 +3,74 @@
 """
 
 import logging
-import os
 import queue
-import traceback
 from pathlib import Path
 import ctypes
-import time
-from typing import Callable
+from ctypes import wintypes
+from threading import Thread
 import sys
 import subprocess
 
+import psutil
 import win32con
 import win32gui
 import win32process
 from win32api import GetKeyboardLayout, PostMessage, SendMessage
 
-IME_RESETTING = True
+from gadgets.chord import ChordDetector, pynput_key_id
+from gadgets.log import setup_logging
+from gadgets.scheduler import Throttle
+from gadgets.single_instance import SingleInstance
+from ime_chinese_switching.controller import (
+    AdaptiveInterval,
+    Event,
+    EventKind,
+    ImeController,
+    ImeMemory,
+    run,
+)
+
+logger = logging.getLogger(__name__)
+
+IME_RESETTING = True  # 焦点切换到没有记录的窗口时切换为英文输入法.
+# 记录每个窗口 (或进程) 的输入法状态, 焦点切换回来时恢复.
+IME_MEMORY = True
+IME_MEMORY_SCOPE = "window"  # "window" 或 "process".
+IME_MEMORY_SIZE = 256
 ESCAPE_SWITCHING = True
+# 没有事件时的轮询间隔 (秒), 有事件后重置为最小值, 之后逐渐增加到最大值.
+POLL_MIN_INTERVAL = 0.05
+POLL_MAX_INTERVAL = 1.0
 
 # NI_CONTEXTUPDATED 查看 immdev.h 发现以下内容, 但是在 learn microsoft 文档中没有记录:
 IMC_SETCONVERSIONMODE = 0x0002
 IMC_SETSENTENCEMODE = 0x0004
 IMC_SETOPENSTATUS = 0x0006
 
+EVENT_SYSTEM_FOREGROUND = 0x0003
+EVENT_OBJECT_IME_CHANGE = 0x8029
+WINEVENT_OUTOFCONTEXT = 0x0000
+WINEVENTPROC = ctypes.WINFUNCTYPE(
+    None,
+    wintypes.HANDLE,
+    wintypes.DWORD,
+    wintypes.HWND,
+    wintypes.LONG,
+    wintypes.LONG,
+    wintypes.DWORD,
+    wintypes.DWORD,
+)
+
 
 # 获取当前输入法布局（返回低 16 位的布局标识符）
-def get_input_method():
+def get_input_method(hwnd=None):
     """
     Returns:
         - 1033 是英文输入法.
         - 2052 是微软拼音输入法.
     """
-    hwnd = win32gui.GetForegroundWindow()
+    if hwnd is None:
+        hwnd = win32gui.GetForegroundWindow()
     if hwnd:
         thread_id, _ = win32process.GetWindowThreadProcessId(hwnd)
         # 获取当前线程的键盘布局（HKL）
@@ -44,10 +80,10 @@ def get_input_method():
     return None
 
 
-def switch_input_mode(mode):
+def switch_input_mode(mode, hwnd=None):
     if mode < 0:
         return
-    foreground_window = win32gui.GetForegroundWindow()
+    foreground_window = win32gui.GetForegroundWindow() if hwnd is None else hwnd
     foreground_ime = ctypes.windll.imm32.ImmGetDefaultIMEWnd(foreground_window)
     if foreground_ime:
         SendMessage(
@@ -55,7 +91,7 @@ def switch_input_mode(mode):
         )
 
 
-def get_input_mode() -> int | None:
+def get_input_mode(hwnd=None) -> int | None:
     """
     API: https://learn.microsoft.com/en-us/previous-versions/aa913780(v=msdn.10)
     对于 Microsoft 旧版中文输入法（Windows 10 及之前）:
@@ -67,7 +103,7 @@ def get_input_mode() -> int | None:
           1024: 英文 / 全角（Bit10 和 Bit1 用于表示）
           1025: 中文 / 全角
     """
-    foreground_window = win32gui.GetForegroundWindow()
+    foreground_window = win32gui.GetForegroundWindow() if hwnd is None else hwnd
     foreground_ime = ctypes.windll.imm32.ImmGetDefaultIMEWnd(foreground_window)
     if foreground_ime:
         result = SendMessage(foreground_ime, win32con.WM_IME_CONTROL, 0x01, 0)
@@ -75,26 +111,84 @@ def get_input_mode() -> int | None:
     return None
 
 
-def switch_input_method(locale):
+def switch_input_method(locale, hwnd=None):
     if locale < 0:
         return
-    hwnd = win32gui.GetForegroundWindow()
+    if hwnd is None:
+        hwnd = win32gui.GetForegroundWindow()
     PostMessage(hwnd, win32con.WM_INPUTLANGCHANGEREQUEST, 0, locale)
 
 
-prev_foreground_window = win32gui.GetForegroundWindow()
+class Win32Backend:
+    def foreground_window(self):
+        return win32gui.GetForegroundWindow() or None
+
+    def input_method(self, hwnd):
+        return get_input_method(hwnd)
+
+    def input_mode(self, hwnd):
+        return get_input_mode(hwnd)
+
+    def set_input_method(self, hwnd, locale):
+        switch_input_method(locale, hwnd)
+
+    def set_input_mode(self, hwnd, mode):
+        switch_input_mode(mode, hwnd)
 
+    def is_window(self, hwnd):
+        return bool(win32gui.IsWindow(hwnd))
 
-def ime_resetting():
+    def process_id(self, hwnd):
+        _, pid = win32process.GetWindowThreadProcessId(hwnd)
+        return pid
+
+    def process_exists(self, pid):
+        return psutil.pid_exists(pid)
+
+
+class WinEventSource:
     """
-    当焦点窗口变化的时候, 重置输入法为英文输入法(1033).
+    通过 SetWinEventHook 监听焦点窗口变化和输入法变化, 把事件放入队列.
     """
-    global prev_foreground_window
-    foreground_window = win32gui.GetForegroundWindow()
-    if prev_foreground_window != foreground_window:
-        prev_foreground_window = foreground_window
-        switch_input_method(1033)
-        prev_foreground_window = foreground_window
+
+    def __init__(self, events: queue.Queue):
+        self.events = events
+        self.thread_id = None
+        # 保存回调的引用, 防止被垃圾回收.
+        self._proc = WINEVENTPROC(self._callback)
+
+    def _callback(self, hook, event, hwnd, id_object, id_child, thread, time_ms):
+        if event == EVENT_SYSTEM_FOREGROUND:
+            self.events.put(Event(EventKind.FOREGROUND, hwnd))
+        else:
+            self.events.put(Event(EventKind.LANGUAGE, hwnd))
+
+    def _run(self):
+        user32 = ctypes.windll.user32
+        self.thread_id = ctypes.windll.kernel32.GetCurrentThreadId()
+        hooks = [
+            user32.SetWinEventHook(
+                event, event, 0, self._proc, 0, 0, WINEVENT_OUTOFCONTEXT
+            )
+            for event in (EVENT_SYSTEM_FOREGROUND, EVENT_OBJECT_IME_CHANGE)
+        ]
+        msg = wintypes.MSG()
+        # 回调在消息循环中被调用.
+        while user32.GetMessageW(ctypes.byref(msg), 0, 0, 0) > 0:
+            user32.TranslateMessage(ctypes.byref(msg))
+            user32.DispatchMessageW(ctypes.byref(msg))
+        for hook in hooks:
+            if hook:
+                user32.UnhookWinEvent(hook)
+
+    def start(self):
+        Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        if self.thread_id is not None:
+            ctypes.windll.user32.PostThreadMessageW(
+                self.thread_id, win32con.WM_QUIT, 0, 0
+            )
 
 
 def register_escape_switching(q: queue.Queue):
@@ -102,44 +196,28 @@ def register_escape_switching(q: queue.Queue):
     注册 Ctrl + [ 快捷键切换输入法.
 
     Params:
-        q: 触发队列
+        q: 事件队列, 触发时放入 ESCAPE 事件, 立即唤醒主循环.
     """
     from pynput import keyboard
-    from threading import Thread
 
     def on_activate():
         # switch_input_method(1033) # 不知道为什么失效了
-        q.put(None)
+        q.put(Event(EventKind.ESCAPE))
+
+    detector = ChordDetector(
+        [(keyboard.Key.ctrl, keyboard.Key.ctrl_l, keyboard.Key.ctrl_r)],
+        ("[", "\x1b"),
+        on_activate,
+    )
+
+    # 回调返回 False 会让 pynput 停止监听, 所以不直接返回 detector 的结果.
+    def on_press(key):
+        detector.press(pynput_key_id(key))
+
+    def on_release(key):
+        detector.release(pynput_key_id(key))
 
     def listen_hotkey():
-        current_keys = set()
-
-        def on_press(key):
-            try:
-                current_keys.add(key.char)
-            except AttributeError:
-                current_keys.add(key)
-            check_hotkey()
-
-        def on_release(key):
-            try:
-                current_keys.remove(key.char)
-            except Exception:
-                try:
-                    current_keys.remove(key)
-                except Exception:
-                    pass
-
-        def check_hotkey():
-            if (
-                keyboard.Key.ctrl in current_keys
-                or keyboard.Key.ctrl_l in current_keys
-                or keyboard.Key.ctrl_r in current_keys
-            ) and ("[" in current_keys or "\x1b" in current_keys):
-                logging.info("Escape: switch to eng")
-                on_activate()
-
-        # 创建一个监听器
         with keyboard.Listener(on_press=on_press, on_release=on_release) as listener:
             listener.join()
 
@@ -148,72 +226,6 @@ def register_escape_switching(q: queue.Queue):
     hotkey_thread.start()
 
 
-class Restarter:
-    FILE_LOCK = "restart.lock"
-
-    def __init__(self):
-        self.lock = Path(__file__).parent.joinpath(self.FILE_LOCK).resolve()
-
-    def clear_lock(self):
-        self.lock.unlink(missing_ok=True)
-
-    def should_restart(self):
-        with open(self.lock, "a+") as r:
-            r.seek(0)
-            if "restart" in r.read():
-                return True
-        return False
-
-    def notify_restart(self, timeout=1):
-        if not self.lock.exists():
-            self.lock.touch(exist_ok=True)
-            return
-        with open(self.lock, "w") as w:
-            w.write("restart")
-        start_time = time.time()
-        while time.time() - start_time < timeout and self.lock.exists():
-            time.sleep(0.3)
-        with open(self.lock, "w"):
-            pass
-
-
-class Throttler:
-    def __init__(self, func: Callable, interval: float, /, *args, **kwargs):
-        self.func = func
-        self.args = args
-        self.kwargs = kwargs
-        self.interval = interval
-        self.last_time = 0
-
-    def __call__(self):
-        now = time.time()
-        if now - self.last_time >= self.interval:
-            rst = self.func(*self.args, **self.kwargs)
-            self.last_time = now
-            return rst
-        return None
-
-    def throttle(self):
-        return self()
-
-
-def init_logging():
-    path = Path(__file__).resolve()
-    logfile = path.with_suffix(".log")
-    os.remove(logfile)
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-    s_handler = logging.StreamHandler()
-    f_handler = logging.FileHandler(logfile)
-    s_handler.setFormatter(formatter)
-    f_handler.setFormatter(formatter)
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-    logger.addHandler(s_handler)
-    logger.addHandler(f_handler)
-
-
 def self_restart():
     if getattr(sys, "frozen", False):
         subprocess.Popen([sys.executable, *sys.argv[1:]])
@@ -223,39 +235,45 @@ def self_restart():
 
 
 def main():
-    os.chdir(Path(__file__).parent)
     path = Path(__file__).resolve()
-    init_logging()
-    logging.info(f"Script start: {path}")
-    logging.info("Restart checking...")
-    restarter = Restarter()
-    restarter.notify_restart()
-    logging.info("Restart checked")
-    logging.info("Script running...")
-    should_restart = Throttler(restarter.should_restart, 1)
-    ticker = Throttler(lambda: print(f"Ticking {time.asctime()}"), 5)
-    esc_queue = queue.Queue()
-
-    if ESCAPE_SWITCHING:
-        register_escape_switching(esc_queue)
-    try:
-        while True:
-            try:
-                method = get_input_method()
-                mode = get_input_mode()
-                if method == 2052 and mode & 0x01 == 0:
-                    switch_input_mode(1)
-                if IME_RESETTING:
-                    ime_resetting()
-                if not esc_queue.empty():
-                    esc_queue.get()
-                    switch_input_method(1033)
-                if should_restart():
-                    break
-                ticker()
-                time.sleep(0.1)
-            except Exception:
-                logging.error(traceback.format_exc())
-                # self_restart()
-    finally:
-        restarter.clear_lock()
+    setup_logging(
+        "ime_chinese_switching", path.with_suffix(".log"), level=logging.DEBUG
+    )
+    logger.info(f"Script start: {path}")
+    ticker = Throttle(5, lambda: logger.debug("Ticking"))
+    events = queue.Queue()
+    controller = ImeController(
+        Win32Backend(),
+        IME_RESETTING,
+        ImeMemory(IME_MEMORY_SIZE) if IME_MEMORY else None,
+        IME_MEMORY_SCOPE,
+    )
+
+    def status():
+        memory = controller.memory
+        return {
+            "foreground": controller.foreground,
+            "memory": 0 if memory is None else len(memory),
+        }
+
+    logger.info("Taking over previous instance...")
+    # 已有实例时让其立即退出.
+    with SingleInstance(
+        "imeswitch",
+        on_shutdown=lambda: events.put(Event(EventKind.STOP)),
+        status=status,
+    ):
+        logger.info("Script running...")
+        event_source = WinEventSource(events)
+        event_source.start()
+        if ESCAPE_SWITCHING:
+            register_escape_switching(events)
+        try:
+            run(
+                controller,
+                events,
+                AdaptiveInterval(POLL_MIN_INTERVAL, POLL_MAX_INTERVAL),
+                ticker,
+            )
+        finally:
+            event_source.stop()
@@ -1,16 +1,300 @@
+import argparse
+import json
 import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable, Optional
 
-appdata = Path(os.getenv("APPDATA"))
-pwsh_hs_dir = appdata / "Microsoft" / "Windows" / "PowerShell" / "PSReadLine"
+from remove_pwsh_history.scrub import (
+    DEDUPE_MODES,
+    ConcurrentModification,
+    load_rules,
+    scrub_file,
+)
 
-def remove_history():
-    if pwsh_hs_dir.exists():
-        for f in pwsh_hs_dir.iterdir():
-            if f.name.endswith("_history.txt"):
-                f.unlink()
-                print(f"Removing {f}")
+HISTORY_SUFFIX = "_history.txt"
+# zsh 的 EXTENDED_HISTORY 格式: ": <开始时间>:<耗时>;<命令>".
+ZSH_TIMESTAMP = re.compile(r": \d+:\d+;")
 
-def main():
-    os.chdir(Path(__file__).parent)
-    remove_history()
\ No newline at end of file
+
+def strip_zsh_timestamp(entry: str) -> str:
+    """
+    去掉 zsh 历史记录的时间戳, 使同一条命令在不同时间执行时也能去重.
+    """
+    m = ZSH_TIMESTAMP.match(entry)
+    return entry[m.end() :] if m else entry
+
+
+@dataclass(frozen=True)
+class Shell:
+    """
+    Params:
+        patterns: 历史记录文件相对于用户目录的 glob.
+        continuation: 续行符, 为 None 时每行都是一条命令.
+        dedupe_key: 去重前对命令的变换, 见 `scrub_file` 的 key.
+    """
+
+    patterns: tuple[str, ...]
+    continuation: Optional[str] = None
+    dedupe_key: Optional[Callable[[str], str]] = None
+
+
+SHELLS = {
+    "pwsh": Shell(
+        (
+            f"AppData/Roaming/Microsoft/Windows/PowerShell/PSReadLine/*{HISTORY_SUFFIX}",
+            f".local/share/powershell/PSReadLine/*{HISTORY_SUFFIX}",
+        ),
+        "`",
+    ),
+    # bash 的历史记录每行一条命令, 行尾的反斜杠不表示续行.
+    "bash": Shell((".bash_history",)),
+    "zsh": Shell((".zsh_history", ".zhistory"), "\\", strip_zsh_timestamp),
+    "python": Shell((".python_history",)),
+}
+
+
+@dataclass(frozen=True)
+class HistoryFile:
+    path: Path
+    shell: str
+
+
+def default_history_dir() -> Optional[Path]:
+    """
+    Returns:
+        PSReadLine 的历史记录目录, 没有 APPDATA 环境变量时返回 None.
+    """
+    appdata = os.getenv("APPDATA")
+    if appdata is None:
+        return None
+    return Path(appdata) / "Microsoft" / "Windows" / "PowerShell" / "PSReadLine"
+
+
+def history_files(history_dir: Path) -> list[HistoryFile]:
+    """
+    Returns:
+        PSReadLine 历史记录目录中的历史记录文件.
+    """
+    if not history_dir.is_dir():
+        return []
+    return [
+        HistoryFile(f, "pwsh")
+        for f in history_dir.iterdir()
+        if f.name.endswith(HISTORY_SUFFIX) and f.is_file()
+    ]
+
+
+def find_history(root: Path, shells) -> list[HistoryFile]:
+    """
+    Params:
+        root: 用户目录.
+        shells: `SHELLS` 中的名字.
+    """
+    rst = []
+    for name in shells:
+        for pattern in SHELLS[name].patterns:
+            rst.extend(HistoryFile(p, name) for p in root.glob(pattern) if p.is_file())
+    return rst
+
+
+def clean_file(
+    f: HistoryFile, scrub_options: Optional[dict] = None, dry_run=False
+) -> dict:
+    """
+    删除或清理 (scrub_options 不为 None 时) 一个历史记录文件.
+
+    Returns:
+        报告中该文件的记录, 出错时包含 error.
+    """
+    record = {
+        "path": str(f.path),
+        "shell": f.shell,
+        "action": "remove" if scrub_options is None else "scrub",
+    }
+    try:
+        if scrub_options is None:
+            size = f.path.stat().st_size
+            if not dry_run:
+                f.path.unlink()
+            record.update(bytes_in=size, bytes_out=0)
+        else:
+            stats = scrub_file(
+                f.path,
+                continuation=SHELLS[f.shell].continuation,
+                key=SHELLS[f.shell].dedupe_key,
+                dry_run=dry_run,
+                **scrub_options,
+            )
+            record.update(stats.to_dict())
+        record["bytes_reclaimed"] = record["bytes_in"] - record["bytes_out"]
+    except (OSError, ConcurrentModification) as e:
+        record["error"] = str(e)
+    return record
+
+
+def clean(
+    roots: list[Path],
+    history_dirs: list[Path],
+    shells,
+    scrub_options: Optional[dict] = None,
+    dry_run=False,
+    jobs: Optional[int] = None,
+) -> dict:
+    """
+    在线程池中并发地查找并清理历史记录.
+
+    Params:
+        roots: 用户目录, 在其中查找 shells 的历史记录.
+        history_dirs: PSReadLine 的历史记录目录.
+        jobs: 线程数, 默认由 ThreadPoolExecutor 决定.
+
+    Returns:
+        报告.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(jobs) as pool:
+        found = [
+            *pool.map(lambda root: find_history(root, shells), roots),
+            *pool.map(history_files, history_dirs),
+        ]
+        # 同一个文件可能被多个目录匹配到.
+        files = list({f.path.resolve(): f for group in found for f in group}.values())
+        records = list(pool.map(lambda f: clean_file(f, scrub_options, dry_run), files))
+    ok = [r for r in records if "error" not in r]
+    return {
+        "dry_run": dry_run,
+        "action": "remove" if scrub_options is None else "scrub",
+        "files": records,
+        "files_touched": sum(
+            1 for r in ok if r["action"] == "remove" or r["bytes_reclaimed"]
+        ),
+        "bytes_reclaimed": sum(r["bytes_reclaimed"] for r in ok),
+        "errors": len(records) - len(ok),
+        "elapsed_s": round(time.perf_counter() - start, 3),
+    }
+
+
+def print_report(report: dict):
+    prefix = "[dry run] " if report["dry_run"] else ""
+    for r in report["files"]:
+        if "error" in r:
+            print(f"{prefix}Failed {r['path']}: {r['error']}", file=sys.stderr)
+        elif r["action"] == "remove":
+            print(f"{prefix}Removing {r['path']}")
+        else:
+            print(
+                f"{prefix}Scrubbed {r['path']}: {r['entries_in']} -> {r['entries_out']} entries "
+                f"({r['secrets']} secrets, {r['duplicates']} duplicates, "
+                f"{r['trimmed']} trimmed), {r['bytes_in']} -> {r['bytes_out']} bytes"
+            )
+            if r.get("bloom_overflowed"):
+                print(
+                    f"{prefix}Warning: {r['path']} has more distinct commands than "
+                    "--bloom-capacity, some of them may have been removed as duplicates",
+                    file=sys.stderr,
+                )
+    print(
+        f"{prefix}{report['files_touched']} files touched, "
+        f"{report['bytes_reclaimed']} bytes reclaimed, {report['errors']} errors"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clean shell history files")
+    parser.add_argument(
+        "--history-dir",
+        type=Path,
+        action="append",
+        default=[],
+        help="PSReadLine 历史记录目录, 可以指定多次. "
+        "没有指定任何目录时为 %%APPDATA%%/Microsoft/Windows/PowerShell/PSReadLine",
+    )
+    parser.add_argument(
+        "--root",
+        type=Path,
+        action="append",
+        default=[],
+        help="用户目录, 在其中查找 --shell 指定的 shell 的历史记录, 可以指定多次",
+    )
+    parser.add_argument(
+        "--profiles",
+        type=Path,
+        action="append",
+        default=[],
+        help="包含多个用户目录的目录, 比如 C:\\Users 或 /home, 其中每个子目录都视为 --root",
+    )
+    parser.add_argument(
+        "--shell",
+        default="pwsh",
+        help=f"逗号分隔的 shell: {', '.join(SHELLS)}, 或者 all (默认: pwsh)",
+    )
+    parser.add_argument(
+        "--scrub",
+        action="store_true",
+        help="改写历史记录而不是删除: 删除含有敏感信息的命令, 去除重复的命令",
+    )
+    parser.add_argument(
+        "--rules", type=Path, help="额外的敏感信息规则文件, 每行一个正则表达式"
+    )
+    parser.add_argument(
+        "--no-default-rules", action="store_true", help="不使用内置的敏感信息规则"
+    )
+    parser.add_argument("--dedupe", choices=DEDUPE_MODES, default="exact")
+    parser.add_argument(
+        "--bloom-capacity",
+        type=int,
+        default=1_000_000,
+        help="--dedupe bloom 时预计的不重复命令数, 超过后会误删命令 (默认: 1000000)",
+    )
+    parser.add_argument("--keep-last", type=int, help="只保留最后的 N 条命令")
+    parser.add_argument("--dry-run", action="store_true", help="只统计, 不修改文件")
+    parser.add_argument("-j", "--jobs", type=int, help="线程数")
+    parser.add_argument("--report", help="把 json 报告写入此文件, - 表示标准输出")
+    args = parser.parse_args(argv)
+
+    shells = list(SHELLS) if args.shell == "all" else args.shell.split(",")
+    unknown = [name for name in shells if name not in SHELLS]
+    if unknown:
+        parser.error(f"unknown shells: {', '.join(unknown)}")
+    roots = list(args.root)
+    for profiles in args.profiles:
+        if profiles.is_dir():
+            roots.extend(p for p in profiles.iterdir() if p.is_dir())
+    history_dirs = list(args.history_dir)
+    if not roots and not history_dirs:
+        history_dir = default_history_dir()
+        if history_dir is not None:
+            history_dirs.append(history_dir)
+        else:  # 非 Windows 系统.
+            roots.append(Path.home())
+
+    scrub_options = None
+    if args.scrub:
+        try:
+            rules = load_rules(args.rules, not args.no_default_rules)
+        except (OSError, re.error) as e:
+            print(f"Invalid rules: {e}", file=sys.stderr)
+            sys.exit(1)
+        scrub_options = {
+            "rules": rules,
+            "dedupe": args.dedupe,
+            "keep_last": args.keep_last,
+            "bloom_capacity": args.bloom_capacity,
+        }
+
+    report = clean(roots, history_dirs, shells, scrub_options, args.dry_run, args.jobs)
+    if args.report == "-":
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+        if args.report:
+            Path(args.report).write_text(
+                json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8"
+            )
+    if report["errors"]:
+        sys.exit(1)
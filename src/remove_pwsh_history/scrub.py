@@ -0,0 +1,411 @@
+"""
+流式清理历史记录文件: 删除匹配敏感信息规则的命令, 去除重复的命令, 只保留最后 N 条命令.
+
+按块读取命令, 内存占用只和块大小以及去重用的哈希表 (或固定大小的布隆过滤器) 有关, 与文件大小无关.
+结果先写入同目录下的临时文件, 再通过重命名原子地替换原文件.
+"""
+
+import bisect
+import contextlib
+import itertools
+import math
+import operator
+import os
+import re
+import shutil
+import tempfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+ENCODING = "utf-8"
+BLOCK_CHARS = 1 << 20  # 每次匹配规则的文本长度.
+# 常见的敏感信息. 规则匹配的是转为小写的命令, 并且以字面量开头时匹配得更快.
+DEFAULT_RULES = [
+    r"password\s*[=:]\s*\S",
+    r"passwd\s*[=:]\s*\S",
+    r"pwd\s*[=:]\s*\S",
+    r"secret\s*[=:]\s*\S",
+    r"token\s*[=:]\s*\S",
+    r"api[_-]?key\s*[=:]\s*\S",
+    r"access[_-]?key\s*[=:]\s*\S",
+    r"-(?:password|token|apikey|secret|accesskey)\s+\S",  # 命令行参数.
+    r"convertto-securestring",
+    r"authorization:\s*(?:bearer|basic)\s+\S",
+    r"gh[pousr]_[a-z0-9]{36}",  # GitHub token.
+    r"github_pat_[a-z0-9_]{20}",
+    r"akia[0-9a-z]{16}",  # AWS access key.
+    r"sk-[a-z0-9_-]{20}",
+    r"xox[abprs]-[a-z0-9-]{10}",  # Slack token.
+    r"-----begin [a-z ]*private key-----",
+    r"://[^/\s:@]+:[^/\s@]+@",  # 带用户名和密码的 URL.
+]
+DEDUPE_MODES = ("exact", "bloom", "none")
+
+
+def load_rules(path: Optional[Path | str] = None, defaults=True) -> list[re.Pattern]:
+    """
+    读取规则文件. 规则匹配的是转为小写的命令, 因此规则中的字母应使用小写.
+
+    Params:
+        path: 规则文件, 每行一个正则表达式, 忽略空行和 # 开头的行.
+        defaults: 是否包含 `DEFAULT_RULES`.
+    """
+    rules = list(DEFAULT_RULES) if defaults else []
+    if path is not None:
+        with open(path, "r", encoding="utf-8") as r:
+            for line in r:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    rules.append(line)
+    return [re.compile(rule) for rule in rules]
+
+
+class BloomFilter:
+    """
+    固定大小的布隆过滤器, 用于在内存受限时去重, 有 error_rate 的概率把新命令误判为重复.
+
+    只用 4 个哈希函数, 以更多的位换取更少的探测 (error_rate 为 1e-4 时每条命令 38 位, 而不是 19 位),
+    加入的命令超过 capacity 后误判的概率会迅速升高, 见 `overflowed`.
+    """
+
+    HASHES = 4
+
+    def __init__(self, capacity=1_000_000, error_rate=1e-4):
+        k = self.HASHES
+        self.capacity = capacity
+        self.bits = max(
+            math.ceil(-k * capacity / math.log(1 - error_rate ** (1 / k))), 8
+        )
+        self.count = 0  # 判断为新命令的次数.
+        self._array = bytearray(self.bits // 8 + 1)
+
+    @property
+    def overflowed(self) -> bool:
+        return self.count > self.capacity
+
+    def add_many(self, hashes: Iterable[int]) -> list[bool]:
+        """
+        依次加入元素.
+
+        Params:
+            hashes: 元素的 64 位哈希值, 由它的两个 30 位的部分派生出 HASHES 个哈希值.
+
+        Returns:
+            每个元素加入前是否 (可能) 已经存在.
+        """
+        bits = self.bits
+        array = self._array
+        rst = []
+        append = rst.append
+        # 展开循环, 并且只用小整数运算, 这是去重时最热的代码.
+        for h in hashes:
+            h2 = (h >> 32) & 0x3FFFFFFF | 1
+            p0 = (h & 0x3FFFFFFF) % bits
+            p1 = (p0 + h2) % bits
+            p2 = (p1 + h2) % bits
+            p3 = (p2 + h2) % bits
+            b0, b1, b2, b3 = 1 << (p0 & 7), 1 << (p1 & 7), 1 << (p2 & 7), 1 << (p3 & 7)
+            p0, p1, p2, p3 = p0 >> 3, p1 >> 3, p2 >> 3, p3 >> 3
+            if array[p0] & b0 and array[p1] & b1 and array[p2] & b2 and array[p3] & b3:
+                append(True)
+            else:
+                array[p0] |= b0
+                array[p1] |= b1
+                array[p2] |= b2
+                array[p3] |= b3
+                append(False)
+        self.count += rst.count(False)
+        return rst
+
+
+def _line_ends(continuation: str) -> tuple[str, str]:
+    return f"{continuation}\n", f"{continuation}\r\n"
+
+
+def iter_entries(lines: Iterable[str], continuation="`") -> Iterator[str]:
+    """
+    把行合并为命令: 以续行符 (PSReadLine 中为反引号) 结尾的行和下一行属于同一条命令.
+    """
+    ends = _line_ends(continuation)
+    pending = []
+    for line in lines:
+        if line.endswith(ends):
+            pending.append(line)
+        elif pending:
+            pending.append(line)
+            yield "".join(pending)
+            pending = []
+        else:
+            yield line
+    if pending:
+        yield "".join(pending)
+
+
+def _secret_offsets(entries: list[str], text: str, rules: list[re.Pattern]) -> set[int]:
+    """
+    在整块文本上匹配规则, 跨越两条命令的匹配 (比如空白匹配了换行符) 只在所在的命令中重新匹配.
+
+    Params:
+        text: entries 连接成的字符串.
+
+    Returns:
+        entries 中匹配规则的命令的下标.
+    """
+    text = text.lower()
+    if len(text) == sum(map(len, entries)):
+        lowered = None
+        ends = list(itertools.accumulate(map(len, entries)))
+    else:  # 个别字符转为小写后长度会变化, 此时逐条计算位置.
+        lowered = [entry.lower() for entry in entries]
+        ends = list(itertools.accumulate(map(len, lowered)))
+
+    def entry(i: int) -> str:
+        if lowered is not None:
+            return lowered[i]
+        return text[ends[i - 1] if i else 0 : ends[i]]
+
+    hits = set()
+    for rule in rules:
+        pos = 0
+        while (m := rule.search(text, pos)) is not None:
+            i = bisect.bisect_right(ends, m.start())
+            if m.end() <= ends[i] or rule.search(entry(i)):
+                hits.add(i)
+            pos = ends[i]  # 从下一条命令继续, 同一条命令只需命中一次.
+    return hits
+
+
+def scan(
+    path: Path, rules: Optional[list[re.Pattern]], continuation: Optional[str] = "`"
+) -> Iterator[tuple[list[str], set[int]]]:
+    """
+    按块读取命令, 每块约 BLOCK_CHARS 个字符, 整块匹配规则.
+
+    Params:
+        continuation: 续行符, 为 None 时每行都是一条命令.
+
+    Returns:
+        (命令, 其中匹配规则的命令的下标), rules 为 None 时不匹配.
+    """
+    # surrogateescape 使非 utf-8 的字节原样写回, newline="" 保留原来的换行符.
+    with open(path, "r", encoding=ENCODING, errors="surrogateescape", newline="") as r:
+        ends = None if continuation is None else _line_ends(continuation)
+        carry = None  # 上一块末尾未结束的多行命令.
+        while True:
+            lines = r.readlines(BLOCK_CHARS)
+            if not lines:
+                if carry is not None:  # 最后一行以续行符结尾.
+                    hits = _secret_offsets([carry], carry, rules) if rules else set()
+                    yield [carry], hits
+                break
+            if carry is not None:
+                lines = [carry + lines[0], *lines[1:]]
+                carry = None
+            entries = lines
+            text = "".join(lines)
+            if continuation is not None and any(end in text for end in ends):
+                entries = list(iter_entries(lines, continuation))
+                if entries[-1].endswith(ends):
+                    carry = entries.pop()
+                    text = text[: len(text) - len(carry)]
+            if entries:
+                hits = _secret_offsets(entries, text, rules) if rules else set()
+                yield entries, hits
+
+
+def _runs(n: int, hits: set[int]) -> list[tuple[int, int]]:
+    """
+    Returns:
+        [0, n) 中去掉 hits 之后的连续区间.
+    """
+    runs = []
+    start = 0
+    for hit in sorted(hits):
+        if hit > start:
+            runs.append((start, hit))
+        start = hit + 1
+    if start < n:
+        runs.append((start, n))
+    return runs
+
+
+@contextlib.contextmanager
+def atomic_write(path: Path):
+    """
+    写入同目录下的临时文件, 正常退出时替换 path, 出错时删除临时文件.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with open(
+            fd, "w", encoding=ENCODING, errors="surrogateescape", newline=""
+        ) as w:
+            yield w
+            w.flush()
+            os.fsync(w.fileno())
+        if path.exists():
+            shutil.copymode(path, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
+
+
+class _CountingWriter:
+    """
+    只统计写入的字节数, 用于 dry run.
+    """
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, text: str):
+        self.bytes += len(text.encode(ENCODING, "surrogateescape"))
+
+
+@dataclass
+class ScrubStats:
+    path: str
+    entries_in: int = 0
+    entries_out: int = 0
+    secrets: int = 0
+    duplicates: int = 0
+    trimmed: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    bloom_overflowed: bool = (
+        False  # 不重复的命令超过了布隆过滤器的容量, 可能误删了命令.
+    )
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class ConcurrentModification(RuntimeError):
+    """
+    清理期间文件被修改 (比如 PowerShell 追加了新命令), 此时不替换原文件.
+    """
+
+
+def scrub_file(
+    path: Path | str,
+    rules: Optional[list[re.Pattern]] = None,
+    dedupe="exact",
+    keep_last: Optional[int] = None,
+    bloom_capacity=1_000_000,
+    bloom_error_rate=1e-4,
+    continuation: Optional[str] = "`",
+    key: Optional[Callable[[str], str]] = None,
+    dry_run=False,
+) -> ScrubStats:
+    """
+    清理一个历史记录文件.
+
+    Params:
+        rules: 敏感信息规则, 匹配的命令被删除, 默认为 `load_rules()`.
+        dedupe: "exact": 按哈希去重, 保留最后一次出现的位置;
+            "bloom": 用固定大小的布隆过滤器去重, 保留第一次出现的位置,
+                不重复的命令超过 bloom_capacity 时在结果中标记 bloom_overflowed;
+            "none": 不去重.
+        keep_last: 只保留最后的 keep_last 条命令.
+        continuation: 续行符, 见 `scan`.
+        key: 去重前对命令的变换, 比如去掉时间戳, 为 None 时按原样比较.
+        dry_run: 只统计, 不修改文件.
+
+    Raises:
+        ConcurrentModification: 清理期间文件被修改.
+    """
+    if dedupe not in DEDUPE_MODES:
+        raise ValueError(f"Unknown dedupe mode: {dedupe}")
+    path = Path(path)
+    rules = load_rules() if rules is None else rules
+    before = path.stat()
+    stats = ScrubStats(str(path), bytes_in=before.st_size)
+
+    def new_bloom():
+        if dedupe == "bloom":
+            return BloomFilter(bloom_capacity, bloom_error_rate)
+        return None
+
+    def hashes(entries: list[str]) -> Iterator[int]:
+        return map(hash, entries if key is None else map(key, entries))
+
+    # 第一遍只在需要时进行: 找出每条命令最后一次出现的位置, 统计剩下的命令数.
+    # 换行符也参与比较, 因此文件末尾没有换行符的命令不会和前面相同的命令去重.
+    secret_indices = None  # 匹配规则的命令序号 (升序), 第二遍不必再匹配.
+    latest = {}  # 哈希 -> 最后一次出现的序号.
+    survivors = 0
+    if dedupe == "exact" or keep_last is not None:
+        secret_indices = []
+        bloom = new_bloom()
+        base = 0
+        for entries, hits in scan(path, rules, continuation):
+            secret_indices.extend(sorted(base + j for j in hits))
+            # 按不含敏感命令的区间批量处理, 尽量由内置函数完成逐条的操作.
+            for start, stop in _runs(len(entries), hits):
+                keys = hashes(entries[start:stop])
+                if dedupe == "exact":
+                    latest.update(zip(keys, range(base + start, base + stop)))
+                elif bloom is not None:
+                    survivors += bloom.add_many(keys).count(False)
+                else:
+                    survivors += stop - start
+            base += len(entries)
+        if dedupe == "exact":
+            survivors = len(latest)
+    skip = 0 if keep_last is None else max(survivors - keep_last, 0)
+
+    # 第二遍: 写出剩下的命令. 布隆过滤器按相同的顺序重新加入, 判断结果和第一遍一致.
+    bloom = new_bloom()
+    base = 0
+    writer = (
+        contextlib.nullcontext(_CountingWriter()) if dry_run else atomic_write(path)
+    )
+    with writer as w:
+        pass_rules = rules if secret_indices is None else None
+        for entries, hits in scan(path, pass_rules, continuation):
+            n = len(entries)
+            if secret_indices is not None:
+                lo = bisect.bisect_left(secret_indices, base)
+                hi = bisect.bisect_left(secret_indices, base + n)
+                hits = {i - base for i in secret_indices[lo:hi]}
+            if dedupe == "exact":
+                # latest 中只有不匹配规则的命令, 所以匹配规则的命令不会被保留.
+                positions = map(latest.get, hashes(entries))
+                keep = list(
+                    itertools.compress(
+                        entries, map(operator.eq, positions, itertools.count(base))
+                    )
+                )
+            elif bloom is not None:
+                keep = []
+                for start, stop in _runs(n, hits):
+                    run = entries[start:stop]
+                    present = bloom.add_many(hashes(run))
+                    keep.extend(itertools.compress(run, map(operator.not_, present)))
+            elif hits:
+                keep = [
+                    entry
+                    for start, stop in _runs(n, hits)
+                    for entry in entries[start:stop]
+                ]
+            else:
+                keep = entries
+            stats.entries_in += n
+            stats.secrets += len(hits)
+            stats.duplicates += n - len(hits) - len(keep)
+            if stats.trimmed < skip:
+                cut = min(skip - stats.trimmed, len(keep))
+                stats.trimmed += cut
+                keep = keep[cut:]
+            w.write("".join(keep))
+            stats.entries_out += len(keep)
+            base += n
+        # 此时读取的文件已经关闭 (Windows 上无法替换打开着的文件).
+        after = path.stat()
+        if (after.st_size, after.st_mtime_ns) != (before.st_size, before.st_mtime_ns):
+            raise ConcurrentModification(f"{path} was modified while scrubbing")
+    stats.bytes_out = w.bytes if dry_run else path.stat().st_size
+    stats.bloom_overflowed = bloom is not None and bloom.overflowed
+    return stats
@@ -2,13 +2,19 @@
 此脚本把剪贴板中的中文标点替换为英文的标点加一个空格.
 """
 
-import os
-from pathlib import Path
-import time
+import logging
 from typing import Optional
 
 import pyperclip
 
+from gadgets.log import setup_logging
+from gadgets.scheduler import Scheduler
+from gadgets.single_instance import SingleInstance
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.3  # 剪贴板轮询间隔 (秒).
+
 chPunc = "，《。》、？；：“”【】！￥（）—"
 enPunc = [
     ", ",
@@ -44,35 +50,43 @@ def hasChPunc(content: str) -> Optional[tuple[int, int]]:
     return None
 
 
-def wait_for_new_paste(interval=2):
-    origin = pyperclip.paste()
-    while True:
-        time.sleep(interval)
-        new = pyperclip.paste()
-        if new != origin:
-            break
-    return new
+def convert(content: str) -> str:
+    """
+    把中文标点替换为英文标点.
+    """
+    while (rst := hasChPunc(content)) is not None:
+        i, idx = rst
+        content = content.replace(chPunc[i], enPunc[i], 1)
+
+    for es, vl in extra_space.items():
+        content = content.replace(es, vl)
+    return content
 
 
 def main():
-    os.chdir(Path(__file__).parent)
-    first = True
-    while True:
-        if first:
-            rawContent = content = pyperclip.paste()
-        else:
-            rawContent = content = wait_for_new_paste(0.3)
-        first = False
-        if not content:
-            continue
-        print(f'Get Content: {{ "{content}" }}.')
-        while (rst := hasChPunc(content)) is not None:
-            i, idx = rst
-            content = content.replace(chPunc[i], enPunc[i], 1)
+    setup_logging("replace_punctuation_with_en")
+    last = None
 
-        for es, vl in extra_space.items():
-            content = content.replace(es, vl)
+    def poll():
+        nonlocal last
+        content = pyperclip.paste()
+        if content == last:
+            return
+        last = content
+        if not content:
+            return
+        logger.info(f'Get Content: {{ "{content}" }}.')
+        converted = convert(content)
+        if converted != content:
+            logger.info(f'Converted To: {{ "{converted}" }}.')
+            pyperclip.copy(converted)
+            last = converted
 
-        if content != rawContent:
-            print(f'Converted To: {{ "{content}" }}.')
-            pyperclip.copy(content)
+    scheduler = Scheduler()
+    scheduler.every(POLL_INTERVAL, poll, run_now=True)
+    with SingleInstance(
+        "repunct",
+        on_shutdown=scheduler.stop,
+        status=lambda: {"tasks": scheduler.stats()},
+    ):
+        scheduler.run()
@@ -0,0 +1,91 @@
+import sys
+
+import pytest
+
+from gadgets import stubs
+from gadgets.chord import ChordDetector, pynput_key_id
+
+
+@pytest.fixture(scope="module")
+def keyboard():
+    stubs.install()
+    return sys.modules["pynput.keyboard"]
+
+
+@pytest.fixture
+def chord(keyboard):
+    fired = []
+    detector = ChordDetector(
+        [(keyboard.Key.ctrl, keyboard.Key.ctrl_l, keyboard.Key.ctrl_r)],
+        ("[", "\x1b"),
+        lambda: fired.append(True),
+    )
+
+    def feed(events):
+        """
+        events: ("+" 或 "-", pynput 的按键).
+        """
+        for action, key in events:
+            if action == "+":
+                detector.press(pynput_key_id(key))
+            else:
+                detector.release(pynput_key_id(key))
+        return len(fired)
+
+    feed.detector = detector
+    return feed
+
+
+def test_pynput_key_id(keyboard):
+    assert pynput_key_id(keyboard.KeyCode.from_char("[")) == "["
+    assert pynput_key_id(keyboard.Key.ctrl_l) is keyboard.Key.ctrl_l
+    assert pynput_key_id(keyboard.KeyCode.from_vk(0x41)) is not None
+
+
+def test_ctrl_bracket_reported_as_escape(keyboard, chord):
+    Key, KeyCode = keyboard.Key, keyboard.KeyCode
+    # 按住 Ctrl 时 "[" 的按下事件为 "\x1b", 先松开 Ctrl 时释放事件为 "[".
+    events = [
+        ("+", Key.ctrl_l),
+        ("+", KeyCode.from_char("\x1b")),
+        ("-", Key.ctrl_l),
+        ("-", KeyCode.from_char("[")),
+    ]
+    assert chord(events) == 1
+    # 状态已清空, 下一次组合键可以再次触发.
+    assert chord(events) == 2
+    assert not chord.detector.active
+
+
+def test_auto_repeat_fires_once(keyboard, chord):
+    Key, KeyCode = keyboard.Key, keyboard.KeyCode
+    esc = KeyCode.from_char("\x1b")
+    events = [("+", Key.ctrl_l), ("+", Key.ctrl_l), *[("+", esc)] * 10]
+    assert chord(events) == 1
+    assert chord([("-", esc), ("+", esc)]) == 2
+
+
+def test_trigger_without_modifier(keyboard, chord):
+    assert chord([("+", keyboard.KeyCode.from_char("["))]) == 0
+
+
+def test_one_ctrl_released_while_other_held(keyboard, chord):
+    Key, KeyCode = keyboard.Key, keyboard.KeyCode
+    esc = KeyCode.from_char("\x1b")
+    assert chord([("+", Key.ctrl_l), ("+", Key.ctrl_r), ("-", Key.ctrl_l)]) == 0
+    assert chord.detector.active  # 右 Ctrl 仍然按着.
+    assert chord([("+", esc)]) == 1
+    assert chord([("-", esc), ("-", Key.ctrl_r)]) == 1
+    assert not chord.detector.active
+    assert chord([("+", esc)]) == 1
+
+
+def test_reset_after_lost_release(keyboard, chord):
+    Key, KeyCode = keyboard.Key, keyboard.KeyCode
+    esc = KeyCode.from_char("\x1b")
+    # 丢失了 Ctrl 的释放事件 (比如锁屏), 不 reset 时会误触发.
+    assert chord([("+", Key.ctrl_l), ("+", esc)]) == 1
+    chord.detector.reset()
+    assert not chord.detector.active
+    assert chord([("+", KeyCode.from_char("["))]) == 1
+    assert chord([("+", Key.ctrl_l), ("+", esc)]) == 2
@@ -0,0 +1,168 @@
+import random
+
+import pytest
+import requests
+from alibabacloud_tea_openapi.exceptions import (
+    ClientException,
+    ServerException,
+    ThrottlingException,
+)
+from darabonba.exceptions import RetryError, UnretryableException
+from darabonba.policy.retry import RetryPolicyContext
+
+from ali_ddns.client import (
+    CycleTimeout,
+    Deadline,
+    RetryPolicy,
+    call_with_retry,
+    is_retryable,
+)
+from gadgets.scheduler import ManualClock
+
+POLICY = RetryPolicy(attempts=4, base_delay=0.5, max_delay=8, jitter=0)
+
+
+def sdk_transport_error(inner: Exception) -> UnretryableException:
+    return UnretryableException(RetryPolicyContext(exception=inner))
+
+
+def http_error(status: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status}", response=response)
+
+
+class Flaky:
+    """
+    依次抛出 errors 中的异常, 之后返回 "ok". 每次调用耗时 cost 秒.
+    """
+
+    def __init__(self, clock: ManualClock, errors, cost=0.0):
+        self.clock = clock
+        self.errors = list(errors)
+        self.cost = cost
+        self.timeouts = []
+
+    def __call__(self, timeout: float):
+        self.timeouts.append(timeout)
+        self.clock.advance(self.cost)
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+@pytest.fixture
+def clock():
+    return ManualClock()
+
+
+class Sleeps(list):
+    pass
+
+
+@pytest.fixture
+def retry(clock):
+    sleeps = Sleeps()
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock.advance(seconds)
+
+    def call(func, deadline=None, timeout=5.0, policy=POLICY):
+        deadline = Deadline(None, clock) if deadline is None else deadline
+        return call_with_retry(func, timeout, deadline, policy, sleep)
+
+    call.sleeps = sleeps
+    return call
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        ClientException(status_code=400, code="InvalidParameter"),
+        ClientException(status_code=403, code="Forbidden.RAM"),
+        ClientException(status_code=404, code="DomainRecordNotBelongToUser"),
+        http_error(401),
+        sdk_transport_error(ValueError("bad url")),
+    ],
+)
+def test_client_errors_are_not_retried(clock, retry, error):
+    func = Flaky(clock, [error])
+    with pytest.raises(type(error)):
+        retry(func)
+    assert len(func.timeouts) == 1
+    assert retry.sleeps == []
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        ServerException(status_code=500, code="InternalError"),
+        ServerException(status_code=503, code="ServiceUnavailable"),
+        ClientException(status_code=429, code="TooManyRequests"),
+        ThrottlingException(status_code=400, code="Throttling.User"),
+        ClientException(status_code=400, code="Throttling"),
+        http_error(502),
+        requests.ConnectionError("reset"),
+        requests.Timeout("read timed out"),
+        sdk_transport_error(RetryError("connect timed out")),
+        sdk_transport_error(requests.ConnectionError("refused")),
+    ],
+)
+def test_transient_errors_are_retried(clock, retry, error):
+    func = Flaky(clock, [error, error])
+    assert retry(func) == "ok"
+    assert len(func.timeouts) == 3
+    assert retry.sleeps == [0.5, 1.0]  # 指数退避.
+
+
+def test_inner_exception_is_unwrapped():
+    assert is_retryable(sdk_transport_error(RetryError("timeout")))
+    assert not is_retryable(sdk_transport_error(KeyError("x")))
+    assert not is_retryable(CycleTimeout("deadline"))
+
+
+def test_attempts_exhausted_raises_last_error(clock, retry):
+    errors = [ServerException(status_code=503, code=str(i)) for i in range(4)]
+    func = Flaky(clock, errors)
+    with pytest.raises(ServerException) as info:
+        retry(func)
+    assert info.value.code == "3"
+    assert retry.sleeps == [0.5, 1.0, 2.0]
+
+
+def test_backoff_is_capped():
+    policy = RetryPolicy(base_delay=1, max_delay=4, jitter=0)
+    assert [policy.delay(i) for i in range(5)] == [1, 2, 4, 4, 4]
+    jittered = RetryPolicy(base_delay=1, max_delay=4, jitter=0.2)
+    rng = random.Random(0)
+    assert all(0.8 <= jittered.delay(0, rng) <= 1.2 for _ in range(100))
+
+
+def test_cycle_timeout_when_backoff_exceeds_remaining(clock, retry):
+    error = ServerException(status_code=503, code="ServiceUnavailable")
+    func = Flaky(clock, [error] * 4, cost=0.6)
+    deadline = Deadline(2.5, clock)
+    with pytest.raises(CycleTimeout) as info:
+        retry(func, deadline)
+    # 0.6 + 0.5 + 0.6 = 1.7 秒后剩余 0.8 秒, 不足下一次的 1.0 秒退避.
+    assert retry.sleeps == [0.5]
+    assert len(func.timeouts) == 2
+    assert info.value.__cause__ is error
+    assert not is_retryable(info.value)
+
+
+def test_timeout_is_capped_by_deadline(clock, retry):
+    error = requests.Timeout("slow")
+    func = Flaky(clock, [error], cost=2.0)
+    assert retry(func, Deadline(3.0, clock), timeout=5.0) == "ok"
+    assert func.timeouts == [3.0, pytest.approx(0.5)]
+
+
+def test_expired_deadline_raises_before_calling(clock, retry):
+    deadline = Deadline(1.0, clock)
+    clock.advance(1.0)
+    func = Flaky(clock, [])
+    with pytest.raises(CycleTimeout):
+        retry(func, deadline)
+    assert func.timeouts == []
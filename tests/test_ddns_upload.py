@@ -0,0 +1,39 @@
+import socket
+
+import toml
+
+from ali_ddns import upload
+from ali_ddns.client import CycleTimeout
+from gadgets import log, single_instance
+from gadgets.scheduler import Scheduler
+
+
+class OneCycleScheduler(Scheduler):
+    def run(self, until=None):
+        self.run_pending()
+
+
+class DownClient:
+    def public_ip(self, deadline):
+        raise CycleTimeout("No time left to retry public_ip")
+
+
+def test_failed_cycle_is_logged_to_file(tmp_path, monkeypatch):
+    config = tmp_path / "config.toml"
+    config.write_text(toml.dumps({"ROUTINE": 60}), encoding="utf-8")
+    monkeypatch.setattr(upload, "CONFIG_FILE", config)
+    monkeypatch.setattr(upload, "LOG_FILE", tmp_path / "ali_ddns.log")
+    monkeypatch.setattr(upload, "ERROR_FILE", tmp_path / "error.txt")
+    monkeypatch.setattr(upload, "create_client", lambda key_config: DownClient())
+    monkeypatch.setattr(upload, "Scheduler", OneCycleScheduler)
+    with socket.socket() as s:  # 不占用正在运行的 aliddns 的端口.
+        s.bind(("127.0.0.1", 0))
+        monkeypatch.setitem(single_instance.PORTS, "aliddns", s.getsockname()[1])
+    try:
+        upload.main()
+    finally:
+        log.shutdown()
+    text = (tmp_path / "ali_ddns.log").read_text(encoding="utf-8")
+    assert "failed (1 in a row)" in text
+    assert "CycleTimeout: No time left to retry public_ip" in text
+    assert "CycleTimeout" in (tmp_path / "error.txt").read_text(encoding="utf-8")
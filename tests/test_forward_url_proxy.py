@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from forward_url_proxy import forward_url_proxy as fup
+
+
+@pytest.fixture
+def client():
+    return fup.app.test_client()
+
+
+def read_ndjson(response) -> list[dict]:
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"urls": ["http://a"], "proxy": 123},
+        {"urls": [{"url": "http://a", "proxy": 123}]},
+        {"urls": [{"url": "http://a", "proxy": ["http://p"]}]},
+        {"urls": [{"url": 123}]},
+        {"urls": [123]},
+        {"urls": "http://a"},
+        [],
+    ],
+)
+def test_batch_rejects_invalid_input(client, data):
+    response = client.post("/batch", json=data)
+    assert response.status_code == 400
+
+
+def test_batch_unexpected_error_becomes_item_record(client, monkeypatch):
+    class Response:
+        status_code = 200
+        headers = {"Content-Type": "text/plain"}
+        text = "ok"
+
+    def fetch(url, proxy=None, **kwargs):
+        if url == "http://bad":
+            raise AttributeError("boom")
+        if url == "http://down":
+            raise requests.ConnectionError("refused")
+        return Response()
+
+    monkeypatch.setattr(fup, "fetch", fetch)
+    response = client.post(
+        "/batch", json={"urls": ["http://ok", "http://bad", "http://down"]}
+    )
+    assert response.status_code == 200
+    *items, done = read_ndjson(response)
+    assert done["done"] and done["count"] == 3
+    by_url = {item["url"]: item for item in items}
+    assert by_url["http://ok"]["body"] == "ok"
+    assert by_url["http://bad"]["status"] == 500
+    assert "AttributeError" in by_url["http://bad"]["error"]
+    assert by_url["http://down"]["status"] == 500
+
+
+def test_batch_unknown_pool(client):
+    response = client.post("/batch", json={"urls": ["http://a"], "proxy": "pool:nope"})
+    (item, done) = read_ndjson(response)
+    assert item["status"] == 400
+    assert done["count"] == 1
+
+
+class DelayedHandler(BaseHTTPRequestHandler):
+    """
+    `/<秒数>`: 等待指定的秒数后返回.
+    """
+
+    def do_GET(self):
+        delay = float(self.path.strip("/"))
+        time.sleep(delay)
+        body = f"slept {delay}".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DelayedHandler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_batch_streams_in_completion_order(client, upstream):
+    delays = [0.6, 0.0, 0.3, 0.45, 0.15]
+    start = time.perf_counter()
+    response = client.post(
+        "/batch",
+        json={"urls": [f"{upstream}/{delay}" for delay in delays]},
+        buffered=False,
+    )
+    lines = []
+    for chunk in response.response:
+        text = chunk.decode() if isinstance(chunk, bytes) else chunk
+        lines.extend(json.loads(line) for line in text.splitlines() if line)
+    elapsed = time.perf_counter() - start
+    response.close()
+
+    *items, done = lines
+    assert done["done"] and done["count"] == len(delays)
+    assert [item["index"] for item in items] == [1, 4, 2, 3, 0]
+    assert all(item["status"] == 200 for item in items)
+    assert items[-1]["body"] == "slept 0.6"
+    # 并发请求: 总耗时接近最慢的一个, 而不是所有延迟之和 (1.5 秒).
+    assert max(delays) <= elapsed < max(delays) + 0.5
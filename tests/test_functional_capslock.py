@@ -0,0 +1,54 @@
+import threading
+import types
+
+import pytest
+
+from functional_capslock.replay import WM_KEYDOWN, WM_KEYUP, load_functional_capslock
+from gadgets.stubs import VK_CAPSLOCK, FakeDesktopState, Suppressed
+
+VK_F12 = 0x7B
+
+
+@pytest.fixture
+def fc(tmp_path, monkeypatch):
+    module = load_functional_capslock(FakeDesktopState())
+    monkeypatch.setattr(module, "LATENCY_DUMP_FILE", tmp_path / "latency.json")
+    yield module
+    module.launcher.shutdown()
+
+
+def press(fc, vk, down=True) -> bool:
+    """
+    Returns:
+        按键是否被拦截.
+    """
+    data = types.SimpleNamespace(vkCode=vk, flags=0 if down else 1 << 7)
+    try:
+        fc.win32_event_filter(WM_KEYDOWN if down else WM_KEYUP, data)
+    except Suppressed:
+        return True
+    return False
+
+
+def test_f12_dumps_latency_off_the_hook_thread(fc, monkeypatch):
+    threads = []
+    dump = fc.latency.dump
+    monkeypatch.setattr(
+        fc.latency,
+        "dump",
+        lambda path: threads.append(threading.current_thread()) or dump(path),
+    )
+    assert press(fc, VK_CAPSLOCK)
+    assert press(fc, VK_F12)
+    fc.launcher.submit(lambda: None).result(5)  # 等待工作线程执行完之前的任务.
+    assert threads and threads[0] is not threading.current_thread()
+    assert fc.LATENCY_DUMP_FILE.exists()
+    # 按键松开事件也被拦截, Capslock 松开时不切换输入法.
+    assert press(fc, VK_F12, down=False)
+    assert press(fc, VK_CAPSLOCK, down=False)
+
+
+def test_keys_pass_through_without_capslock(fc):
+    assert not press(fc, VK_F12)
+    assert not press(fc, 0x48)  # h
+    assert not fc.LATENCY_DUMP_FILE.exists()
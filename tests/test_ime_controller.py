@@ -0,0 +1,144 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from ime_chinese_switching.controller import (
+    CHINESE,
+    ENGLISH,
+    AdaptiveInterval,
+    Event,
+    EventKind,
+    ImeController,
+    ImeMemory,
+    ImeState,
+    run,
+)
+
+
+class FakeBackend:
+    def __init__(self):
+        self.foreground = 1
+        self.methods = {1: ENGLISH, 2: ENGLISH}
+        self.modes = {1: 1, 2: 1}
+        self.calls = []
+
+    def foreground_window(self):
+        return self.foreground
+
+    def input_method(self, hwnd):
+        return self.methods.get(hwnd)
+
+    def input_mode(self, hwnd):
+        return self.modes.get(hwnd)
+
+    def set_input_method(self, hwnd, locale):
+        self.calls.append(("method", hwnd, locale))
+        self.methods[hwnd] = locale
+
+    def set_input_mode(self, hwnd, mode):
+        self.calls.append(("mode", hwnd, mode))
+        self.modes[hwnd] = mode
+
+    def is_window(self, hwnd):
+        return hwnd in self.methods
+
+    def process_id(self, hwnd):
+        return hwnd
+
+    def process_exists(self, pid):
+        return True
+
+
+def focus(controller, backend, hwnd):
+    backend.foreground = hwnd
+    controller.handle(Event(EventKind.FOREGROUND, hwnd))
+
+
+def test_restores_remembered_method_and_keeps_chinese_mode():
+    backend = FakeBackend()
+    controller = ImeController(backend, memory=ImeMemory(), settle_time=0)
+    # 窗口 1 切换为中文输入法.
+    backend.methods[1] = CHINESE
+    controller.handle(Event(EventKind.LANGUAGE, 1))
+    assert controller.memory.get(1) == ImeState(CHINESE)
+
+    focus(controller, backend, 2)
+    assert backend.methods[2] == ENGLISH
+    # 切换回窗口 1 时系统把输入模式改成了英文: 恢复中文输入法并改回中文模式.
+    backend.methods[1] = ENGLISH
+    backend.modes[1] = 0
+    backend.calls.clear()
+    focus(controller, backend, 1)
+    assert backend.calls == [("method", 1, CHINESE), ("mode", 1, 1)]
+
+
+def test_no_messages_when_state_matches():
+    backend = FakeBackend()
+    controller = ImeController(backend, memory=ImeMemory(), settle_time=0)
+    controller.handle(Event(EventKind.POLL))
+    focus(controller, backend, 2)
+    focus(controller, backend, 1)
+    assert backend.calls == []
+
+
+class RecordingController(ImeController):
+    def __init__(self, backend, interval: AdaptiveInterval):
+        super().__init__(backend, memory=ImeMemory(), settle_time=0)
+        self.interval = interval
+        self.handled = []  # (事件, 处理时的轮询间隔, 处理时间).
+
+    def handle(self, event):
+        self.handled.append((event.kind, self.interval.current, time.monotonic()))
+        return super().handle(event)
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_run_backs_off_wakes_on_escape_and_stops():
+    backend = FakeBackend()
+    backend.methods[1] = CHINESE
+    interval = AdaptiveInterval(minimum=0.01, maximum=5.0, factor=4.0)
+    controller = RecordingController(backend, interval)
+    events = queue.Queue()
+    thread = threading.Thread(target=run, args=(controller, events, interval))
+    thread.start()
+    try:
+        wait_until(lambda: len(controller.handled) >= 3)
+        # 空闲时每次轮询后间隔变长.
+        assert [h[:2] for h in controller.handled[:3]] == [
+            (EventKind.POLL, pytest.approx(0.04)),
+            (EventKind.POLL, pytest.approx(0.16)),
+            (EventKind.POLL, pytest.approx(0.64)),
+        ]
+        # 此时主循环最多等待 0.64 秒, 快捷键事件应该立即被处理, 并且间隔恢复为最小值.
+        sent = time.monotonic()
+        events.put(Event(EventKind.ESCAPE))
+        wait_until(lambda: controller.handled[-1][0] is EventKind.ESCAPE)
+        kind, current, handled_at = controller.handled[-1]
+        assert handled_at - sent < 0.3
+        assert current == 0.01
+        assert backend.methods[1] == ENGLISH
+    finally:
+        events.put(Event(EventKind.STOP))
+        thread.join(2)
+    assert not thread.is_alive()
+    assert controller.handled[-1][0] is EventKind.STOP
+
+
+def test_run_exits_when_tick_returns_true():
+    ticks = []
+    controller = ImeController(FakeBackend(), settle_time=0)
+    run(
+        controller,
+        queue.Queue(),
+        AdaptiveInterval(minimum=0.001, maximum=0.001),
+        tick=lambda: ticks.append(1) or len(ticks) == 3,
+    )
+    assert len(ticks) == 3
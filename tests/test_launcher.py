@@ -0,0 +1,43 @@
+from functional_capslock.launcher import App, ExecutableCache, Launcher
+
+
+class FixedCache(ExecutableCache):
+    def which(self, name):
+        return f"/opt/{name}"
+
+
+def make_launcher(focuser):
+    spawned = []
+    launcher = Launcher(
+        FixedCache(), spawner=lambda path, cwd: spawned.append(path), focuser=focuser
+    )
+    return launcher, spawned
+
+
+def test_focuser_error_falls_back_to_spawn(caplog):
+    def focuser(path):
+        raise RuntimeError("COM not initialized")
+
+    launcher, spawned = make_launcher(focuser)
+    record = launcher.launch(App(("app",), focus_existing=True)).result(5)
+    launcher.shutdown()
+    assert spawned == ["/opt/app"]
+    assert not record.focused
+    assert record.error is None
+    assert "Failed to focus" in caplog.text
+
+
+def test_focused_instance_is_not_spawned():
+    launcher, spawned = make_launcher(lambda path: True)
+    record = launcher.launch(App(("app",), focus_existing=True)).result(5)
+    launcher.shutdown()
+    assert spawned == []
+    assert record.focused
+
+
+def test_focuser_not_used_without_focus_existing():
+    launcher, spawned = make_launcher(lambda path: 1 / 0)
+    record = launcher.launch(App(("app",))).result(5)
+    launcher.shutdown()
+    assert spawned == ["/opt/app"]
+    assert record.error is None
@@ -0,0 +1,178 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from forward_url_proxy.pool import NoProxyAvailable, ProxyPool, load_pools
+from gadgets.scheduler import ManualClock
+
+TARGET = "http://upstream.invalid/page"
+
+
+class StandInProxy:
+    """
+    本地的 HTTP 代理替身: 对任何请求返回自己的名字, 可以设置延迟和故障.
+    """
+
+    def __init__(self, name: str, delay=0.0):
+        self.name = name
+        self.delay = delay
+        self.down = False  # 为 True 时返回 502, 就像代理无法访问上游.
+        self.requests = []
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self._respond(body=False)
+
+            def do_GET(self):
+                self._respond(body=True)
+
+            def _respond(self, body: bool):
+                proxy.requests.append(self.path)
+                time.sleep(proxy.delay)
+                data = proxy.name.encode()
+                self.send_response(502 if proxy.down else 200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def dead_proxy() -> str:
+    """
+    Returns:
+        没有监听的本地端口, 连接会被拒绝.
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+
+@pytest.fixture
+def proxies():
+    started = []
+
+    def start(name, delay=0.0):
+        proxy = StandInProxy(name, delay)
+        started.append(proxy)
+        return proxy
+
+    yield start
+    for proxy in started:
+        proxy.close()
+
+
+def make_pool(urls, **kwargs):
+    options = {"check_url": "http://check.invalid/204", "connect_timeout": 1.0}
+    options.update(kwargs)
+    return ProxyPool("test", urls, **options)
+
+
+def urls(states):
+    return [state.url for state in states]
+
+
+def test_health_check_orders_by_latency(proxies):
+    slow = proxies("slow", delay=0.2)
+    fast = proxies("fast")
+    dead = dead_proxy()
+    pool = make_pool([dead, slow.url, fast.url])
+    pool.check()
+    assert urls(pool.ranked()) == [fast.url, slow.url, dead]
+    stats = {s["url"]: s for s in pool.stats()}
+    assert not stats[dead]["healthy"] and stats[dead]["latency"] is None
+    assert stats[slow.url]["latency"] > stats[fast.url]["latency"]
+    assert fast.requests == ["http://check.invalid/204"]
+
+
+def test_ewma():
+    pool = make_pool(["http://a", "http://b"], alpha=0.5)
+    a, b = pool.states
+    pool.observe(a, 0.1)
+    pool.observe(b, 0.3)
+    assert urls(pool.ranked()) == ["http://a", "http://b"]
+    # 一次慢的结果不会立刻改变排名, 持续变慢才会.
+    pool.observe(a, 0.45)
+    assert a.latency == pytest.approx(0.275)
+    assert urls(pool.ranked()) == ["http://a", "http://b"]
+    pool.observe(a, 0.45)
+    assert urls(pool.ranked()) == ["http://b", "http://a"]
+
+
+def test_ejection_and_readmission(proxies):
+    first = proxies("first")
+    second = proxies("second", delay=0.05)
+    pool = make_pool([first.url, second.url])
+    pool.check()
+    assert urls(pool.ranked()) == [first.url, second.url]
+
+    first.down = True
+    pool.check()
+    pool.check()
+    state = pool.states[0]
+    assert not state.healthy and state.failures == 2
+    assert urls(pool.ranked()) == [second.url, first.url]
+    assert pool.get(TARGET).text == "second"
+
+    first.down = False
+    pool.check()
+    assert state.healthy and state.failures == 0
+    assert urls(pool.ranked()) == [first.url, second.url]
+    assert pool.get(TARGET).text == "first"
+
+
+def test_failover_to_next_proxy(proxies):
+    fast = proxies("fast")
+    dead = dead_proxy()
+    pool = make_pool([dead, fast.url])
+    # 还没有检查过, 按配置顺序先尝试已经不可用的代理.
+    response = pool.get(TARGET)
+    assert response.text == "fast"
+    assert fast.requests == [TARGET]
+    assert not pool.states[0].healthy
+    # 不健康的代理排到最后, 下次直接使用可用的代理.
+    assert urls(pool.ranked()) == [fast.url, dead]
+
+
+def test_no_proxy_available():
+    pool = make_pool([dead_proxy(), dead_proxy()])
+    with pytest.raises(NoProxyAvailable) as info:
+        pool.get(TARGET)
+    assert all(state.url in str(info.value) for state in pool.states)
+    assert all(not state.healthy for state in pool.states)
+
+
+def test_deadline_stops_failover():
+    clock = ManualClock()
+    pool = make_pool([dead_proxy(), dead_proxy()], deadline=0, clock=clock)
+    with pytest.raises(NoProxyAvailable, match="timeout"):
+        pool.get(TARGET)
+    assert all(state.healthy for state in pool.states)  # 没有尝试任何代理.
+
+
+def test_load_pools(tmp_path):
+    conf = tmp_path / "config.toml"
+    conf.write_text(
+        '[pools.main]\nproxies = ["http://127.0.0.1:1"]\ncheck_interval = 5\n',
+        encoding="utf-8",
+    )
+    pools = load_pools(conf)
+    assert list(pools) == ["main"]
+    assert pools["main"].check_interval == 5
+    assert load_pools(tmp_path / "missing.toml") == {}
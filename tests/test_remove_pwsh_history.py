@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from remove_pwsh_history.remove_pwsh_history import (
+    HistoryFile,
+    clean_file,
+    main,
+    strip_zsh_timestamp,
+)
+from remove_pwsh_history.scrub import load_rules
+
+
+def scrub(path, shell, dedupe="exact"):
+    options = {"rules": load_rules(), "dedupe": dedupe, "keep_last": None}
+    return clean_file(HistoryFile(path, shell), options)
+
+
+@pytest.mark.parametrize("dedupe", ["exact", "bloom"])
+def test_bash_backslash_is_not_continuation(tmp_path, dedupe):
+    # 每行都是独立的命令, 不能和下一行合并后一起删除或去重.
+    text = "echo a \\\nls\necho a \\\nls\n"
+    path = tmp_path / ".bash_history"
+    path.write_text(text, encoding="utf-8")
+    record = scrub(path, "bash", dedupe)
+    assert record["entries_in"] == 4
+    assert record["duplicates"] == 2
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 2
+
+
+def test_bash_secret_does_not_swallow_next_line(tmp_path):
+    path = tmp_path / ".bash_history"
+    path.write_text("export TOKEN=abc \\\nls\n", encoding="utf-8")
+    record = scrub(path, "bash")
+    assert record["secrets"] == 1
+    assert path.read_text(encoding="utf-8") == "ls\n"
+
+
+@pytest.mark.parametrize(
+    "entry, expected",
+    [
+        (": 1700000000:0;ls -la\n", "ls -la\n"),
+        (": 1700000000:12;echo a \\\nb\n", "echo a \\\nb\n"),
+        ("ls -la\n", "ls -la\n"),
+        ("echo ': 1:0;x'\n", "echo ': 1:0;x'\n"),
+    ],
+)
+def test_strip_zsh_timestamp(entry, expected):
+    assert strip_zsh_timestamp(entry) == expected
+
+
+@pytest.mark.parametrize("dedupe", ["exact", "bloom"])
+def test_zsh_dedupe_ignores_timestamps(tmp_path, dedupe):
+    path = tmp_path / ".zsh_history"
+    path.write_text(
+        ": 1700000000:0;git status\n"
+        ": 1700000005:0;echo a \\\nb\n"
+        ": 1700000010:1;git status\n"
+        ": 1700000020:0;echo a \\\nb\n",
+        encoding="utf-8",
+    )
+    record = scrub(path, "zsh", dedupe)
+    assert record["entries_in"] == 4
+    assert record["duplicates"] == 2
+    if dedupe == "exact":  # 保留最后一次出现, 即最新的时间戳.
+        assert path.read_text(encoding="utf-8") == (
+            ": 1700000010:1;git status\n: 1700000020:0;echo a \\\nb\n"
+        )
+
+
+def test_main_scrubs_shells_under_root(tmp_path, capsys):
+    (tmp_path / ".bash_history").write_text("ls\nls\n", encoding="utf-8")
+    (tmp_path / ".zsh_history").write_text(": 1:0;ls\n: 2:0;ls\n", encoding="utf-8")
+    main(["--root", str(tmp_path), "--shell", "bash,zsh", "--scrub", "--report", "-"])
+    report = json.loads(capsys.readouterr().out)
+    assert {r["shell"]: r["duplicates"] for r in report["files"]} == {
+        "bash": 1,
+        "zsh": 1,
+    }
+
+
+def test_main_warns_when_bloom_capacity_is_exceeded(tmp_path, capsys):
+    (tmp_path / ".bash_history").write_text(
+        "".join(f"echo {i}\n" for i in range(50)), encoding="utf-8"
+    )
+    args = ["--root", str(tmp_path), "--shell", "bash", "--scrub", "--dry-run"]
+    main([*args, "--dedupe", "bloom"])
+    assert "Warning" not in capsys.readouterr().err
+    main([*args, "--dedupe", "bloom", "--bloom-capacity", "10"])
+    assert "more distinct commands than --bloom-capacity" in capsys.readouterr().err
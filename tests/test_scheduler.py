@@ -0,0 +1,217 @@
+import random
+
+import pytest
+
+from gadgets import log
+from gadgets.log import setup_logging
+from gadgets.scheduler import ManualClock, Scheduler, Throttle
+
+
+@pytest.fixture
+def clock():
+    return ManualClock()
+
+
+@pytest.fixture
+def scheduler(clock):
+    return Scheduler(clock, random.Random(0))
+
+
+def advance(clock, scheduler, seconds, step=0.25):
+    """
+    逐步推进时钟, 每一步都执行到期的任务.
+    """
+    end = clock.now + seconds
+    while clock.now < end - 1e-9:
+        clock.advance(min(step, end - clock.now))
+        scheduler.run_pending()
+
+
+def test_periodic_does_not_drift(clock, scheduler):
+    runs = []
+
+    def slow():
+        runs.append(clock.now)
+        clock.advance(0.3)  # 执行耗时不影响下一次的到期时间.
+
+    scheduler.every(1, slow)
+    for _ in range(5):
+        clock.advance(1.0 - (clock.now % 1.0))
+        scheduler.run_pending()
+    assert runs == pytest.approx([1, 2, 3, 4, 5])
+
+
+def test_periodic_skips_missed_runs(clock, scheduler):
+    runs = []
+    scheduler.every(1, lambda: runs.append(clock.now))
+    clock.advance(5.5)
+    scheduler.run_pending()
+    assert runs == [5.5]  # 不补执行错过的次数.
+    assert scheduler.next_due() == 6.5  # 从现在开始计算下一次.
+
+
+def test_run_now(clock, scheduler):
+    runs = []
+    scheduler.every(10, lambda: runs.append(clock.now), run_now=True)
+    scheduler.run_pending()
+    assert runs == [0]
+
+
+def test_debounce_coalesces(clock, scheduler):
+    calls = []
+    paste = scheduler.debounce(
+        0.5, lambda *args: calls.append((clock.now, args)), name="paste"
+    )
+    for i in range(5):
+        paste(i)
+        advance(clock, scheduler, 0.25)
+    assert calls == []
+    advance(clock, scheduler, 0.5)
+    assert calls == [(1.5, (4,))]
+    assert scheduler.stats()["paste"]["runs"] == 1
+
+
+def test_debounce_cancel(clock, scheduler):
+    calls = []
+    paste = scheduler.debounce(0.5, calls.append)
+    paste(1)
+    paste.cancel()
+    advance(clock, scheduler, 1)
+    assert calls == []
+
+
+def test_throttle_trailing(clock, scheduler):
+    calls = []
+    throttled = scheduler.throttle(1, lambda x: calls.append((clock.now, x)))
+    throttled(1)  # 立即执行.
+    clock.advance(0.25)
+    throttled(2)
+    clock.advance(0.25)
+    throttled(3)  # 只补上最后一次.
+    advance(clock, scheduler, 1)
+    assert calls == [(0, 1), (1.0, 3)]
+    # 补上的调用也算作一次执行, 间隔从它开始计算.
+    assert clock.now == 1.5
+    clock.advance(0.25)
+    throttled(4)
+    assert len(calls) == 2
+    advance(clock, scheduler, 1)
+    assert calls[-1] == (2.0, 4)
+
+
+def test_throttle_without_scheduler_drops_calls(clock):
+    calls = []
+    throttled = Throttle(1, calls.append, clock)
+    throttled(1)
+    clock.advance(0.5)
+    assert throttled(2) is None
+    clock.advance(0.5)
+    throttled(3)
+    assert calls == [1, 3]
+    assert throttled.stats.runs == 2
+
+
+def test_backoff_doubles_and_resets(clock, scheduler):
+    outcomes = iter([False, False, False, False, True, False])
+    runs = []
+
+    def check():
+        runs.append(clock.now)
+        if not next(outcomes):
+            raise RuntimeError("down")
+
+    task = scheduler.every(1, check, max_backoff=5)
+    clock.advance(1)
+    for _ in range(5):
+        scheduler.run_pending()
+        clock.now = task.due
+    scheduler.run_pending()
+    delays = [b - a for a, b in zip(runs, runs[1:])]
+    # 失败后间隔为 2, 4, 5 (上限), 5; 成功后恢复为 1.
+    assert delays == pytest.approx([2, 4, 5, 5, 1])
+    assert task.stats.errors == 5
+    assert task.failures == 1
+
+
+def test_backoff_survives_long_outage(clock, scheduler):
+    def check():
+        raise RuntimeError("down")
+
+    task = scheduler.every(0.5, check, max_backoff=300)
+    task.failures = 2000
+    assert task.next_delay() == 300
+    clock.now = task.due
+    scheduler.run_pending()
+    assert task.failures == 2001
+    assert task.due == pytest.approx(clock.now + 300)
+
+
+def test_jitter_bounds(clock):
+    scheduler = Scheduler(clock, random.Random(42))
+    task = scheduler.every(10, lambda: None, jitter=0.1)
+    delays = [task.next_delay() for _ in range(1000)]
+    assert all(9.0 <= d <= 11.0 for d in delays)
+    assert max(delays) - min(delays) > 1.5  # 确实在浮动.
+
+    # 相同的种子得到相同的序列.
+    def sequence():
+        scheduler = Scheduler(ManualClock(), random.Random(7))
+        task = scheduler.every(10, lambda: None, jitter=0.1)
+        return [task.next_delay() for _ in range(10)]
+
+    assert sequence() == sequence()
+
+
+def test_jitter_applies_to_backoff(clock):
+    scheduler = Scheduler(clock, random.Random(1))
+    task = scheduler.every(1, lambda: None, jitter=0.2, max_backoff=8)
+    task.failures = 10
+    delays = [task.next_delay() for _ in range(200)]
+    assert all(8 * 0.8 <= d <= 8 * 1.2 for d in delays)
+
+
+def test_cancel_and_stats(clock, scheduler):
+    runs = []
+    task = scheduler.every(1, lambda: runs.append(1), name="tick")
+    scheduler.every(1, lambda: None, name="tick")
+    clock.advance(1)
+    scheduler.run_pending()
+    task.cancel()
+    clock.advance(1)
+    assert scheduler.run_pending() == pytest.approx(1)
+    assert runs == [1]
+    assert set(scheduler.stats()) == {"tick", "tick#2"}
+    assert scheduler.stats()["tick"]["runs"] == 1
+
+
+def test_one_shot_call_later(clock, scheduler):
+    calls = []
+    scheduler.call_later(2, calls.append, "x")
+    advance(clock, scheduler, 3)
+    assert calls == ["x"]
+    assert scheduler.next_due() is None
+    assert scheduler.stats() == {}
+
+
+def failing():
+    raise RuntimeError("upstream down")
+
+
+def test_task_errors_go_to_the_task_module_log(clock, scheduler, tmp_path):
+    # 日志文件只记录小工具自己的 logger, 任务的异常要记录在任务函数所在的模块下.
+    log_file = tmp_path / "gadget.log"
+    setup_logging(__name__, log_file, console=False)
+    try:
+        scheduler.every(1, failing, name="failing")
+        throttled = scheduler.throttle(1, failing)
+        with pytest.raises(RuntimeError):
+            throttled()  # 直接执行时异常抛给调用者.
+        throttled()  # 间隔结束时由调度器补上.
+        clock.advance(1)
+        scheduler.run_pending()
+    finally:
+        log.shutdown()
+    text = log_file.read_text(encoding="utf-8")
+    assert "Task failing failed (1 in a row)" in text
+    assert "failing:trailing failed" in text
+    assert "RuntimeError: upstream down" in text
@@ -0,0 +1,93 @@
+import pytest
+
+from functional_capslock.replay import replay, synthetic_trace
+from functional_capslock.scoring import Candidate, Layout, MruTracker, Rect, Snapshot
+from gadgets.stubs import VK_CAPSLOCK
+
+LAYOUT = Layout((Rect(0, 0, 1920, 1080),))
+
+
+class FixedScorer:
+    def __init__(self, scores):
+        self.scores = scores
+
+    def score(self, origin, cand, direction, layout):
+        return self.scores.get(cand.key)
+
+
+def make_snapshot(scores, mru=None, tie_epsilon=0.02):
+    keys = ["origin", *scores]
+    candidates = [Candidate(key, Rect(0, 0, 10, 10)) for key in keys]
+    return Snapshot(candidates, LAYOUT, FixedScorer(scores), mru, tie_epsilon)
+
+
+@pytest.mark.parametrize(
+    "scores, expected",
+    [
+        # 相差不到 tie_epsilon, 但四舍五入到不同的区间.
+        ({"a": 0.009, "b": 0.011}, ["b", "a"]),
+        # c 和 b 相近, 但和最高分相差超过 tie_epsilon, 不参与决胜.
+        ({"a": 0.0, "b": 0.015, "c": 0.03}, ["b", "a", "c"]),
+    ],
+)
+def test_ties_are_relative_to_best_score(scores, expected):
+    mru = MruTracker()
+    for key in reversed(["b", "c", "a"]):
+        mru.touch(key)  # b 最近使用.
+    assert make_snapshot(scores, mru).order("origin", "LEFT") == expected
+
+
+def test_tied_group_keeps_score_order_for_unranked():
+    scores = {"a": 0.001, "b": 0.0, "c": 0.5}
+    assert make_snapshot(scores).order("origin", "RIGHT") == ["b", "a", "c"]
+
+
+def test_tie_break_uses_current_mru():
+    mru = MruTracker()
+    mru.touch("a")
+    snapshot = make_snapshot({"a": 0.0, "b": 0.01}, mru)
+    assert snapshot.best("origin", "UP").key == "a"
+    mru.touch("b")
+    assert snapshot.best("origin", "UP").key == "b"
+
+
+def test_orders_are_computed_once_per_origin(monkeypatch):
+    calls = []
+    compute = Snapshot._compute
+    monkeypatch.setattr(
+        Snapshot,
+        "_compute",
+        lambda self, origin: calls.append(origin) or compute(self, origin),
+    )
+    mru = MruTracker()
+    snapshot = make_snapshot({"a": 0.0, "b": 0.01, "c": 0.5}, mru)
+    for key in ["a", "b", "c", "a", "origin", "b"]:
+        for direction in ("LEFT", "RIGHT", "UP", "DOWN"):
+            snapshot.order("origin", direction)
+        mru.touch(key)  # 每次切换都会改变最近使用顺序.
+    assert calls == ["origin"]
+
+
+def test_replay_burst_reuses_orders(monkeypatch):
+    computed = []
+    compute = Snapshot._compute
+    monkeypatch.setattr(
+        Snapshot,
+        "_compute",
+        lambda self, origin: (
+            computed.append((id(self), origin)) or compute(self, origin)
+        ),
+    )
+    report = replay(synthetic_trace(windows=12, presses=500, burst=5))
+    # 同一个快照中每个起点只计算一次 (computed 持有快照, id 不会被复用).
+    pairs = [(id(snapshot), origin) for snapshot, origin in computed]
+    assert len(pairs) == len(set(pairs))
+    assert len(pairs) < 500
+    assert report["enumerate"]["count"] == 100
+
+
+def test_synthetic_trace_releases_capslock_between_bursts():
+    trace = synthetic_trace(windows=4, presses=7, burst=3)
+    caps = [e["down"] for e in trace["events"] if e["vk"] == VK_CAPSLOCK]
+    assert caps == [True, False] * 3
+    assert len(trace["events"]) == 7 * 2 + 6
@@ -0,0 +1,106 @@
+import threading
+
+import pytest
+
+from remove_pwsh_history.scrub import BloomFilter, load_rules, scrub_file
+
+
+def write(tmp_path, text: str):
+    path = tmp_path / "ConsoleHost_history.txt"
+    path.write_text(text, encoding="utf-8", newline="")
+    return path
+
+
+def run_with_timeout(func, timeout=5.0):
+    rst = {}
+
+    def target():
+        rst["value"] = func()
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "scrub_file did not return"
+    return rst["value"]
+
+
+@pytest.mark.parametrize("dedupe", ["exact", "bloom", "none"])
+def test_trailing_continuation_at_eof(tmp_path, dedupe):
+    path = write(tmp_path, "echo a\necho b `\n")
+    stats = run_with_timeout(lambda: scrub_file(path, dedupe=dedupe))
+    assert stats.entries_in == 2
+    assert path.read_text(encoding="utf-8") == "echo a\necho b `\n"
+
+
+def test_trailing_continuation_secret_at_eof(tmp_path):
+    path = write(tmp_path, "echo a\n$password = 1 `\n")
+    stats = run_with_timeout(lambda: scrub_file(path))
+    assert stats.secrets == 1
+    assert path.read_text(encoding="utf-8") == "echo a\n"
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "npm run refresh-token\nls\n",
+        "Get-Secret\ndir\n",
+        "echo api_key\n= 1\n",
+        "echo $token\n= 1\n",
+    ],
+)
+def test_rules_do_not_cross_entries(tmp_path, text):
+    path = write(tmp_path, text)
+    stats = scrub_file(path, dedupe="none")
+    assert stats.secrets == 0
+    assert path.read_text(encoding="utf-8") == text
+
+
+def test_secret_after_cross_entry_match(tmp_path):
+    # 第一条命令的跨行匹配不能让紧随其后的真正的敏感命令被跳过.
+    path = write(tmp_path, "npm run refresh-token\n-token abc\nls\n")
+    stats = scrub_file(path, dedupe="none")
+    assert stats.secrets == 1
+    assert path.read_text(encoding="utf-8") == "npm run refresh-token\nls\n"
+
+
+def test_multiline_entry_secret(tmp_path):
+    path = write(tmp_path, "Invoke-Thing -Token `\n  abc\nls\n")
+    stats = scrub_file(path, dedupe="none")
+    assert stats.secrets == 1
+    assert path.read_text(encoding="utf-8") == "ls\n"
+
+
+def test_custom_rules_do_not_cross_entries(tmp_path):
+    rules_file = tmp_path / "rules.txt"
+    rules_file.write_text("deploy\\s+prod\n", encoding="utf-8")
+    rules = load_rules(rules_file, defaults=False)
+    path = write(tmp_path, "./deploy\nprod-status\n./deploy  prod\n")
+    stats = scrub_file(path, rules=rules, dedupe="none")
+    assert stats.secrets == 1
+    assert path.read_text(encoding="utf-8") == "./deploy\nprod-status\n"
+
+
+def test_bloom_filter_error_rate():
+    bloom = BloomFilter(capacity=20000, error_rate=1e-2)
+    assert bloom.add_many(hash(f"cmd {i}") for i in range(20000)).count(True) < 200
+    assert all(bloom.add_many(hash(f"cmd {i}") for i in range(20000)))
+    assert not bloom.overflowed
+    # 查询也会加入元素, 所以只查询少量新元素, 以免误判率随之升高.
+    false_positives = bloom.add_many(hash(f"other {i}") for i in range(2000))
+    assert false_positives.count(True) < 60
+    assert bloom.overflowed
+
+
+def test_bloom_dedupe_with_secrets_and_keep_last(tmp_path):
+    path = write(tmp_path, "ls\n$token = 1\nls\ncd a\n$token = 1\ncd b\ncd a\n")
+    stats = scrub_file(path, dedupe="bloom", keep_last=2)
+    assert (stats.secrets, stats.duplicates, stats.trimmed) == (2, 2, 1)
+    assert path.read_text(encoding="utf-8") == "cd a\ncd b\n"
+    assert not stats.bloom_overflowed
+
+
+def test_bloom_capacity_overflow_is_reported(tmp_path):
+    path = write(tmp_path, "".join(f"echo {i}\n" for i in range(100)))
+    assert not scrub_file(path, dedupe="bloom", dry_run=True).bloom_overflowed
+    stats = scrub_file(path, dedupe="bloom", bloom_capacity=10, dry_run=True)
+    assert stats.bloom_overflowed
@@ -0,0 +1,93 @@
+import os
+import socket
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from gadgets.single_instance import request
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+# 子进程: 持有单实例直到收到 shutdown / takeover, 已有实例时以状态码 3 退出.
+CHILD = textwrap.dedent(
+    """
+    import sys
+    from gadgets.single_instance import AlreadyRunning, SingleInstance
+
+    port, takeover, tag = int(sys.argv[1]), sys.argv[2] == "1", sys.argv[3]
+    try:
+        instance = SingleInstance(
+            "test", takeover=takeover, status=lambda: {"tag": tag}, port=port
+        )
+        with instance:
+            print("ready", flush=True)
+            instance.shutdown_requested.wait(30)
+    except AlreadyRunning:
+        sys.exit(3)
+    """
+)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def spawn():
+    children = []
+    env = {**os.environ, "PYTHONPATH": str(SRC)}
+
+    def start(port: int, tag: str, takeover=False) -> subprocess.Popen:
+        child = subprocess.Popen(
+            [sys.executable, "-c", CHILD, str(port), "1" if takeover else "0", tag],
+            env=env,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        children.append(child)
+        return child
+
+    yield start
+    for child in children:
+        if child.poll() is None:
+            child.kill()
+        child.wait()
+        child.stdout.close()
+
+
+def wait_ready(child: subprocess.Popen):
+    assert child.stdout.readline().strip() == "ready"
+
+
+def test_refuse_status_takeover_shutdown(spawn):
+    port = free_port()
+    assert request("test", "status", port=port) is None
+
+    first = spawn(port, "first")
+    wait_ready(first)
+    status = request("test", "status", port=port)
+    assert status["pid"] == first.pid
+    assert status["tag"] == "first"
+    assert status["name"] == "test"
+
+    # 不接管时拒绝启动, 已有实例不受影响.
+    refused = spawn(port, "refused")
+    assert refused.wait(10) == 3
+    assert request("test", "status", port=port)["pid"] == first.pid
+
+    # 接管: 旧实例退出, 新实例占用端口.
+    second = spawn(port, "second", takeover=True)
+    wait_ready(second)
+    assert first.wait(10) == 0
+    status = request("test", "status", port=port)
+    assert status["pid"] == second.pid
+    assert status["tag"] == "second"
+
+    assert request("test", "bogus", port=port) == {"error": "unknown command: bogus"}
+    assert request("test", "shutdown", port=port) == {"ok": True}
+    assert second.wait(10) == 0
+    assert request("test", "status", port=port) is None